@@ -82,6 +82,11 @@ class ThirdPartyEstimateAdmin(admin.ModelAdmin):
     pass
 
 
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ["filename", "status", "added", "duration", "requested_by"]
+    list_filter = ["status"]
+
+
 admin.site.register(models.Group, GroupAdmin)
 admin.site.register(models.MPC, MPCAdmin)
 admin.site.register(models.Person, PersonAdmin)
@@ -94,3 +99,4 @@ admin.site.register(models.WorkAssignment, WorkAssignmentAdmin)
 admin.site.register(models.BudgetItem, BudgetItemAdmin)
 admin.site.register(models.YearWeek, YearWeekAdmin)
 admin.site.register(models.ThirdPartyEstimate, ThirdPartyEstimateAdmin)
+admin.site.register(models.ExportJob, ExportJobAdmin)
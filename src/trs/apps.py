@@ -10,6 +10,10 @@ class TRSAppConfig(AppConfig):
 
     def ready(self):
         # Enable the signals
-        from trs.signal_handlers import create_person  # NOQA
+        from trs.signal_handlers import (  # NOQA
+            create_person,
+            subtract_deleted_booking,
+            year_weeks_changed,
+        )
 
         fix_dateinput.fix_it()
@@ -0,0 +1,178 @@
+"""Memcached with a small in-process LRU cache in front of it.
+
+Every page needs the same handful of cached results (``as_widget()`` of the
+popular persons and projects, ``to_book()``, the pycs) and every
+gunicorn worker fetches them from memcached over and over. ``TwoLevelCache``
+keeps the most recently used ones in the process itself (level 1) for a short
+while and only asks memcached (level 2) for the rest.
+
+Only the versioned keys are kept locally: ``Person.cache_key()``,
+``Project.cache_key()`` and the pyc keys contain the cache indicator, so a
+change means a new key and a stale local copy is never asked for. Everything
+else (locks, counters, the year/week calendar version) always goes to
+memcached. Configure it like::
+
+    CACHES = {
+        "default": {
+            "BACKEND": "trs.cache_backend.TwoLevelCache",
+            "LOCATION": MEMCACHE_ADDRESS,
+            "OPTIONS": {
+                "L2_BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+                "L1_MAX_ENTRIES": 1000,
+                "L1_TIMEOUT": 60,
+            },
+        }
+    }
+
+Hits per level end up in the per-request stats, see
+``trs.caching.count_levels()``.
+
+"""
+
+import collections
+import pickle
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.module_loading import import_string
+
+from trs import caching
+
+# Keys that change when their data changes, see Person/Project.cache_key().
+VERSIONED_KEY_PREFIXES = ("person-", "project-", "pycdata-")
+
+
+class TwoLevelCache(BaseCache):
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.get("OPTIONS", {}))
+        l2_backend = options.pop(
+            "L2_BACKEND", "django.core.cache.backends.memcached.PyMemcacheCache"
+        )
+        self.l1_max_entries = options.pop("L1_MAX_ENTRIES", 1000)
+        self.l1_timeout = options.pop("L1_TIMEOUT", 60)
+        self.l1_key_prefixes = tuple(
+            options.pop("L1_KEY_PREFIXES", VERSIONED_KEY_PREFIXES)
+        )
+        super().__init__(params)
+        params["OPTIONS"] = options
+        self.l2 = import_string(l2_backend)(location, params)
+        # Full key -> (expiry time, pickled value), least recently used first.
+        self._l1 = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _use_l1(self, key):
+        return key.startswith(self.l1_key_prefixes)
+
+    def _l1_get(self, key, version):
+        full_key = self.make_key(key, version)
+        with self._lock:
+            expiry_and_value = self._l1.get(full_key)
+            if expiry_and_value is None:
+                return None
+            expires, pickled = expiry_and_value
+            if expires < time.monotonic():
+                del self._l1[full_key]
+                return None
+            self._l1.move_to_end(full_key)
+        return pickle.loads(pickled)
+
+    def _l1_set(self, key, value, timeout, version):
+        if not self._use_l1(key):
+            return
+        timeout = self.l1_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        if timeout is None:
+            timeout = self.l1_timeout
+        timeout = min(timeout, self.l1_timeout)
+        full_key = self.make_key(key, version)
+        if timeout <= 0:
+            self._l1_delete(key, version)
+            return
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1[full_key] = (time.monotonic() + timeout, pickled)
+            self._l1.move_to_end(full_key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key, version):
+        with self._lock:
+            self._l1.pop(self.make_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        if self._use_l1(key):
+            value = self._l1_get(key, version)
+            if value is not None:
+                caching.count_levels(l1_hits=1)
+                return value
+        value = self.l2.get(key, version=version)
+        if value is None:
+            return default
+        caching.count_levels(l2_hits=1)
+        self._l1_set(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        result = {}
+        for key in keys:
+            if self._use_l1(key):
+                value = self._l1_get(key, version)
+                if value is not None:
+                    result[key] = value
+        to_fetch = [key for key in keys if key not in result]
+        found = self.l2.get_many(to_fetch, version=version) if to_fetch else {}
+        for key, value in found.items():
+            self._l1_set(key, value, DEFAULT_TIMEOUT, version)
+        caching.count_levels(l1_hits=len(result), l2_hits=len(found))
+        result.update(found)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout=timeout, version=version)
+        self._l1_set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout=timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._l1_set(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._l1_set(key, value, timeout, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(key, version)
+        return self.l2.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1_delete(key, version)
+        self.l2.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1_delete(key, version)
+        return self.l2.incr(key, delta=delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._l1_delete(key, version)
+        return self.l2.decr(key, delta=delta, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def clear(self):
+        # Note: only our own process' level 1 cache.
+        with self._lock:
+            self._l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
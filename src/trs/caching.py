@@ -0,0 +1,349 @@
+"""Batched access to the cache.
+
+The ``cache_until_*`` decorators in ``models.py`` and the person/year
+combinations in ``core.py`` each do their own ``cache.get()``. Fine for one
+object, but a list view with a hundred projects means hundreds of sequential
+round trips to memcached, even when everything is warm.
+
+``prefetch()`` grabs the cached method results for a whole page of objects
+with one ``get_many()``, calculates the misses and writes them back with one
+``set_many()``.
+
+Everything we get from or put into the cache is also remembered for the rest
+of the request (see ``request_scope()``, set up by
+``trs.middleware.CacheStatsMiddleware``): ``person.to_book()`` asking for
+``self.hours_per_week()`` three times or a template calling ``turnover()``,
+``overbooked()`` and so on (all from the same ``work_calculation()``) only
+costs one round trip. Management commands can use ``request_scope()``, too.
+Treat the remembered values as read-only, they're shared.
+
+When a busy project or person changes, everyone looking at it at that moment
+would re-calculate the same thing at the same time. ``get_or_calculate()``
+lets only one of them do it (a short-lived ``cache.add()`` lock per key). The
+others get the previous version of the value right away, or wait for the
+new one.
+
+We pickle the values ourselves and store the bytes (``Pickled``), so the
+value is serialized only once and we know its size for free. Big values (a pyc
+of someone with thousands of projects) are stored zlib compressed. Values that
+are still over memcached's 1 MB item limit would be silently dropped by
+memcached, so we don't even try: we log a warning instead. The stored sizes
+are counted per key family ("pycdata", "project-work_calculation"),
+``bin/django fill_cache`` reports them.
+
+The request scope also counts cache gets/sets/hits, the suppressed
+calculations and the time spent re-calculating (``timed()``),
+``trs.middleware.ServerTimingMiddleware`` reports them.
+
+"""
+
+import collections
+import contextlib
+import contextvars
+import logging
+import pickle
+import re
+import time
+import zlib
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Seconds. A crashed calculation shouldn't block the key for long.
+LOCK_TIMEOUT = 30
+# Seconds to wait for someone else's calculation before doing it ourselves.
+WAIT_TIMEOUT = 5
+POLL_INTERVAL = 0.05
+# Bytes. Pickled values above this are compressed.
+COMPRESS_THRESHOLD = 16 * 1024
+# Bytes. Memcached's default item size limit is 1 MB, including the key.
+MAX_ITEM_SIZE = 1000 * 1000
+# Ids and cache indicators in keys like "person-12-pc3-hours_per_week-800-6".
+KEY_NUMBERS = re.compile(r"-(pc)?\d+")
+
+_scope = contextvars.ContextVar("trs_cache_scope", default=None)
+
+
+class Pickled:
+    """A cached value as we pickled it, zlib-compressed if it is big
+
+    The cache backend pickles this wrapper again, but that's cheap for a
+    single bytes object. Pickling the value itself only happens once.
+    """
+
+    __slots__ = ["data", "compressed"]
+
+    def __init__(self, data, compressed=False):
+        self.data = data
+        self.compressed = compressed
+
+
+def key_family(key):
+    """Return key without the numbers, like "project-work_calculation"."""
+    return KEY_NUMBERS.sub("", key)
+
+
+def _pack(key, value):
+    """Return ``Pickled`` value to store or None if it is too big."""
+    packed = Pickled(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    if len(packed.data) > COMPRESS_THRESHOLD:
+        packed = Pickled(zlib.compress(packed.data), compressed=True)
+    size = len(packed.data)
+    scope = _scope.get()
+    if scope is not None:
+        family = key_family(key)
+        scope.stats[f"sets:{family}"] += 1
+        scope.stats[f"set_bytes:{family}"] += size
+        scope.stats["set_bytes"] += size
+    if size > MAX_ITEM_SIZE:
+        logger.warning("Not caching %s, %s bytes is too big for memcached", key, size)
+        _count_failed_sets(1)
+        return None
+    return packed
+
+
+def _unpack(value):
+    if not isinstance(value, Pickled):
+        # Not set by us, or missing.
+        return value
+    if value.compressed:
+        return pickle.loads(zlib.decompress(value.data))
+    return pickle.loads(value.data)
+
+
+def _count_failed_sets(num_failed):
+    scope = _scope.get()
+    if scope is not None:
+        scope.stats["failed_sets"] += num_failed
+
+
+class RequestScope:
+    def __init__(self):
+        # Cache key -> value, everything we got or set within the scope.
+        self.values = {}
+        self.stats = collections.Counter()
+        # Names of the timed() blocks we're in.
+        self.timing = []
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Add the time spent within the block to the ``<name>_time`` counter.
+
+    Nested blocks with the same name (a calculation that needs another
+    calculation) are only counted once.
+    """
+    scope = _scope.get()
+    if scope is None or name in scope.timing:
+        yield
+        return
+    scope.timing.append(name)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        scope.timing.remove(name)
+        scope.stats[f"{name}_time"] += time.perf_counter() - start_time
+
+
+@contextlib.contextmanager
+def request_scope():
+    """Remember cached values (and round trip counters) within the block."""
+    token = _scope.set(RequestScope())
+    try:
+        yield _scope.get()
+    finally:
+        _scope.reset(token)
+
+
+def stats():
+    """Return the round trip counters of the current request scope."""
+    scope = _scope.get()
+    if scope is None:
+        return collections.Counter()
+    return scope.stats
+
+
+def _count(round_trips, keys, operation):
+    scope = _scope.get()
+    if scope is None:
+        return
+    scope.stats["round_trips"] += round_trips
+    scope.stats["round_trips_saved"] += keys - round_trips
+    scope.stats[operation] += keys
+
+
+def count_results(hits, misses):
+    """Record how many values were found in the cache."""
+    scope = _scope.get()
+    if scope is None:
+        return
+    scope.stats["hits"] += hits
+    scope.stats["misses"] += misses
+
+
+def count_levels(l1_hits=0, l2_hits=0):
+    """Record where found values came from, see ``trs.cache_backend``."""
+    scope = _scope.get()
+    if scope is None:
+        return
+    scope.stats["l1_hits"] += l1_hits
+    scope.stats["l2_hits"] += l2_hits
+
+
+def get(key):
+    """Return cached value, remembered ones don't need a round trip."""
+    scope = _scope.get()
+    if scope is not None and key in scope.values:
+        _count(0, 1, "gets")
+        scope.stats["memo_hits"] += 1
+        count_results(1, 0)
+        return scope.values[key]
+    _count(1, 1, "gets")
+    result = _unpack(cache.get(key))
+    if result is None:
+        count_results(0, 1)
+    else:
+        count_results(1, 0)
+        if scope is not None:
+            scope.values[key] = result
+    return result
+
+
+def set(key, value):
+    packed = _pack(key, value)
+    if packed is not None:
+        _count(1, 1, "sets")
+        cache.set(key, packed)
+    scope = _scope.get()
+    if scope is not None:
+        scope.values[key] = value
+
+
+def get_or_calculate(key, calculate, previous_key=None, timer="recalculation"):
+    """Return cached value, calculate it (only once at a time) when missing.
+
+    Only the one that gets the lock calculates. The others return the value
+    of ``previous_key`` (the same thing before the last change) if it is still
+    in the cache, or wait for the calculation to finish. If it takes too
+    long, they calculate it themselves after all.
+
+    """
+    result = get(key)
+    if result is not None:
+        return result
+    lock_key = f"lock-{key}"
+    locked = cache.add(lock_key, True, LOCK_TIMEOUT)
+    if not locked:
+        result = _wait_for(key, lock_key, previous_key)
+        if result is not None:
+            return result
+    try:
+        with timed(timer):
+            result = calculate()
+        set(key, result)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return result
+
+
+def _wait_for(key, lock_key, previous_key):
+    """Return what someone else calculated (or its previous version)"""
+    scope = _scope.get()
+    previous = _unpack(cache.get(previous_key)) if previous_key else None
+    if previous is not None:
+        if scope is not None:
+            scope.stats["suppressed_calculations"] += 1
+            scope.stats["stale_values"] += 1
+        return previous
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        result = _unpack(cache.get(key))
+        if result is not None:
+            if scope is not None:
+                scope.stats["suppressed_calculations"] += 1
+                scope.values[key] = result
+            return result
+        if not cache.get(lock_key):
+            # Finished without result (an error, probably).
+            break
+    logger.warning("Waited in vain for %s, calculating it ourselves", key)
+    return None
+
+
+def get_many(keys):
+    """Return dict with the found keys, in (at most) one round trip."""
+    keys = list(keys)
+    scope = _scope.get()
+    result = {}
+    if scope is not None:
+        result = {key: scope.values[key] for key in keys if key in scope.values}
+        scope.stats["memo_hits"] += len(result)
+    to_fetch = [key for key in keys if key not in result]
+    if not to_fetch:
+        _count(0, len(keys), "gets")
+        return result
+    _count(1, len(keys), "gets")
+    found = {key: _unpack(value) for key, value in cache.get_many(to_fetch).items()}
+    if scope is not None:
+        scope.values.update(found)
+    result.update(found)
+    return result
+
+
+def set_many(values):
+    if not values:
+        return
+    packed = {key: _pack(key, value) for key, value in values.items()}
+    packed = {key: value for key, value in packed.items() if value is not None}
+    if packed:
+        _count(1, len(packed), "sets")
+        failed = cache.set_many(packed)
+        if failed:
+            logger.warning("Failed to cache %s values, like %s", len(failed), failed[0])
+            _count_failed_sets(len(failed))
+    scope = _scope.get()
+    if scope is not None:
+        scope.values.update(values)
+
+
+def prefetch(objects, *method_names):
+    """Fetch the cached results of the methods for all objects at once.
+
+    The methods must be decorated with one of the ``cache_until_*``
+    decorators from ``models.py``: those provide ``cache_key_for()`` and
+    ``uncached()``. Misses are calculated and written back in one go. If the
+    class has a ``bulk_<method name>()`` classmethod (returning a dict keyed
+    by id), that one is used to calculate all the misses at once.
+
+    """
+    wanted = {}
+    for obj in objects:
+        for method_name in method_names:
+            method = getattr(type(obj), method_name)
+            wanted[method.cache_key_for(obj)] = (obj, method_name)
+    found = get_many(wanted.keys())
+    missing = {}
+    to_calculate = collections.defaultdict(dict)
+    for key, (obj, method_name) in wanted.items():
+        if found.get(key) is None:
+            to_calculate[(type(obj), method_name)][key] = obj
+    with timed("recalculation"):
+        for (klass, method_name), objs in to_calculate.items():
+            bulk_method = getattr(klass, f"bulk_{method_name}", None)
+            if bulk_method is not None:
+                per_id = bulk_method(objs.values())
+                missing.update({key: per_id[obj.id] for key, obj in objs.items()})
+            else:
+                method = getattr(klass, method_name)
+                missing.update({key: method.uncached(obj) for key, obj in objs.items()})
+    set_many(missing)
+    count_results(len(wanted) - len(missing), len(missing))
+    logger.debug(
+        "Prefetched %s cached results, %s had to be calculated",
+        len(wanted),
+        len(missing),
+    )
@@ -1,19 +1,42 @@
 # Calculation core around the models.
 import datetime
+import itertools
 import logging
 import time
+from collections import defaultdict
 
-from django.core.cache import cache
 from django.db import models
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.db.models.functions import ExtractMonth, ExtractYear
 from django.utils.functional import cached_property
 
-from trs.models import Booking, WorkAssignment, YearWeek
+from trs import caching
+from trs.models import (
+    BookingRollup,
+    BudgetItem,
+    Invoice,
+    Payable,
+    PersonChange,
+    Project,
+    WorkAssignment,
+    booked_hours,
+    this_year_week,
+    to_book_summary,
+    year_week_calendar,
+)
 
 logger = logging.getLogger(__name__)
 
 ALL = "ALL"
 
 
+def external_percentage(internal, external):
+    """Return percentage of external hours (100 if nothing has been booked)."""
+    if not internal + external:  # Division by zero
+        return 100
+    return round(100 * external / (internal + external))
+
+
 class PersonYearCombination:
     PYC_KEYS = [
         "target",
@@ -40,25 +63,57 @@ class PersonYearCombination:
         # ^^^ Unbooked hours (up till last week if in the current year, per
         # year if not).
     ]
+    # The numbers per project, cached as one (project id, *numbers) row per
+    # project instead of a dict per project: long-tenured persons have
+    # thousands of projects.
+    PER_PROJECT_KEYS = [
+        "booked",
+        "overbooked",
+        "overbooked_external",
+        "well_booked",
+        "left_to_book_external",
+        "turnover",
+        "loss",
+        "left_to_turn_over",
+        "booked_internal",
+        "booked_external",
+    ]
 
-    def __init__(self, person, year=None):
+    def __init__(self, person, year=None, calculate=True):
         self.person = person
         self.current_year = datetime.date.today().year
         if year is None:
             year = self.current_year
         self.year = int(year)
-        cache_version = 38
+        cache_version = 39
         self.cache_key = (
             f"pycdata-{person.id}-{person.cache_indicator}-{year}-{cache_version}"
         )
-        has_cached_data = self.get_cache()
-        if not has_cached_data:
-            self.just_calculate_everything()
-            self.set_cache()
+        # Served to others while we re-calculate after a change.
+        self.previous_cache_key = (
+            f"pycdata-{person.id}-{person.cache_indicator - 1}-{year}-{cache_version}"
+        )
+        if not calculate:
+            # bulk_pyc() fills us in itself.
+            return
+        self.load_cache_data(
+            caching.get_or_calculate(
+                self.cache_key,
+                self.calculate,
+                previous_key=self.previous_cache_key,
+                timer="pyc",
+            )
+        )
+
+    def calculate(self):
+        """Return freshly calculated cache data"""
+        self.just_calculate_everything()
+        return self.cache_data()
 
     def just_calculate_everything(self):
         start_time = time.time()
-        last_year_week = YearWeek.objects.filter(year=self.year).last()
+        year_weeks = year_week_calendar().for_year(self.year)
+        last_year_week = year_weeks[-1] if year_weeks else None
         self.target = self.person.target(year_week=last_year_week)
         self.calc_target_and_overbookings()
         self.billable_percentage = self.calc_external_percentage()
@@ -66,31 +121,23 @@ class PersonYearCombination:
         if self.year == self.current_year:
             self.to_book = self.person.to_book()
         else:
-            # Mimick the 'interface'
-            hours_to_book = self.to_book_this_year - self.all_booked_hours
-            days_to_book = round(hours_to_book / 8)
-            friendly = f"{days_to_book} dagen"
-            if days_to_book > 5:
-                klass = "danger"
-            elif days_to_book > 1:
-                klass = "warning"
-            else:
-                klass = "success"
-                friendly = 0
-            self.to_book = {
-                "hours": hours_to_book,
-                "klass": klass,
-                "friendly": friendly,
-            }
+            self.to_book = self.calc_to_book_for_whole_year()
 
         elapsed = time.time() - start_time
         logger.debug(
             "Re-calculated person/year info for %s in %s secs", self.person, elapsed
         )
 
-    def set_cache(self):
+    def cache_data(self):
         result = {key: getattr(self, key) for key in self.PYC_KEYS}
-        cache.set(self.cache_key, result)
+        result["per_project"] = [
+            (id, *[info[key] for key in self.PER_PROJECT_KEYS])
+            for id, info in self.per_project.items()
+        ]
+        return result
+
+    def set_cache(self):
+        caching.set(self.cache_key, self.cache_data())
         logger.debug(
             "Cached NEW pyc data for %s (%s) , %s",
             self.person,
@@ -99,13 +146,37 @@ class PersonYearCombination:
         )
 
     def get_cache(self):
-        result = cache.get(self.cache_key)
+        return self.load_cache_data(caching.get(self.cache_key))
+
+    def load_cache_data(self, result):
         if not result:
             return False
         for key in self.PYC_KEYS:
             setattr(self, key, result[key])
+        self.per_project = {
+            row[0]: dict(zip(self.PER_PROJECT_KEYS, row[1:]))
+            for row in result["per_project"]
+        }
         return True
 
+    def calc_to_book_for_whole_year(self):
+        # Mimick the 'interface' of person.to_book()
+        hours_to_book = self.to_book_this_year - self.all_booked_hours
+        days_to_book = round(hours_to_book / 8)
+        friendly = f"{days_to_book} dagen"
+        if days_to_book > 5:
+            klass = "danger"
+        elif days_to_book > 1:
+            klass = "warning"
+        else:
+            klass = "success"
+            friendly = 0
+        return {
+            "hours": hours_to_book,
+            "klass": klass,
+            "friendly": friendly,
+        }
+
     def calc_target_and_overbookings(self):
         budget_per_project = (
             WorkAssignment.objects.filter(
@@ -133,9 +204,9 @@ class PersonYearCombination:
         project_ids = budget.keys()
 
         booked_this_year_per_project = (
-            Booking.objects.filter(
+            booked_hours(
                 booked_by=self.person,
-                year_week__year=self.year,
+                year=self.year,
                 booked_on__hourless=False,
             )
             .values("booked_on")
@@ -147,9 +218,9 @@ class PersonYearCombination:
         }
 
         booked_up_to_this_year_per_project = (
-            Booking.objects.filter(
+            booked_hours(
                 booked_by=self.person,
-                year_week__year__lt=self.year,
+                year__lt=self.year,
                 booked_on__in=project_ids,
             )
             .values("booked_on")
@@ -160,6 +231,53 @@ class PersonYearCombination:
             for item in booked_up_to_this_year_per_project
         }
 
+        self.per_project = self.calc_per_project(
+            project_ids,
+            budget,
+            hourly_tariff,
+            is_internal,
+            booked_this_year,
+            booked_before_this_year,
+        )
+
+        # year-based person.to_work_up_till_now() implementation.
+        hours_per_week = (
+            self.person.person_changes.filter(year_week__year__lt=self.year).aggregate(
+                models.Sum("hours_per_week")
+            )["hours_per_week__sum"]
+            or 0
+        )
+        changes_this_year = (
+            self.person.person_changes.filter(year_week__year=self.year)
+            .values("year_week__week")
+            .annotate(models.Sum("hours_per_week"))
+        )
+        changes_per_week = {
+            change["year_week__week"]: (change["hours_per_week__sum"])
+            for change in changes_this_year
+        }
+        year_weeks = year_week_calendar().for_year(self.year)
+        all_booked_hours = (
+            booked_hours(booked_by=self.person, year=self.year).aggregate(
+                models.Sum("hours")
+            )["hours__sum"]
+            or 0
+        )
+        self.calc_totals(hours_per_week, changes_per_week, year_weeks, all_booked_hours)
+
+    def calc_per_project(
+        self,
+        project_ids,
+        budget,
+        hourly_tariff,
+        is_internal,
+        booked_this_year,
+        booked_before_this_year,
+    ):
+        """Return per-project info from the budget and booking dicts.
+
+        The dicts are all keyed by project id.
+        """
         per_project = {}
         for id in project_ids:
             booked = booked_this_year.get(id, 0)
@@ -199,40 +317,26 @@ class PersonYearCombination:
                 "booked_external": booked_external,
             }
             per_project[id] = project_info
+        return per_project
 
-        # year-based person.to_work_up_till_now() implementation.
-        hours_per_week = (
-            self.person.person_changes.filter(year_week__year__lt=self.year).aggregate(
-                models.Sum("hours_per_week")
-            )["hours_per_week__sum"]
-            or 0
-        )
-        changes_this_year = (
-            self.person.person_changes.filter(year_week__year=self.year)
-            .values("year_week__week")
-            .annotate(models.Sum("hours_per_week"))
-        )
-        changes_per_week = {
-            change["year_week__week"]: (change["hours_per_week__sum"])
-            for change in changes_this_year
-        }
-        year_weeks = YearWeek.objects.filter(year=self.year).values(
-            "week", "num_days_missing"
-        )
-        week_numbers = [year_week["week"] for year_week in year_weeks]
-        missing_days = sum([year_week["num_days_missing"] for year_week in year_weeks])
+    def calc_totals(
+        self, hours_per_week, changes_per_week, year_weeks, all_booked_hours
+    ):
+        """Calculate the totals from self.per_project and the person changes.
+
+        ``hours_per_week`` is the amount at the start of the year,
+        ``changes_per_week`` has the changes during the year per week number.
+        """
+        per_project = self.per_project
+        week_numbers = [year_week.week for year_week in year_weeks]
+        missing_days = sum([year_week.num_days_missing for year_week in year_weeks])
         self.to_book_this_year = 0
         for week in week_numbers:
             if week in changes_per_week:
                 hours_per_week += changes_per_week[week]
             self.to_book_this_year += hours_per_week
         self.to_book_this_year -= missing_days * 8
-        self.all_booked_hours = (
-            self.person.bookings.filter(year_week__year=self.year).aggregate(
-                models.Sum("hours")
-            )["hours__sum"]
-            or 0
-        )
+        self.all_booked_hours = all_booked_hours
         # ^^^ self.all_booked_hours *includes* the 'hourless' projects that
         # are filtered out in the rest of this calculation.
         if self.to_book_this_year:
@@ -277,15 +381,14 @@ class PersonYearCombination:
 
         self.overbooked_percentage = overbooked_percentage
         self.well_booked_percentage = well_booked_percentage
-        self.per_project = per_project
 
     def calc_external_percentage(self):
         """Return percentage hours booked this year on external projects."""
         query_result = (
-            Booking.objects.filter(
+            booked_hours(
                 booked_by=self.person,
                 booked_on__hourless=False,
-                year_week__year=self.year,
+                year=self.year,
             )
             .values("booked_on__internal")
             .annotate(models.Sum("hours"))
@@ -297,9 +400,7 @@ class PersonYearCombination:
                 internal = result["hours__sum"]
             else:
                 external = result["hours__sum"]
-        if not internal + external:  # Division by zero
-            return 100
-        return round(100 * external / (internal + external))
+        return external_percentage(internal, external)
 
     @cached_property
     def target_percentage(self):
@@ -334,3 +435,377 @@ class PersonYearCombination:
 
 def get_pyc(person, year=None):
     return PersonYearCombination(person, year)
+
+
+def bulk_pyc(persons, year=None):
+    """Return PersonYearCombinations for a whole list of persons at once.
+
+    The result is a ``{person.id: pyc}`` dict in the order of ``persons``.
+    Cached pycs are fetched with one ``get_many()``, the rest is calculated
+    with a fixed number of grouped queries instead of the ~8 queries per
+    person that ``get_pyc()`` needs and written back with one ``set_many()``.
+
+    """
+    pycs = {
+        person.id: PersonYearCombination(person, year, calculate=False)
+        for person in persons
+    }
+    cached = caching.get_many(pyc.cache_key for pyc in pycs.values())
+    missing = [
+        pyc
+        for pyc in pycs.values()
+        if not pyc.load_cache_data(cached.get(pyc.cache_key))
+    ]
+    caching.count_results(len(pycs) - len(missing), len(missing))
+    if missing:
+        with caching.timed("pyc"):
+            _bulk_calculate(missing)
+        caching.set_many({pyc.cache_key: pyc.cache_data() for pyc in missing})
+    return pycs
+
+
+def _bulk_calculate(pycs):
+    """Fill in the PYC_KEYS of all pycs (which must share the same year)."""
+    start_time = time.time()
+    year = pycs[0].year
+    person_ids = [pyc.person.id for pyc in pycs]
+
+    year_weeks = year_week_calendar().for_year(year)
+    last_year_week_id = year_weeks and year_weeks[-1].id or this_year_week().id
+    current_year_week = this_year_week()
+    # The current year's to_book is calculated like person.to_book(), for
+    # that we need a couple of extra numbers.
+    current_week = None
+    if year == pycs[0].current_year and current_year_week.year == year:
+        current_week = current_year_week.week
+
+    # Person changes. Target like person.target(), the rest is needed for the
+    # to_work_up_till_now() and hours_per_week() equivalents.
+    person_change_sums = (
+        PersonChange.objects.filter(person__in=person_ids)
+        .values("person")
+        .annotate(
+            target=models.Sum("target", filter=Q(year_week__lte=last_year_week_id)),
+            hours_per_week_before=models.Sum(
+                "hours_per_week", filter=Q(year_week__year__lt=year)
+            ),
+            hours_per_week_now=models.Sum(
+                "hours_per_week", filter=Q(year_week__lte=current_year_week.id)
+            ),
+        )
+    )
+    person_changes = {item["person"]: item for item in person_change_sums}
+    changes_this_year = (
+        PersonChange.objects.filter(person__in=person_ids, year_week__year=year)
+        .values("person", "year_week__week")
+        .annotate(models.Sum("hours_per_week"))
+    )
+    changes_per_week = defaultdict(dict)
+    for change in changes_this_year:
+        changes_per_week[change["person"]][change["year_week__week"]] = change[
+            "hours_per_week__sum"
+        ]
+
+    # Budgets
+    work_assignments = WorkAssignment.objects.filter(
+        assigned_to__in=person_ids,
+        assigned_on__start__year__lte=year,
+        assigned_on__end__year__gte=year,
+        assigned_on__hourless=False,
+    )
+    budget_per_person_per_project = work_assignments.values(
+        "assigned_to", "assigned_on", "assigned_on__internal"
+    ).annotate(models.Sum("hours"), models.Sum("hourly_tariff"))
+    budget = defaultdict(dict)
+    hourly_tariff = defaultdict(dict)
+    is_internal = defaultdict(dict)
+    for item in budget_per_person_per_project:
+        person_id = item["assigned_to"]
+        project_id = item["assigned_on"]
+        budget[person_id][project_id] = item["hours__sum"] or 0
+        hourly_tariff[person_id][project_id] = item["hourly_tariff__sum"] or 0
+        is_internal[person_id][project_id] = item["assigned_on__internal"]
+
+    # Bookings. Note: the per-project bookings include the 'hourless' projects
+    # (and bookings without project), we need them for all_booked_hours.
+    booked_this_year_per_person_per_project = (
+        booked_hours(booked_by__in=person_ids, year=year)
+        .values("booked_by", "booked_on", "booked_on__internal", "booked_on__hourless")
+        .annotate(models.Sum("hours"))
+    )
+    booked_this_year = defaultdict(dict)
+    all_booked_hours = defaultdict(int)
+    internal_hours = defaultdict(int)
+    external_hours = defaultdict(int)
+    for item in booked_this_year_per_person_per_project:
+        person_id = item["booked_by"]
+        all_booked_hours[person_id] += item["hours__sum"]
+        if item["booked_on__hourless"] is not False:
+            # Hourless project or no project at all.
+            continue
+        booked_this_year[person_id][item["booked_on"]] = item["hours__sum"]
+        if item["booked_on__internal"]:
+            internal_hours[person_id] += item["hours__sum"]
+        else:
+            external_hours[person_id] += item["hours__sum"]
+
+    booked_before_this_year_per_person_per_project = (
+        booked_hours(
+            booked_by__in=person_ids,
+            year__lt=year,
+            booked_on__in=work_assignments.values("assigned_on"),
+        )
+        .values("booked_by", "booked_on")
+        .annotate(models.Sum("hours"))
+    )
+    booked_before_this_year = defaultdict(dict)
+    for item in booked_before_this_year_per_person_per_project:
+        if item["booked_on"] not in budget[item["booked_by"]]:
+            # Project is in someone else's budget, not in ours.
+            continue
+        booked_before_this_year[item["booked_by"]][item["booked_on"]] = item[
+            "hours__sum"
+        ]
+
+    booked_before_this_week = {}
+    booked_this_week = {}
+    if current_week is not None:
+        booked_before_this_week = {
+            item["booked_by"]: item["hours__sum"]
+            for item in booked_hours(
+                booked_by__in=person_ids, year=year, week__lt=current_week
+            )
+            .values("booked_by")
+            .annotate(models.Sum("hours"))
+        }
+        booked_this_week = {
+            item["booked_by"]: item["hours__sum"]
+            for item in booked_hours(
+                booked_by__in=person_ids, year=year, week=current_week
+            )
+            .values("booked_by")
+            .annotate(models.Sum("hours"))
+        }
+
+    for pyc in pycs:
+        person_id = pyc.person.id
+        sums = person_changes.get(person_id, {})
+        pyc.target = sums.get("target") or 0
+        project_budget = budget[person_id]
+        pyc.per_project = pyc.calc_per_project(
+            project_budget.keys(),
+            project_budget,
+            hourly_tariff[person_id],
+            is_internal[person_id],
+            booked_this_year[person_id],
+            booked_before_this_year[person_id],
+        )
+        hours_per_week = sums.get("hours_per_week_before") or 0
+        pyc.calc_totals(
+            hours_per_week,
+            changes_per_week[person_id],
+            year_weeks,
+            all_booked_hours[person_id],
+        )
+        pyc.billable_percentage = external_percentage(
+            internal_hours[person_id], external_hours[person_id]
+        )
+        pyc.unbillable_percentage = 100 - pyc.billable_percentage
+        if pyc.year != pyc.current_year:
+            pyc.to_book = pyc.calc_to_book_for_whole_year()
+        elif current_week is None:
+            # Corner case around new year, just use the regular way.
+            pyc.to_book = pyc.person.to_book()
+        else:
+            # person.to_work_up_till_now(), without the current week.
+            hours_to_work = 0
+            missing_days = 0
+            for year_week in year_weeks:
+                if year_week.week >= current_week:
+                    break
+                hours_per_week += changes_per_week[person_id].get(year_week.week, 0)
+                hours_to_work += hours_per_week
+                missing_days += year_week.num_days_missing
+            hours_to_work = max(0, hours_to_work - missing_days * 8)
+            pyc.to_book = to_book_summary(
+                hours_to_work,
+                booked_before_this_week.get(person_id, 0),
+                sums.get("hours_per_week_now") or 0,
+                current_year_week,
+                booked_this_week.get(person_id, 0),
+            )
+
+    elapsed = time.time() - start_time
+    logger.debug("Re-calculated %s person/year infos in %s secs", len(pycs), elapsed)
+
+
+class FinancialCube:
+    """Financial numbers of a couple of years, grouped by group and mpc.
+
+    Invoices and payables per (group, mpc, year, month), the project numbers
+    (contract amounts per confirmation month, reservations, counts) per
+    (group, mpc) and a few extra (group, mpc) sums: a handful of GROUP BY
+    queries in total. The financial excel exports select and add up what
+    they need in Python instead of firing an aggregate query per month per
+    group.
+
+    """
+
+    def __init__(self, years):
+        self.years = list(years)
+        self.invoiced = self._per_month(Invoice, "date", "amount_exclusive")
+        self.payables = self._per_month(Payable, "date", "amount")
+
+        this_year_week_id = this_year_week().id
+        self.project_rows = list(
+            Project.objects.filter(internal=False)
+            .values(
+                "group",
+                "mpc",
+                "archived",
+                year=ExtractYear("confirmation_date"),
+                month=ExtractMonth("confirmation_date"),
+                has_bid=ExpressionWrapper(
+                    Q(bid_send_date__isnull=False), output_field=BooleanField()
+                ),
+                ended=ExpressionWrapper(
+                    Q(end__lt=this_year_week_id), output_field=BooleanField()
+                ),
+            )
+            .annotate(
+                num_projects=models.Count("id"),
+                contract_amount=models.Sum("contract_amount"),
+                reservation=models.Sum("reservation"),
+                software_development=models.Sum("software_development"),
+                profit=models.Sum("profit"),
+            )
+            .order_by()
+        )
+        self.confirmed = [
+            dict(row, amount=row["contract_amount"])
+            for row in self.project_rows
+            if row["year"] in self.years
+        ]
+
+        # Only for active external projects.
+        self.budget_items = self._per_group(
+            BudgetItem.objects.filter(project__internal=False, project__archived=False),
+            "project",
+            "amount",
+        )
+        self.budget_transfers = self._per_group(
+            BudgetItem.objects.filter(
+                to_project__internal=False, to_project__archived=False
+            ),
+            "to_project",
+            "amount",
+        )
+        self.booked_without_confirmation = self._per_group(
+            BookingRollup.objects.filter(
+                booked_on__internal=False,
+                booked_on__archived=False,
+                booked_on__confirmation_date__isnull=True,
+            ),
+            "booked_on",
+            "hours",
+        )
+
+    def _per_month(self, model, date_field, amount_field):
+        return list(
+            model.objects.filter(**{f"{date_field}__year__in": self.years})
+            .values(
+                group=F("project__group"),
+                mpc=F("project__mpc"),
+                internal=F("project__internal"),
+                year=ExtractYear(date_field),
+                month=ExtractMonth(date_field),
+            )
+            .annotate(amount=models.Sum(amount_field))
+            .order_by()
+        )
+
+    def _per_group(self, queryset, project_field, amount_field):
+        return list(
+            queryset.values(
+                group=F(f"{project_field}__group"), mpc=F(f"{project_field}__mpc")
+            )
+            .annotate(amount=models.Sum(amount_field))
+            .order_by()
+        )
+
+    def _select(self, rows, group=None, mpc=None, external_only=False):
+        for row in rows:
+            if group and row["group"] != group.id:
+                continue
+            if mpc and row["mpc"] != mpc.id:
+                continue
+            if external_only and row.get("internal"):
+                continue
+            yield row
+
+    def _sum(self, rows, group=None, mpc=None):
+        return sum(row["amount"] or 0 for row in self._select(rows, group, mpc))
+
+    def per_year_month(self, measure, group=None, mpc=None, external_only=False):
+        """Return amounts and cumulative amounts per year/month, plus totals.
+
+        ``measure`` is "invoiced", "payables" or "confirmed" (contract amounts
+        per confirmation date). The first key of the dicts is the year, the
+        second the month.
+
+        """
+        rows = getattr(self, measure)
+        per_year_month = {year: dict.fromkeys(range(1, 13), 0) for year in self.years}
+        for row in self._select(rows, group, mpc, external_only):
+            per_year_month[row["year"]][row["month"]] += row["amount"] or 0
+        cumulative_per_year_month = {
+            year: dict(zip(range(1, 13), itertools.accumulate(months.values())))
+            for year, months in per_year_month.items()
+        }
+        return {
+            "per_year_month": per_year_month,
+            "cumulative_per_year_month": cumulative_per_year_month,
+            "totals": {
+                year: cumulative_per_year_month[year][12] for year in self.years
+            },
+        }
+
+    def project_sum(self, field, group=None, mpc=None):
+        """Return rounded sum of the field over the active projects."""
+        active = [
+            row
+            for row in self._select(self.project_rows, group, mpc)
+            if not row["archived"]
+        ]
+        return round(sum(row[field] or 0 for row in active))
+
+    def costs_total(self, group=None, mpc=None):
+        # Note: combination of budget_item and budget_transfer.
+        costs = round(self._sum(self.budget_items, group, mpc))
+        income = round(self._sum(self.budget_transfers, group, mpc))
+        return costs - income
+
+    def project_counts(self, group=None, mpc=None):
+        """Return counts like 'new in 2016' for projects"""
+        active = [
+            row
+            for row in self._select(self.project_rows, group, mpc)
+            if not row["archived"]
+        ]
+        confirmed = [row for row in active if row["year"] is not None]
+        unconfirmed = [row for row in active if row["year"] is None]
+        return {
+            "active": sum(row["num_projects"] for row in active),
+            "with_confirmation": sum(row["num_projects"] for row in confirmed),
+            "ended": sum(row["num_projects"] for row in active if row["ended"]),
+            "offered": sum(
+                row["num_projects"] for row in unconfirmed if not row["has_bid"]
+            ),
+            "to_estimate": sum(
+                row["num_projects"] for row in unconfirmed if row["has_bid"]
+            ),
+            # Offerte-uren zonder opdracht
+            "booked_without_confirmation": self._sum(
+                self.booked_without_confirmation, group, mpc
+            ),
+        }
@@ -0,0 +1,115 @@
+"""Generated excel files, kept on disk for as long as the data is unchanged.
+
+Management downloads the same financial and WBSO spreadsheets over and over.
+The files are stored under a key made of the export's url path, its query
+parameters, the date (exports mention "today") and ``models.data_version()``.
+When nothing changed, the stored file is streamed back right away.
+
+The files are in the "cache" subdirectory of ``settings.TRS_EXPORT_DIR``,
+which is kept below ``settings.TRS_EXPORT_CACHE_MAX_MB``, the least
+recently used files are removed first. Hits and misses are counted in the
+regular cache, see ``stats()``.
+
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import urllib.parse
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+HITS_KEY = "trs-export-cache-hits"
+MISSES_KEY = "trs-export-cache-misses"
+
+
+def key(path, query, data_version):
+    """Return key for the url path and query parameters (a QueryDict)."""
+    query = urllib.parse.urlencode(sorted(query.lists()), doseq=True)
+    today = datetime.date.today().isoformat()
+    return hashlib.sha1(f"{path}?{query}-{today}-{data_version}".encode()).hexdigest()
+
+
+def _cache_dir():
+    # Not a setting of its own: it has to follow overrides of the export dir.
+    return os.path.join(settings.TRS_EXPORT_DIR, "cache")
+
+
+def _file_path(key):
+    return os.path.join(_cache_dir(), key + ".xlsx")
+
+
+def _count(counter_key):
+    cache.add(counter_key, 0, timeout=None)
+    try:
+        cache.incr(counter_key)
+    except ValueError:
+        # Evicted in between, we don't need to be exact.
+        pass
+
+
+def get(key):
+    """Return opened stored file, or None."""
+    try:
+        stored = open(_file_path(key), "rb")
+    except FileNotFoundError:
+        _count(MISSES_KEY)
+        return None
+    # Mark it as recently used for evict().
+    os.utime(stored.fileno())
+    _count(HITS_KEY)
+    return stored
+
+
+def store(key, excel_file):
+    """Store the contents of the (open) file, then evict old files if needed."""
+    os.makedirs(_cache_dir(), exist_ok=True)
+    # Write under a temporary name first: a half-written file must never be
+    # found by get().
+    with tempfile.NamedTemporaryFile(
+        dir=_cache_dir(), suffix=".part", delete=False
+    ) as part_file:
+        shutil.copyfileobj(excel_file, part_file)
+    os.replace(part_file.name, _file_path(key))
+    evict()
+
+
+def evict(max_size=None):
+    """Remove the least recently used files until we're below the max size."""
+    if max_size is None:
+        max_size = settings.TRS_EXPORT_CACHE_MAX_MB * 1024 * 1024
+    with os.scandir(_cache_dir()) as entries:
+        files = [
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in entries
+            if entry.name.endswith(".xlsx")
+        ]
+    total_size = sum(size for (mtime, size, path) in files)
+    for mtime, size, path in sorted(files):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another process got there first.
+            pass
+        total_size -= size
+        logger.debug("Removed %s from the export cache", path)
+
+
+def stats():
+    """Return hits, misses and hit rate (percentage)."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": total and round(100 * hits / total) or 0,
+    }
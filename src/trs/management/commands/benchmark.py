@@ -0,0 +1,185 @@
+"""Time the hot views and calculations, cold and warm cache.
+
+Meant to run on a copy of the database or on one filled by
+``generate_dataset``. Every scenario runs twice: right after clearing the
+cache and once more with the cache filled by the first run. Wall time and
+number of queries end up in a JSON file, ``--compare`` with the file of an
+earlier run (another commit) shows the differences.
+
+"""
+
+import contextlib
+import datetime
+import json
+import logging
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from trs import caching, core, models, views
+from trs.management.commands.generate_dataset import BENCHMARK_USERNAME
+from trs.middleware import QueryTimer
+
+logger = logging.getLogger(__name__)
+
+NUM_OBJECTS = 50
+
+
+class Benchmark:
+    def __init__(self):
+        self.user = User.objects.get(username=BENCHMARK_USERNAME)
+        self.person = models.Person.objects.get(user=self.user)
+        self.persons = list(models.Person.objects.filter(archived=False))
+        self.projects = list(models.Project.objects.filter(archived=False))
+        self.client = Client(HTTP_HOST="localhost")
+        self.client.force_login(self.user)
+
+    def scenarios(self):
+        """Return {name: function}."""
+        return {
+            "persons_view": lambda: self.get(reverse("trs.persons")),
+            "projects_view": lambda: self.get(reverse("trs.projects")),
+            "booking_view": lambda: self.get(
+                reverse("trs.booking", kwargs={"pk": self.person.id})
+            ),
+            "get_pyc": self.get_pycs,
+            "bulk_pyc": lambda: core.bulk_pyc(self.persons),
+            "work_calculation": self.work_calculations,
+            "projects_excel": lambda: self.export(reverse("trs.projects.excel")),
+            "financial_excel": lambda: self.export(reverse("trs.financial.excel")),
+            "combined_financial_excel": lambda: self.export(
+                reverse("trs.combined_financial.excel")
+            ),
+            "wbso_excel": lambda: self.export(reverse("trs.wbso.excel")),
+        }
+
+    def get(self, path):
+        response = self.client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f"{path} returned {response.status_code}")
+
+    def get_pycs(self):
+        for person in self.persons[:NUM_OBJECTS]:
+            core.get_pyc(person)
+
+    def work_calculations(self):
+        for project in self.projects[:NUM_OBJECTS]:
+            project.work_calculation()
+
+    def export(self, path):
+        # Generate it right here, like the export worker does.
+        view = views.export_view(path, self.user)
+        with tempfile.TemporaryFile() as excel_file:
+            view.write_excel_file(excel_file)
+
+    def measure(self, function):
+        query_timer = QueryTimer(num_slowest=0)
+        start_time = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_timer))
+            # Like the middleware does for a request.
+            stack.enter_context(caching.request_scope())
+            function()
+        return {
+            "seconds": round(time.perf_counter() - start_time, 3),
+            "queries": query_timer.count,
+        }
+
+    def run(self, names):
+        results = {}
+        for name, function in self.scenarios().items():
+            if names and name not in names:
+                continue
+            cache.clear()
+            cold = self.measure(function)
+            warm = self.measure(function)
+            results[name] = {"cold": cold, "warm": warm}
+            logger.info(
+                "%s: cold %.2fs (%s queries), warm %.2fs (%s queries)",
+                name,
+                cold["seconds"],
+                cold["queries"],
+                warm["seconds"],
+                warm["queries"],
+            )
+        return results
+
+
+def compare(results, previous):
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        for kind in ["cold", "warm"]:
+            old = previous[name][kind]
+            new = result[kind]
+            change = (
+                100 * (new["seconds"] - old["seconds"]) / old["seconds"]
+                if old["seconds"]
+                else 0
+            )
+            logger.info(
+                "%s %s: %.2fs -> %.2fs (%+.0f%%), %s -> %s queries",
+                name,
+                kind,
+                old["seconds"],
+                new["seconds"],
+                change,
+                old["queries"],
+                new["queries"],
+            )
+
+
+class Command(BaseCommand):
+    args = ""
+    help = "Time the hot views and calculations, see generate_dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default="benchmark.json",
+            help="JSON file to write the results to (default: benchmark.json).",
+        )
+        parser.add_argument(
+            "--compare", help="JSON file of an earlier run to compare with."
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            default=[],
+            help="Only run this scenario (can be repeated).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = Benchmark()
+        except User.DoesNotExist:
+            raise CommandError("No benchmark user, run generate_dataset first.")
+        unknown = set(options["only"]) - set(benchmark.scenarios())
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        results = benchmark.run(options["only"])
+        with open(options["output"], "w") as output:
+            json.dump(
+                {
+                    "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "dataset": {
+                        "persons": models.Person.objects.count(),
+                        "projects": models.Project.objects.count(),
+                        "bookings": models.Booking.objects.count(),
+                    },
+                    "results": results,
+                },
+                output,
+                indent=2,
+            )
+        logger.info("Results written to %s", options["output"])
+        if options["compare"]:
+            with open(options["compare"]) as previous:
+                compare(results, json.load(previous)["results"])
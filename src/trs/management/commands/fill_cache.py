@@ -1,29 +1,169 @@
+import collections
+import concurrent.futures
+import datetime
 import logging
+import multiprocessing
+import time
 
+from django.core.cache import cache, caches
 from django.core.management.base import BaseCommand
+from django.db import connections
 
-from trs import core, models
+from trs import caching, core, models
 
 logger = logging.getLogger(__name__)
 
+LOCK_KEY = "trs-fill-cache-running"
+# Safety net: a killed run shouldn't block the cronjob forever.
+LOCK_TIMEOUT = 60 * 60
+
+
+def warm_pycs(person_ids, year):
+    persons = models.Person.objects.filter(id__in=person_ids)
+    core.bulk_pyc(persons, year)
+
+
+def warm_persons(person_ids):
+    persons = models.Person.objects.filter(id__in=person_ids)
+    caching.prefetch(persons, "to_book", "to_work_up_till_now")
+
+
+def warm_projects(project_ids):
+    projects = models.Project.objects.filter(id__in=project_ids)
+    caching.prefetch(projects, "work_calculation", "not_yet_started")
+
+
+def run_task(task):
+    """Run one batch, return its cache counters (also from a worker process)."""
+    function, ids, args = task
+    with caching.request_scope() as scope:
+        function(ids, *args)
+    return len(ids), dict(scope.stats)
+
+
+def batches(ids, batch_size):
+    for start in range(0, len(ids), batch_size):
+        yield ids[start : start + batch_size]
+
+
+def tasks(batch_size, include_archived=False):
+    """Return (function, ids, extra args) batches, most important first.
+
+    The pycs and the project calculations are what the overview pages need,
+    so those come first. Everything is only calculated if it isn't in the
+    cache yet, so running this again (after a deploy, in a new week) is
+    cheap.
+
+    """
+    this_year = datetime.date.today().year
+    persons = models.Person.objects.all()
+    projects = models.Project.objects.all()
+    if not include_archived:
+        persons = persons.filter(archived=False)
+        projects = projects.filter(archived=False)
+    person_ids = list(persons.values_list("id", flat=True))
+    project_ids = list(projects.values_list("id", flat=True))
+
+    result = []
+    for year in [this_year, this_year - 1]:
+        result += [(warm_pycs, ids, (year,)) for ids in batches(person_ids, batch_size)]
+    result += [(warm_projects, ids, ()) for ids in batches(project_ids, batch_size)]
+    result += [(warm_persons, ids, ()) for ids in batches(person_ids, batch_size)]
+    return result
+
 
 class Command(BaseCommand):
     args = ""
-    help = "Pre-fill the cache. Takes a horrid long time."
+    help = "Pre-fill the cache with whatever isn't in there yet. Safe to run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Number of worker processes (default: 1, no pool).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of persons/projects per batch (default: 50).",
+        )
+        parser.add_argument(
+            "--include-archived",
+            action="store_true",
+            help="Also fill the cache for archived persons and projects.",
+        )
 
     def handle(self, *args, **options):
-        num_persons = models.Person.objects.all().count()
-        logger.debug("%s persons in total.", num_persons)
-        for index, person in enumerate(models.Person.objects.all()):
-            person.to_book()
-            person.to_work_up_till_now()
-            core.get_pyc(person)
-            logger.debug("%s out of %s done", index + 1, num_persons)
-
-        num_projects = models.Project.objects.all().count()
-        logger.debug("%s projects in total.", num_projects)
-        for index, project in enumerate(models.Project.objects.all()):
-            project.work_calculation()
-            project.not_yet_started()
-            project.already_ended()
-            logger.debug("%s out of %s done", index + 1, num_projects)
+        processes = options.get("processes", 1)
+        batch_size = options.get("batch_size", 50)
+        include_archived = options.get("include_archived", False)
+        if not cache.add(LOCK_KEY, True, LOCK_TIMEOUT):
+            logger.warning("Another fill_cache is still running, skipping.")
+            return
+        try:
+            self.fill(tasks(batch_size, include_archived), processes)
+        finally:
+            cache.delete(LOCK_KEY)
+
+    def fill(self, todo, processes):
+        if processes <= 1:
+            self.collect(map(run_task, todo), len(todo))
+            return
+        # The workers are forked: they must not share our connections.
+        connections.close_all()
+        caches.close_all()
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = [executor.submit(run_task, task) for task in todo]
+            self.collect(
+                (
+                    future.result()
+                    for future in concurrent.futures.as_completed(futures)
+                ),
+                len(todo),
+            )
+
+    def collect(self, results, num_total):
+        start_time = time.time()
+        totals = collections.Counter()
+        for num_done, (num_objects, stats) in enumerate(results, start=1):
+            totals["objects"] += num_objects
+            totals.update(stats)
+            self.report(num_done, num_total, totals, start_time)
+        logger.info(
+            "Cache filled in %.1fs: %s hits, %s misses, %s values too big to cache",
+            time.time() - start_time,
+            totals["hits"],
+            totals["misses"],
+            totals["failed_sets"],
+        )
+        self.report_sizes(totals)
+
+    def report_sizes(self, totals):
+        """Log the sizes of what we stored, per key family"""
+        for name, num_sets in sorted(totals.items()):
+            if not name.startswith("sets:"):
+                continue
+            family = name.removeprefix("sets:")
+            num_bytes = totals[f"set_bytes:{family}"]
+            logger.info(
+                "%s: %s values, %.1f KB in total, %.1f KB on average",
+                family,
+                num_sets,
+                num_bytes / 1024,
+                num_bytes / num_sets / 1024,
+            )
+
+    def report(self, num_done, num_total, totals, start_time):
+        elapsed = time.time() - start_time
+        logger.info(
+            "%s out of %s batches done, %.1f objects/s, %s hits, %s misses",
+            num_done,
+            num_total,
+            totals["objects"] / elapsed if elapsed else 0,
+            totals["hits"],
+            totals["misses"],
+        )
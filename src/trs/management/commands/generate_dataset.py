@@ -0,0 +1,340 @@
+"""Generate a large, reproducible dataset for benchmarking.
+
+The test factories only create a handful of objects. This command fills an
+*empty* database with something the size of the real thing (by default ten
+years of daily bookings for 300 persons on 3000 projects), so that
+``bin/django benchmark`` shows how the views and calculations behave at
+scale. The same ``--seed`` gives the same data.
+
+"""
+
+import datetime
+import logging
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from trs import models
+from trs.management.commands import rebuild_booking_totals
+from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+BENCHMARK_USERNAME = "benchmark"
+HOURS_PER_WEEK = [24, 32, 36, 40, 40, 40]
+
+
+class Generator:
+    """Add persons and projects (and everything around them) to the database.
+
+    It adds to whatever is already there, re-using the groups, mpcs and wbso
+    projects, so tests can grow a dataset.
+
+    """
+
+    def __init__(self, seed, num_persons, num_projects, num_years):
+        self.random = random.Random(seed)
+        self.num_persons = num_persons
+        self.num_projects = num_projects
+        this_year = datetime.date.today().year
+        self.year_weeks = list(
+            models.YearWeek.objects.filter(
+                year__gt=this_year - num_years, year__lte=this_year
+            ).order_by("first_day")
+        )
+        # Bookings stop at the current week, like in real life.
+        today = datetime.date.today()
+        self.booking_weeks = [
+            year_week for year_week in self.year_weeks if year_week.first_day <= today
+        ]
+
+    def generate(self):
+        self.groups = list(models.Group.objects.all()) or (
+            models.Group.objects.bulk_create(
+                [models.Group(name=f"Groep {index}") for index in range(1, 6)]
+            )
+        )
+        self.mpcs = list(models.MPC.objects.all()) or models.MPC.objects.bulk_create(
+            [models.MPC(name=f"MPC {index}") for index in range(1, 4)]
+        )
+        self.wbso_projects = list(
+            models.WbsoProject.objects.all()
+        ) or models.WbsoProject.objects.bulk_create(
+            [
+                models.WbsoProject(
+                    number=index,
+                    title=f"WBSO project {index}",
+                    start_date=self.year_weeks[0].first_day,
+                    end_date=self.year_weeks[-1].first_day,
+                )
+                for index in range(1, 6)
+            ]
+        )
+        self.generate_persons()
+        self.generate_projects()
+        self.generate_work_assignments()
+        self.generate_financials()
+        self.generate_bookings()
+        for model in rebuild_booking_totals.TOTALS:
+            rebuild_booking_totals.rebuild(model)
+
+    def generate_persons(self):
+        first_index = models.Person.objects.count()
+        self.persons = []
+        if not User.objects.filter(username=BENCHMARK_USERNAME).exists():
+            # The benchmark logs in as the first person, who can see
+            # everything. (Creating the user also creates its person, see
+            # signal_handlers.py).
+            user = User.objects.create_user(BENCHMARK_USERNAME)
+            benchmark_person = models.Person.objects.get(user=user)
+            benchmark_person.name = f"Medewerker {first_index:04d}"
+            benchmark_person.group = self.random.choice(self.groups)
+            benchmark_person.is_management = True
+            benchmark_person.is_office_management = True
+            benchmark_person.save()
+            self.persons.append(benchmark_person)
+        self.persons += models.Person.objects.bulk_create(
+            [
+                models.Person(
+                    name=f"Medewerker {index:04d}",
+                    group=self.random.choice(self.groups),
+                )
+                for index in range(
+                    first_index + len(self.persons), first_index + self.num_persons
+                )
+            ]
+        )
+
+        self.hours_per_week = {}
+        person_changes = []
+        for person in self.persons:
+            hours_per_week = self.random.choice(HOURS_PER_WEEK)
+            self.hours_per_week[person.id] = hours_per_week
+            person_changes.append(
+                models.PersonChange(
+                    person=person,
+                    year_week=self.year_weeks[0],
+                    hours_per_week=hours_per_week,
+                    target=self.random.randrange(50000, 150000, 1000),
+                    standard_hourly_tariff=self.random.randrange(60, 140, 5),
+                )
+            )
+            if self.random.random() < 0.3:
+                # A raise, somewhere along the way.
+                person_changes.append(
+                    models.PersonChange(
+                        person=person,
+                        year_week=self.random.choice(self.year_weeks),
+                        hours_per_week=0,
+                        target=self.random.randrange(0, 20000, 1000),
+                        standard_hourly_tariff=5,
+                    )
+                )
+        models.PersonChange.objects.bulk_create(person_changes, batch_size=BATCH_SIZE)
+
+    def generate_projects(self):
+        two_years_ago = datetime.date.today() - datetime.timedelta(days=2 * 365)
+        projects = []
+        first_index = models.Project.objects.count()
+        for index in range(first_index, first_index + self.num_projects):
+            start_index = self.random.randrange(len(self.year_weeks))
+            end_index = min(
+                start_index + self.random.randint(4, 104), len(self.year_weeks) - 1
+            )
+            start = self.year_weeks[start_index]
+            end = self.year_weeks[end_index]
+            internal = self.random.random() < 0.1
+            code = f"P{start.year}-{index:05d}"
+            project = models.Project(
+                code=code,
+                code_for_sorting=models.make_code_sortable(code),
+                description=f"Project {index}",
+                internal=internal,
+                start=start,
+                end=end,
+                group=self.random.choice(self.groups),
+                mpc=self.random.choice(self.mpcs),
+                project_leader=self.random.choice(self.persons),
+                project_manager=self.random.choice(self.persons),
+                archived=end.first_day < two_years_ago and self.random.random() < 0.7,
+            )
+            if not internal:
+                project.contract_amount = Decimal(
+                    self.random.randrange(5000, 500000, 500)
+                )
+                project.bid_send_date = start.first_day - datetime.timedelta(days=30)
+                if self.random.random() < 0.8:
+                    project.confirmation_date = start.first_day
+                if self.random.random() < 0.1:
+                    project.wbso_project = self.random.choice(self.wbso_projects)
+                    project.wbso_percentage = self.random.choice([50, 80, 100])
+            projects.append(project)
+        self.projects = models.Project.objects.bulk_create(
+            projects, batch_size=BATCH_SIZE
+        )
+
+    def generate_work_assignments(self):
+        work_assignments = []
+        # Person id -> [(project id, first day, last day)].
+        self.assignments = {person.id: [] for person in self.persons}
+        for project in self.projects:
+            num_members = min(self.random.randint(2, 8), len(self.persons))
+            members = set(self.random.sample(self.persons, num_members))
+            members.update([project.project_leader, project.project_manager])
+            for person in members:
+                work_assignments.append(
+                    models.WorkAssignment(
+                        assigned_on=project,
+                        assigned_to=person,
+                        hours=self.random.randrange(20, 1000, 10),
+                        hourly_tariff=self.random.randrange(60, 140, 5),
+                    )
+                )
+                self.assignments[person.id].append(
+                    (
+                        project.id,
+                        project.start.first_day,
+                        project.end.first_day + datetime.timedelta(days=6),
+                    )
+                )
+        models.WorkAssignment.objects.bulk_create(
+            work_assignments, batch_size=BATCH_SIZE
+        )
+
+    def generate_financials(self):
+        budget_items = []
+        invoices = []
+        payables = []
+        for project in self.projects:
+            for index in range(self.random.randint(0, 3)):
+                budget_items.append(
+                    models.BudgetItem(
+                        project=project,
+                        description=f"Budget {index}",
+                        amount=Decimal(self.random.randrange(-20000, 20000, 100)),
+                        to_project=(
+                            self.random.choice(self.projects)
+                            if self.random.random() < 0.05
+                            else None
+                        ),
+                    )
+                )
+            if project.internal:
+                continue
+            days = (project.end.first_day - project.start.first_day).days
+            for index in range(self.random.randint(1, 6)):
+                date = project.start.first_day + datetime.timedelta(
+                    days=self.random.randint(0, days)
+                )
+                invoices.append(
+                    models.Invoice(
+                        project=project,
+                        date=date,
+                        number=f"F{project.id}-{index}",
+                        amount_exclusive=Decimal(
+                            self.random.randrange(1000, 50000, 100)
+                        ),
+                        vat=Decimal(21),
+                        payed=date + datetime.timedelta(days=30),
+                    )
+                )
+            for index in range(self.random.randint(0, 2)):
+                payables.append(
+                    models.Payable(
+                        project=project,
+                        date=project.start.first_day,
+                        number=f"I{project.id}-{index}",
+                        amount=Decimal(self.random.randrange(500, 20000, 100)),
+                    )
+                )
+        models.BudgetItem.objects.bulk_create(budget_items, batch_size=BATCH_SIZE)
+        models.Invoice.objects.bulk_create(invoices, batch_size=BATCH_SIZE)
+        models.Payable.objects.bulk_create(payables, batch_size=BATCH_SIZE)
+
+    def generate_bookings(self):
+        """Book every working day, on a couple of the person's projects."""
+        bookings = []
+        num_bookings = 0
+        for person in self.persons:
+            hours_per_day = self.hours_per_week[person.id] // 5
+            for year_week in self.booking_weeks:
+                active = [
+                    project_id
+                    for project_id, first_day, last_day in self.assignments[person.id]
+                    if first_day <= year_week.first_day <= last_day
+                ]
+                if not active:
+                    continue
+                chosen = self.random.sample(active, min(len(active), 3))
+                for date in year_week.days():
+                    hours_left = hours_per_day
+                    for project_id in chosen:
+                        hours = self.random.randint(1, hours_left)
+                        if project_id == chosen[-1]:
+                            hours = hours_left
+                        hours_left -= hours
+                        bookings.append(
+                            models.Booking(
+                                booked_by=person,
+                                booked_on_id=project_id,
+                                year_week=year_week,
+                                date=date,
+                                hours=hours,
+                            )
+                        )
+                        if not hours_left:
+                            break
+            if len(bookings) >= BATCH_SIZE:
+                models.Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+                num_bookings += len(bookings)
+                bookings = []
+                logger.info("%s bookings generated", num_bookings)
+        models.Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+
+
+class Command(BaseCommand):
+    args = ""
+    help = "Fill an empty database with a large, reproducible dataset."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", type=int, default=42, help="Random seed (default: 42)."
+        )
+        parser.add_argument(
+            "--persons", type=int, default=300, help="Number of persons (300)."
+        )
+        parser.add_argument(
+            "--projects", type=int, default=3000, help="Number of projects (3000)."
+        )
+        parser.add_argument(
+            "--years",
+            type=int,
+            default=10,
+            help="Number of years, up till this one (10).",
+        )
+
+    def handle(self, *args, **options):
+        if models.Person.objects.exists():
+            raise CommandError("The database isn't empty, use a fresh one.")
+        start_time = time.time()
+        ensure_year_weeks_are_present()
+        generator = Generator(
+            options.get("seed", 42),
+            options.get("persons", 300),
+            options.get("projects", 3000),
+            options.get("years", 10),
+        )
+        with transaction.atomic():
+            generator.generate()
+        logger.info(
+            "Generated %s persons, %s projects and %s bookings in %.0fs",
+            models.Person.objects.count(),
+            models.Project.objects.count(),
+            models.Booking.objects.count(),
+            time.time() - start_time,
+        )
@@ -0,0 +1,101 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from trs import models
+
+logger = logging.getLogger(__name__)
+
+# Model field -> Booking lookup, per table that record_booking_deltas() keeps
+# up to date.
+TOTALS = {
+    models.BookingRollup: {
+        "booked_by": "booked_by",
+        "booked_on": "booked_on",
+        "year_week": "year_week",
+        "year": "year_week__year",
+        "week": "year_week__week",
+    },
+}
+
+
+def expected_totals(model):
+    """Return {field values tuple: hours} from the bookings themselves."""
+    lookups = TOTALS[model]
+    per_key = (
+        models.Booking.objects.filter(year_week__isnull=False)
+        .values(*lookups.values())
+        .annotate(Sum("hours"))
+    )
+    return {
+        tuple(item[lookup] for lookup in lookups.values()): item["hours__sum"]
+        for item in per_key
+        if item["hours__sum"]
+    }
+
+
+def actual_totals(model):
+    fields = list(TOTALS[model])
+    return {
+        tuple(item[field] for field in fields): item["hours"]
+        for item in model.objects.values(*fields, "hours")
+        if item["hours"]
+    }
+
+
+def differences(model):
+    """Return number of totals that don't match the bookings."""
+    expected = expected_totals(model)
+    actual = actual_totals(model)
+    return sum(
+        1
+        for key in expected.keys() | actual.keys()
+        if expected.get(key) != actual.get(key)
+    )
+
+
+@transaction.atomic
+def rebuild(model):
+    # booked_by_id instead of booked_by and so.
+    attnames = [model._meta.get_field(field).attname for field in TOTALS[model]]
+    model.objects.all().delete()
+    model.objects.bulk_create(
+        [
+            model(hours=hours, **dict(zip(attnames, key)))
+            for key, hours in expected_totals(model).items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Command(BaseCommand):
+    args = ""
+    help = "Verify the booking rollup against the bookings, rebuild if needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the differences, don't rebuild anything.",
+        )
+
+    def handle(self, *args, **options):
+        out_of_sync = []
+        for model in TOTALS:
+            num_differences = differences(model)
+            if not num_differences:
+                logger.info("%s matches the bookings", model.__name__)
+                continue
+            out_of_sync.append(model.__name__)
+            logger.warning(
+                "%s has %s totals that don't match the bookings",
+                model.__name__,
+                num_differences,
+            )
+            if not options["check"]:
+                rebuild(model)
+                logger.info("Rebuilt %s", model.__name__)
+        if out_of_sync and options["check"]:
+            raise CommandError(f"Out of sync: {', '.join(out_of_sync)}")
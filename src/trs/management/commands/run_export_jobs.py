@@ -0,0 +1,114 @@
+import datetime
+import logging
+import os
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from trs import caching, models, routers, views
+
+logger = logging.getLogger(__name__)
+
+# A job that's running for longer than this is from a worker that died.
+STALE_AFTER = datetime.timedelta(hours=1)
+
+
+def run_job(job):
+    """Generate the excel file of a (claimed) job."""
+    start_time = time.time()
+    os.makedirs(settings.TRS_EXPORT_DIR, exist_ok=True)
+    # Write to a temporary name first, a half-written file must never be
+    # downloaded.
+    part_path = job.file_path + ".part"
+    try:
+        with routers.reports_database(), caching.request_scope():
+            view = views.export_view(job.path, job.requested_by, job.session)
+            if view.cache_export:
+                view.export_cache_key  # Before generating, see the note there.
+            with open(part_path, "w+b") as excel_file:
+                view.write_excel_file(excel_file)
+                view.store_in_export_cache(excel_file)
+        os.replace(part_path, job.file_path)
+        job.status = models.ExportJob.DONE
+    except Exception:
+        logger.exception("Export %s (%s) failed", job.id, job.path)
+        job.status = models.ExportJob.FAILED
+        job.error = traceback.format_exc()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    job.duration = time.time() - start_time
+    job.save()
+
+
+def fail_stale_jobs():
+    stale = models.ExportJob.objects.filter(
+        status=models.ExportJob.RUNNING,
+        started__lt=datetime.datetime.now() - STALE_AFTER,
+    )
+    num_stale = stale.update(
+        status=models.ExportJob.FAILED, error="The worker stopped halfway."
+    )
+    if num_stale:
+        logger.warning("Marked %s stale export jobs as failed", num_stale)
+
+
+def remove_old_jobs(keep_days):
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=keep_days)
+    old_jobs = models.ExportJob.objects.filter(added__lt=cutoff).exclude(
+        status__in=[models.ExportJob.QUEUED, models.ExportJob.RUNNING]
+    )
+    for job in old_jobs:
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        job.delete()
+
+
+class Command(BaseCommand):
+    args = ""
+    help = "Generate the queued excel exports. Keeps running unless --once."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Only handle the jobs that are queued now, then stop.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2,
+            help="Seconds to wait before looking for new jobs (default: 2).",
+        )
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=7,
+            help="Remove finished jobs and their files after this many days.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            fail_stale_jobs()
+            remove_old_jobs(options.get("keep_days", 7))
+            self.run_queued()
+            if options.get("once"):
+                return
+            time.sleep(options.get("sleep", 2))
+
+    def run_queued(self):
+        queued = models.ExportJob.objects.filter(
+            status=models.ExportJob.QUEUED
+        ).order_by("added")
+        for job in queued:
+            if not job.claim():
+                # Another worker got it first.
+                continue
+            logger.info("Generating %s for %s", job.filename, job.path)
+            run_job(job)
+            logger.info(
+                "%s: %s in %.1fs", job.filename, job.get_status_display(), job.duration
+            )
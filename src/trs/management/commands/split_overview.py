@@ -17,7 +17,7 @@ class Command(BaseCommand):
     help = "Export spreadsheet for handling the split it/consultancy"
 
     def handle(self, *args, **options):
-        bookings = models.Booking.objects.filter(year_week__year=YEAR)
+        bookings = models.BookingRollup.objects.filter(year=YEAR)
         hours_per_person_per_projectgroup = bookings.values(
             "booked_by__group__name", "booked_by__name", "booked_on__group__name"
         ).annotate(Sum("hours"))
@@ -80,6 +80,7 @@ def ensure_year_weeks_are_present():
     logger.info("Added %s YearWeek objects", count)
     fix_num_days()
     logger.info("Adjusted the number of days per week where necessary.")
+    models.reset_year_week_calendar()
 
 
 class Command(BaseCommand):
@@ -0,0 +1,168 @@
+import contextlib
+import heapq
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from trs import caching, routers
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStatsMiddleware:
+    """Remember cached values per request and log the round trips."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with caching.request_scope() as scope:
+            response = self.get_response(request)
+        logger.debug(
+            "%s: %s cache round trips, %s saved by batching",
+            request.path,
+            scope.stats["round_trips"],
+            scope.stats["round_trips_saved"],
+        )
+        return response
+
+
+class QueryTimer:
+    """Database execute wrapper that counts queries and keeps the slowest."""
+
+    def __init__(self, num_slowest):
+        self.num_slowest = num_slowest
+        self.count = 0
+        self.duration = 0
+        # Heap of (duration, sql), the fastest of the slowest on top.
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start_time = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start_time
+            self.count += 1
+            self.duration += duration
+            if len(self.slowest) < self.num_slowest:
+                heapq.heappush(self.slowest, (duration, sql))
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duration, sql))
+
+
+class ServerTimingMiddleware:
+    """Measure every request, report it in a Server-Timing header and the log.
+
+    Database queries (on all connections) are counted and timed here. Cache
+    gets/sets/hits and the time spent re-calculating pycs and cached methods
+    come from the request scope, so this must come after the
+    CacheStatsMiddleware. Requests slower than ``TRS_SLOW_REQUEST_MS`` also
+    log their slowest ``TRS_SLOW_REQUEST_NUM_QUERIES`` queries.
+
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_timer = QueryTimer(settings.TRS_SLOW_REQUEST_NUM_QUERIES)
+        start_time = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start_time
+
+        cache_stats = caching.stats()
+        request_stats = {
+            "status": response.status_code,
+            "total_ms": round(duration * 1000),
+            "db_queries": query_timer.count,
+            "db_ms": round(query_timer.duration * 1000),
+            "cache_gets": cache_stats["gets"],
+            "cache_sets": cache_stats["sets"],
+            "cache_hits": cache_stats["hits"],
+            "cache_l1_hits": cache_stats["l1_hits"],
+            "cache_l2_hits": cache_stats["l2_hits"],
+            "cache_set_bytes": cache_stats["set_bytes"],
+            "cache_failed_sets": cache_stats["failed_sets"],
+            "suppressed_calculations": cache_stats["suppressed_calculations"],
+            "pyc_ms": round(cache_stats["pyc_time"] * 1000),
+            "recalculation_ms": round(cache_stats["recalculation_time"] * 1000),
+        }
+        response["Server-Timing"] = server_timing(request_stats)
+        route = request.resolver_match.route if request.resolver_match else "-"
+        logger.info(
+            "%s %s %s",
+            request.method,
+            route or "/",
+            " ".join(f"{key}={value}" for key, value in request_stats.items()),
+            extra={"request_stats": request_stats, "path": request.path},
+        )
+        if request_stats["total_ms"] >= settings.TRS_SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request %s (%sms), slowest queries:\n%s",
+                request.path,
+                request_stats["total_ms"],
+                "\n".join(
+                    f"{duration * 1000:.0f}ms: {sql}"
+                    for duration, sql in sorted(query_timer.slowest, reverse=True)
+                ),
+            )
+        return response
+
+
+def server_timing(request_stats):
+    """Return Server-Timing header value, shown in the browser's dev tools."""
+    metrics = [
+        ("total", request_stats["total_ms"], None),
+        ("db", request_stats["db_ms"], f"{request_stats['db_queries']} queries"),
+        (
+            "cache",
+            None,
+            f"{request_stats['cache_gets']} gets, "
+            f"{request_stats['cache_sets']} sets, "
+            f"{request_stats['cache_hits']} hits",
+        ),
+        ("pyc", request_stats["pyc_ms"], "pyc calculations"),
+        ("recalc", request_stats["recalculation_ms"], "cached method calculations"),
+    ]
+    parts = []
+    for name, duration, description in metrics:
+        part = name
+        if duration is not None:
+            part += f";dur={duration}"
+        if description:
+            part += f';desc="{description}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+class ReportsDatabaseMiddleware:
+    """Let views with ``reports_database = True`` read from the read-only db.
+
+    The whole response is rendered within the block (template responses are
+    rendered lazily), the session is saved afterwards by the outer middleware.
+
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with contextlib.ExitStack() as stack:
+            request._reports_database = stack
+            return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None)
+        if not getattr(view_class, "reports_database", False):
+            return
+        if request.method not in ("GET", "HEAD"):
+            return
+        stack = getattr(request, "_reports_database", None)
+        if stack is not None:
+            stack.enter_context(routers.reports_database())
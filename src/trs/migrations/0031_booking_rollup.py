@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_booking_rollup(apps, schema_editor):
+    Booking = apps.get_model("trs", "Booking")
+    BookingRollup = apps.get_model("trs", "BookingRollup")
+    per_week = (
+        Booking.objects.filter(year_week__isnull=False)
+        .values("booked_by", "booked_on", "year_week")
+        .annotate(models.Sum("hours"))
+    )
+    BookingRollup.objects.bulk_create(
+        [
+            BookingRollup(
+                booked_by_id=item["booked_by"],
+                booked_on_id=item["booked_on"],
+                year_week_id=item["year_week"],
+                hours=item["hours__sum"],
+            )
+            for item in per_week
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trs", "0030_alter_workassignment_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookingRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hours", models.IntegerField(default=0)),
+                (
+                    "booked_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="trs.person",
+                    ),
+                ),
+                (
+                    "booked_on",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="trs.project",
+                    ),
+                ),
+                (
+                    "year_week",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="trs.yearweek",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "boekingstotaal per project per week",
+                "verbose_name_plural": "boekingstotalen per project per week",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("booked_by", "booked_on", "year_week"),
+                        name="unique_booking_rollup",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_booking_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:03
+
+from django.db import migrations, models
+
+
+def fill_year_and_week(apps, schema_editor):
+    BookingRollup = apps.get_model("trs", "BookingRollup")
+    YearWeek = apps.get_model("trs", "YearWeek")
+    year_week = YearWeek.objects.filter(pk=models.OuterRef("year_week"))
+    BookingRollup.objects.update(
+        year=models.Subquery(year_week.values("year")),
+        week=models.Subquery(year_week.values("week")),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trs", "0031_booking_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookingrollup",
+            name="week",
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="bookingrollup",
+            name="year",
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_year_and_week, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trs", "0032_booking_rollup_year_week"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "path",
+                    models.CharField(
+                        db_index=True, max_length=1000, verbose_name="url"
+                    ),
+                ),
+                (
+                    "filename",
+                    models.CharField(max_length=255, verbose_name="bestandsnaam"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "in de wachtrij"),
+                            ("running", "bezig"),
+                            ("done", "klaar"),
+                            ("failed", "mislukt"),
+                        ],
+                        default="queued",
+                        max_length=10,
+                        verbose_name="status",
+                    ),
+                ),
+                (
+                    "added",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="toegevoegd op"
+                    ),
+                ),
+                (
+                    "started",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="gestart op"
+                    ),
+                ),
+                (
+                    "duration",
+                    models.FloatField(blank=True, null=True, verbose_name="duur (s)"),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="foutmelding")),
+                (
+                    "requested_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="aangevraagd door",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "export",
+                "verbose_name_plural": "exports",
+                "ordering": ["-added"],
+            },
+        ),
+    ]
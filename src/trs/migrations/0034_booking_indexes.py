@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trs", "0033_export_job"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["booked_by", "year_week"], name="booking_person_week_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookingrollup",
+            index=models.Index(
+                fields=["booked_by", "year", "booked_on"], name="rollup_person_year_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookingrollup",
+            index=models.Index(fields=["year", "booked_by"], name="rollup_year_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="bookingrollup",
+            index=models.Index(
+                fields=["booked_on", "booked_by", "hours"], name="rollup_project_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="yearweek",
+            index=models.Index(fields=["year", "week"], name="year_week_idx"),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trs", "0034_booking_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="budgetitem",
+            name="last_modified",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="laatst gewijzigd",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="last_modified",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="laatst gewijzigd",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="payable",
+            name="last_modified",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="laatst gewijzigd",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="thirdpartyestimate",
+            name="last_modified",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="laatst gewijzigd",
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("trs", "0035_financial_last_modified"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exportjob",
+            name="admin_override",
+            field=models.BooleanField(
+                default=False,
+                help_text="De aanvrager had 'alles zien' aan staan",
+                verbose_name="admin ziet alles",
+            ),
+        ),
+    ]
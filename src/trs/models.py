@@ -1,16 +1,24 @@
+import bisect
+import collections
 import datetime
+import hashlib
 import logging
+import os
+import time
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.template.defaultfilters import date as datelocalizer
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from tls import request as tls_request
 
+from trs import caching
+
 # I use DecimalField for actual financial numbers, but not for targets and hourly
 # tariffs, those are integers. Financially, 999999.99 should be possible, so that's 8
 # digits with 2 decimal places.
@@ -38,14 +46,94 @@ def make_code_sortable(code):
         return code
 
 
+YEAR_WEEK_CALENDAR_VERSION_KEY = "year-week-calendar-version"
+YEAR_WEEK_CALENDAR_CHECK_INTERVAL = 300  # Seconds.
+
+
+class YearWeekCalendar:
+    """In-memory index of all the YearWeeks
+
+    The year weeks only change when ``bin/django update_weeks`` is run, so we
+    load them once per process instead of querying them over and over.
+    Treat the YearWeek objects as read-only.
+    """
+
+    def __init__(self, year_weeks, version=None):
+        self.version = version
+        self.year_weeks = sorted(year_weeks, key=lambda yw: (yw.year, yw.week))
+        self.by_id = {year_week.id: year_week for year_week in self.year_weeks}
+        self.by_year_and_week = {
+            (year_week.year, year_week.week): year_week for year_week in self.year_weeks
+        }
+        self.per_year = collections.defaultdict(list)
+        for year_week in self.year_weeks:
+            self.per_year[year_week.year].append(year_week)
+        # For for_date(): sorted first days and the latest (by year/week) year
+        # week that started on or before it.
+        self.first_days = []
+        self.latest_started = []
+        latest = None
+        for year_week in sorted(self.year_weeks, key=lambda yw: yw.first_day):
+            if latest is None or (year_week.year, year_week.week) > (
+                latest.year,
+                latest.week,
+            ):
+                latest = year_week
+            self.first_days.append(year_week.first_day)
+            self.latest_started.append(latest)
+
+    def get(self, id):
+        return self.by_id.get(id)
+
+    def get_by_year_and_week(self, year, week):
+        return self.by_year_and_week.get((int(year), int(week)))
+
+    def for_year(self, year):
+        """Return the year weeks of the year, in order."""
+        return self.per_year.get(int(year), [])
+
+    def for_date(self, date):
+        """Return the last year week that started on or before the date."""
+        index = bisect.bisect_right(self.first_days, date)
+        if not index:
+            return None
+        return self.latest_started[index - 1]
+
+
+_year_week_calendar = None
+_year_week_calendar_checked = 0
+
+
+def year_week_calendar():
+    """Return the process-wide YearWeekCalendar.
+
+    Other processes signal changes through a version number in the cache
+    (see ``reset_year_week_calendar()``), we look at that every couple of
+    minutes.
+    """
+    global _year_week_calendar, _year_week_calendar_checked
+    now = time.monotonic()
+    if (
+        _year_week_calendar is not None
+        and now - _year_week_calendar_checked < YEAR_WEEK_CALENDAR_CHECK_INTERVAL
+    ):
+        return _year_week_calendar
+    version = cache.get(YEAR_WEEK_CALENDAR_VERSION_KEY)
+    if _year_week_calendar is None or _year_week_calendar.version != version:
+        _year_week_calendar = YearWeekCalendar(YearWeek.objects.all(), version)
+    _year_week_calendar_checked = now
+    return _year_week_calendar
+
+
+def reset_year_week_calendar():
+    """Make all processes reload the calendar after YearWeek changes."""
+    global _year_week_calendar
+    cache.set(YEAR_WEEK_CALENDAR_VERSION_KEY, time.time(), None)
+    _year_week_calendar = None
+
+
 def this_year_week():
-    cache_key = "this-year-week2"
-    cached = cache.get(cache_key)
-    if cached is not None:
-        return cached
-    result = YearWeek.objects.filter(first_day__lte=datetime.date.today()).last()
-    cache.set(cache_key, result, 3600)
-    return result
+    return year_week_calendar().for_date(datetime.date.today())
 
 
 def this_year_week_pk():
@@ -60,29 +148,83 @@ def this_year_week_pk():
     return year_week.pk
 
 
+def to_book_summary(
+    hours_to_work, booked_this_year, hours_per_week, year_week, booked_this_week
+):
+    """Return the Person.to_book() dict for the already-queried numbers.
+
+    Split out so that ``core.bulk_pyc()`` can fill it in for many persons.
+    """
+    hours_to_book = max(0, (hours_to_work - booked_this_year))
+    days_to_book = round(hours_to_book / 8)  # Assumption: 8 hour workday.
+    if hours_per_week:
+        weeks_to_book = round(hours_to_book / hours_per_week)
+    else:  # Division by zero
+        weeks_to_book = 0
+
+    to_book_this_week = hours_per_week - 8 * year_week.num_days_missing
+    left_to_book_this_week = to_book_this_week - booked_this_week
+
+    if weeks_to_book > 1:
+        klass = "danger"
+        friendly = f"{weeks_to_book} weken"
+        short = f"{weeks_to_book}w"
+    elif weeks_to_book == 1:
+        klass = "warning"
+        friendly = f"{weeks_to_book} week"
+        short = f"{weeks_to_book}w"
+    elif days_to_book > 1:
+        klass = "warning"
+        friendly = f"{days_to_book} dagen"
+        short = f"{days_to_book}d"
+    elif days_to_book == 1:
+        klass = "warning"
+        friendly = f"{days_to_book} dag"
+        short = f"{days_to_book}d"
+    else:
+        klass = "success"
+        friendly = 0
+        short = ""
+    return {
+        "hours": hours_to_book,
+        "days": days_to_book,
+        "weeks": weeks_to_book,
+        "friendly": friendly,
+        "short": short,
+        "klass": klass,
+        "left_to_book_this_week": left_to_book_this_week,
+    }
+
+
 def cache_until_personchange_or_new_week(callable):
     # Note: cache refreshes less often than `@cache_until_any_change` because
     # we only look at person changes, not bookings or so.
     def inner(self, year_week=None):
-        cache_key = self.person_change_cache_key(callable.__name__, year_week)
-        result = cache.get(cache_key)
-        if result is None:
-            result = callable(self, year_week)
-            cache.set(cache_key, result)
-        return result
+        return caching.get_or_calculate(
+            self.person_change_cache_key(callable.__name__, year_week),
+            lambda: callable(self, year_week),
+            previous_key=self.person_change_cache_key(
+                callable.__name__, year_week, previous=True
+            ),
+        )
 
+    # For caching.prefetch()
+    inner.cache_key_for = lambda self: self.person_change_cache_key(callable.__name__)
+    inner.uncached = callable
     return inner
 
 
 def cache_until_any_change(callable):
     def inner(self):
-        cache_key = self.cache_key(callable.__name__)
-        result = cache.get(cache_key)
-        if result is None:
-            result = callable(self)
-            cache.set(cache_key, result)
-        return result
+        return caching.get_or_calculate(
+            self.cache_key(callable.__name__),
+            lambda: callable(self),
+            previous_key=self.cache_key(callable.__name__, previous=True),
+        )
 
+    # For caching.prefetch()
+    inner.cache_key_for = lambda self: self.cache_key(callable.__name__)
+    inner.uncached = callable
     return inner
 
 
@@ -90,16 +232,75 @@ def cache_until_any_change_or_new_week(callable):
     # Cache per person (so use the regular 'something changed' cache key. But
     # also differentiate per week. (Name should perhaps be different).
     def inner(self, year_week=None):
-        cache_key = self.cache_key(callable.__name__, year_week)
-        result = cache.get(cache_key)
-        if result is None:
-            result = callable(self, year_week)
-            cache.set(cache_key, result)
-        return result
+        return caching.get_or_calculate(
+            self.cache_key(callable.__name__, year_week),
+            lambda: callable(self, year_week),
+            previous_key=self.cache_key(callable.__name__, year_week, previous=True),
+        )
 
+    # For caching.prefetch()
+    inner.cache_key_for = lambda self: self.cache_key(callable.__name__)
+    inner.uncached = callable
     return inner
 
 
+def _increment_cache_indicators(model, objects, fields):
+    """Increment the cache indicator fields with one UPDATE query.
+
+    ``objects`` can be a queryset, objects or ids. In-memory objects get their
+    indicators incremented, too, so that their cache keys stay correct.
+    """
+    if isinstance(objects, models.QuerySet):
+        ids = objects.values("id")
+    else:
+        objects = [obj for obj in objects if obj is not None]
+        ids = [getattr(obj, "id", obj) for obj in objects]
+        for obj in objects:
+            if isinstance(obj, model):
+                for field in fields:
+                    setattr(obj, field, getattr(obj, field) + 1)
+    model.objects.filter(id__in=ids).update(
+        **{field: models.F(field) + 1 for field in fields}
+    )
+
+
+class CacheDependencies:
+    """Mixin for models whose fields are read by cached calculations elsewhere.
+
+    ``cache_dependencies`` lists those fields. ``save()`` only needs to
+    invalidate the depending caches if ``cache_dependencies_changed()``:
+    editing a remark or a description shouldn't throw away the costly
+    calculations of all the persons on a project.
+
+    """
+
+    cache_dependencies = []
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Like Booking: remember what's in the database.
+        loaded = dict(zip(field_names, values))
+        instance._dependencies_in_database = {
+            name: loaded[name] for name in cls.cache_dependencies if name in loaded
+        }
+        return instance
+
+    def cache_dependencies_changed(self):
+        if not self.cache_dependencies:
+            return False
+        in_database = getattr(self, "_dependencies_in_database", None)
+        if in_database is None or len(in_database) < len(self.cache_dependencies):
+            # New, or loaded with .only(): assume the worst.
+            return True
+        return any(getattr(self, name) != value for name, value in in_database.items())
+
+    def remember_cache_dependencies(self):
+        self._dependencies_in_database = {
+            name: getattr(self, name) for name in self.cache_dependencies
+        }
+
+
 class Group(models.Model):
     name = models.CharField(verbose_name="naam", max_length=255)
     description = models.CharField(
@@ -200,18 +401,39 @@ class Person(models.Model):
         self.cache_indicator += 1
         return super().save(*args, **kwargs)
 
+    @classmethod
+    def invalidate(cls, persons, person_change=False):
+        """Make the cached data of the persons outdated.
+
+        Much cheaper than a full ``.save()``. ``person_change`` is for changes
+        to hours per week and so.
+        """
+        fields = ["cache_indicator"]
+        if person_change:
+            fields.append("cache_indicator_person_change")
+        _increment_cache_indicators(cls, persons, fields)
+
     def __str__(self):
         return self.name
 
-    def cache_key(self, for_what, year_week=None):
+    def cache_key(self, for_what, year_week=None, previous=False):
+        # previous=True: the key before the last invalidate().
         cache_version = 12
         week_id = year_week and year_week.id or this_year_week().id
-        return f"person-{self.id}-{self.cache_indicator}-{for_what}-{week_id}-{cache_version}"
+        cache_indicator = self.cache_indicator - 1 if previous else self.cache_indicator
+        return (
+            f"person-{self.id}-{cache_indicator}-{for_what}-{week_id}-{cache_version}"
+        )
 
-    def person_change_cache_key(self, for_what, year_week=None):
+    def person_change_cache_key(self, for_what, year_week=None, previous=False):
         cache_version = 6
         week_id = year_week and year_week.id or this_year_week().id
-        return f"person-{self.id}-pc{self.cache_indicator_person_change}-{for_what}-{week_id}-{cache_version}"
+        cache_indicator = self.cache_indicator_person_change
+        if previous:
+            cache_indicator -= 1
+        return (
+            f"person-{self.id}-pc{cache_indicator}-{for_what}-{week_id}-{cache_version}"
+        )
 
     def get_absolute_url(self):
         return reverse("trs.person", kwargs={"pk": self.pk})
@@ -231,6 +453,21 @@ class Person(models.Model):
             or 0
         )
 
+    @classmethod
+    def bulk_hours_per_week(cls, persons):
+        """Return {person id: hours_per_week()} for all persons at once."""
+        persons = list(persons)
+        hours_per_week = dict(
+            PersonChange.objects.filter(
+                person__in=[person.id for person in persons],
+                year_week__lte=this_year_week(),
+            )
+            .values_list("person")
+            .annotate(models.Sum("hours_per_week"))
+            .order_by()
+        )
+        return {person.id: hours_per_week.get(person.id) or 0 for person in persons}
+
     @cache_until_personchange_or_new_week
     def standard_hourly_tariff(self, year_week=None):
         if year_week is None:
@@ -253,7 +490,9 @@ class Person(models.Model):
             or 0
         )
 
-    @cache_until_any_change
+    # The assigned project lists aren't cached: a cached queryset would keep
+    # outdated copies of the projects. And they're one simple query anyway.
+
     def filtered_assigned_projects(self):
         """Return active projects: unarchived and not over the end date."""
         return Project.objects.filter(
@@ -262,7 +501,6 @@ class Person(models.Model):
             end__gte=this_year_week(),
         ).distinct()
 
-    @cache_until_any_change
     def unarchived_assigned_projects(self):
         """Return assigned projects that aren't archived.
 
@@ -272,7 +510,6 @@ class Person(models.Model):
             work_assignments__assigned_to=self, archived=False
         ).distinct()
 
-    @cache_until_any_change
     def assigned_projects(self):
         """Return all assigned projects."""
         return Project.objects.filter(work_assignments__assigned_to=self).distinct()
@@ -303,11 +540,13 @@ class Person(models.Model):
         result = 0
         # Grab week numbers. "lt" isn't "lte" as we want to exclude the
         # current week. You only have to book on friday!
-        year_weeks = YearWeek.objects.filter(
-            year=year_week.year, week__lt=year_week.week
-        ).values("week", "num_days_missing")
-        week_numbers = [item["week"] for item in year_weeks]
-        missing_days = sum([item["num_days_missing"] for item in year_weeks])
+        year_weeks = [
+            item
+            for item in year_week_calendar().for_year(year_week.year)
+            if item.week < year_week.week
+        ]
+        week_numbers = [item.week for item in year_weeks]
+        missing_days = sum([item.num_days_missing for item in year_weeks])
         for week in week_numbers:
             if week in changes_per_week:
                 hours_per_week += changes_per_week[week]
@@ -325,59 +564,111 @@ class Person(models.Model):
         # ^^^ Doesn't include the current week, so we don't count bookings in
         # this week, too.
         booked_this_year = (
-            self.bookings.filter(
-                year_week__year=this_year, year_week__week__lt=year_week.week
+            booked_hours(
+                booked_by=self, year=this_year, week__lt=year_week.week
             ).aggregate(models.Sum("hours"))["hours__sum"]
             or 0
         )
-        hours_to_book = max(0, (hours_to_work - booked_this_year))
-        days_to_book = round(hours_to_book / 8)  # Assumption: 8 hour workday.
-        if self.hours_per_week():
-            weeks_to_book = round(hours_to_book / self.hours_per_week())
-        else:  # Division by zero
-            weeks_to_book = 0
-
-        to_book_this_week = self.hours_per_week() - 8 * year_week.num_days_missing
         booked_this_week = (
-            self.bookings.filter(year_week=year_week).aggregate(models.Sum("hours"))[
-                "hours__sum"
-            ]
+            booked_hours(booked_by=self, year=this_year, week=year_week.week).aggregate(
+                models.Sum("hours")
+            )["hours__sum"]
             or 0
         )
-        left_to_book_this_week = to_book_this_week - booked_this_week
-
-        if weeks_to_book > 1:
-            klass = "danger"
-            friendly = f"{weeks_to_book} weken"
-            short = f"{weeks_to_book}w"
-        elif weeks_to_book == 1:
-            klass = "warning"
-            friendly = f"{weeks_to_book} week"
-            short = f"{weeks_to_book}w"
-        elif days_to_book > 1:
-            klass = "warning"
-            friendly = f"{days_to_book} dagen"
-            short = f"{days_to_book}d"
-        elif days_to_book == 1:
-            klass = "warning"
-            friendly = f"{days_to_book} dag"
-            short = f"{days_to_book}d"
-        else:
-            klass = "success"
-            friendly = 0
-            short = ""
-        return {
-            "hours": hours_to_book,
-            "days": days_to_book,
-            "weeks": weeks_to_book,
-            "friendly": friendly,
-            "short": short,
-            "klass": klass,
-            "left_to_book_this_week": left_to_book_this_week,
+        return to_book_summary(
+            hours_to_work,
+            booked_this_year,
+            self.hours_per_week(),
+            year_week,
+            booked_this_week,
+        )
+
+    @classmethod
+    def bulk_to_book(cls, persons):
+        """Return {person id: to_book()} for all persons at once.
+
+        Like ``Project.bulk_work_calculation()``: a handful of grouped queries
+        instead of five queries per person. Used by ``caching.prefetch()``.
+
+        """
+        persons = list(persons)
+        person_ids = [person.id for person in persons]
+        year_week = this_year_week()
+        this_year = year_week.year
+        # Like in to_work_up_till_now(): not including the current week.
+        year_weeks = [
+            item
+            for item in year_week_calendar().for_year(this_year)
+            if item.week < year_week.week
+        ]
+        missing_days = sum([item.num_days_missing for item in year_weeks])
+
+        hours_per_week_sums = {
+            item["person"]: item
+            for item in PersonChange.objects.filter(person__in=person_ids)
+            .values("person")
+            .annotate(
+                before_this_year=models.Sum(
+                    "hours_per_week", filter=models.Q(year_week__year__lt=this_year)
+                ),
+                now=models.Sum(
+                    "hours_per_week", filter=models.Q(year_week__lte=year_week)
+                ),
+            )
+            .order_by()
         }
+        changes_per_week = collections.defaultdict(dict)
+        for item in (
+            PersonChange.objects.filter(
+                person__in=person_ids,
+                year_week__year=this_year,
+                year_week__week__lt=year_week.week,
+            )
+            .values("person", "year_week__week")
+            .annotate(models.Sum("hours_per_week"))
+            .order_by()
+        ):
+            changes_per_week[item["person"]][item["year_week__week"]] = item[
+                "hours_per_week__sum"
+            ]
+        booked_this_year = {
+            item["booked_by"]: item["hours__sum"]
+            for item in booked_hours(
+                booked_by__in=person_ids, year=this_year, week__lt=year_week.week
+            )
+            .values("booked_by")
+            .annotate(models.Sum("hours"))
+            .order_by()
+        }
+        booked_this_week = {
+            item["booked_by"]: item["hours__sum"]
+            for item in booked_hours(
+                booked_by__in=person_ids, year=this_year, week=year_week.week
+            )
+            .values("booked_by")
+            .annotate(models.Sum("hours"))
+            .order_by()
+        }
+
+        result = {}
+        for person in persons:
+            sums = hours_per_week_sums.get(person.id, {})
+            hours_per_week = sums.get("before_this_year") or 0
+            hours_to_work = 0
+            for item in year_weeks:
+                hours_per_week += changes_per_week[person.id].get(item.week, 0)
+                hours_to_work += hours_per_week
+            result[person.id] = to_book_summary(
+                max(0, hours_to_work - missing_days * 8),
+                booked_this_year.get(person.id) or 0,
+                sums.get("now") or 0,
+                year_week,
+                booked_this_week.get(person.id) or 0,
+            )
+        return result
 
 
-class Project(models.Model):
+class Project(CacheDependencies, models.Model):
     code = models.CharField(verbose_name="projectcode", unique=True, max_length=255)
     code_for_sorting = models.CharField(
         editable=False, blank=True, null=True, max_length=255
@@ -562,10 +853,16 @@ class Project(models.Model):
         verbose_name_plural = "projecten"
         ordering = ("internal", "-code_for_sorting")
 
+    # The pycs of the assigned persons filter and split the projects on these.
+    # Our own cached methods (the widget!) are invalidated on every save.
+    cache_dependencies = ["start_id", "end_id", "internal", "hourless"]
+
     def save(self, *args, **kwargs):
         self.cache_indicator += 1
         self.code_for_sorting = make_code_sortable(self.code)
+        invalidate_persons = self.cache_dependencies_changed()
         result = super().save(*args, **kwargs)
+        self.remember_cache_dependencies()
         # We need to be saved before adding foreign keys to ourselves.
         if tls_request:
             # If not tls_request, we're in some automated import loop.
@@ -578,10 +875,25 @@ class Project(models.Model):
                         hourly_tariff=person.standard_hourly_tariff(),
                     )
                     work_assignment.save(save_assigned_on=False)
-        for person in self.assigned_persons():
-            person.save()  # Increment cache key
+        if invalidate_persons:
+            Person.invalidate(self.assigned_persons())
         return result
 
+    @classmethod
+    def invalidate(cls, projects, cascade=False):
+        """Make the cached data of the projects outdated.
+
+        Much cheaper than a full ``.save()``. With ``cascade``, the assigned
+        persons are invalidated, too.
+        """
+        _increment_cache_indicators(cls, projects, ["cache_indicator"])
+        if cascade:
+            Person.invalidate(
+                WorkAssignment.objects.filter(
+                    assigned_on__in=[getattr(p, "id", p) for p in projects]
+                ).values("assigned_to")
+            )
+
     def __str__(self):
         return self.code
 
@@ -591,9 +903,11 @@ class Project(models.Model):
     def get_absolute_url(self):
         return reverse("trs.project", kwargs={"pk": self.pk})
 
-    def cache_key(self, for_what):
+    def cache_key(self, for_what, previous=False):
+        # previous=True: the key before the last invalidate().
         cache_version = 21
-        return f"project-{self.id}-{self.cache_indicator}-{for_what}-{cache_version}"
+        cache_indicator = self.cache_indicator - 1 if previous else self.cache_indicator
+        return f"project-{self.id}-{cache_indicator}-{for_what}-{cache_version}"
 
     @cache_until_any_change
     def as_widget(self):
@@ -700,20 +1014,12 @@ class Project(models.Model):
     @cache_until_any_change
     def work_calculation(self):
         # The big calculation from which the rest derives.
-        relevant_work_assignments = WorkAssignment.objects.filter(
-            assigned_on=self
-        ).values("assigned_to", "hours", "hourly_tariff")
-        budget_per_person = {
-            item["assigned_to"]: item["hours"] for item in relevant_work_assignments
-        }
-        hourly_tariff_per_person = {
-            item["assigned_to"]: item["hourly_tariff"]
-            for item in relevant_work_assignments
-        }
-        ids = budget_per_person.keys()
-
+        work_assignments = WorkAssignment.objects.filter(assigned_on=self).values(
+            "assigned_to", "hours", "hourly_tariff"
+        )
+        ids = [item["assigned_to"] for item in work_assignments]
         booked_this_year_per_person = (
-            Booking.objects.filter(booked_on=self, booked_by__in=ids)
+            booked_hours(booked_on=self, booked_by__in=ids)
             .values("booked_by")
             .annotate(models.Sum("hours"))
         )
@@ -721,26 +1027,118 @@ class Project(models.Model):
             item["booked_by"]: item["hours__sum"]
             for item in booked_this_year_per_person
         }
+        third_party_costs = (
+            self.third_party_estimates.all().aggregate(models.Sum("amount"))[
+                "amount__sum"
+            ]
+            or 0
+        )
+        return self._calculate_work(
+            work_assignments,
+            total_booked_per_person,
+            [budget_item.amount for budget_item in self.budget_items.all()],
+            [budget_item.amount for budget_item in self.budget_transfers.all()],
+            third_party_costs,
+        )
+
+    @classmethod
+    def bulk_work_calculation(cls, projects):
+        """Return {project id: work_calculation()} for all projects at once.
+
+        Instead of five queries per project, this does one grouped query per
+        source table. Used by ``caching.prefetch()`` for the cache misses.
+
+        """
+        projects = list(projects)
+        project_ids = [project.id for project in projects]
+
+        work_assignments = collections.defaultdict(list)
+        for item in WorkAssignment.objects.filter(assigned_on__in=project_ids).values(
+            "assigned_on", "assigned_to", "hours", "hourly_tariff"
+        ):
+            work_assignments[item["assigned_on"]].append(item)
+
+        total_booked = collections.defaultdict(dict)
+        for item in (
+            booked_hours(booked_on__in=project_ids)
+            .values("booked_on", "booked_by")
+            .annotate(models.Sum("hours"))
+            .order_by()
+        ):
+            total_booked[item["booked_on"]][item["booked_by"]] = item["hours__sum"]
+
+        budget_amounts = collections.defaultdict(list)
+        for item in BudgetItem.objects.filter(project__in=project_ids).values(
+            "project", "amount"
+        ):
+            budget_amounts[item["project"]].append(item["amount"])
+
+        transfer_amounts = collections.defaultdict(list)
+        for item in BudgetItem.objects.filter(to_project__in=project_ids).values(
+            "to_project", "amount"
+        ):
+            transfer_amounts[item["to_project"]].append(item["amount"])
+
+        third_party_costs = {
+            item["project"]: item["amount__sum"] or 0
+            for item in ThirdPartyEstimate.objects.filter(project__in=project_ids)
+            .values("project")
+            .annotate(models.Sum("amount"))
+            .order_by()
+        }
+
+        result = {}
+        for project in projects:
+            assignments = work_assignments[project.id]
+            ids = {item["assigned_to"] for item in assignments}
+            # Bookings by persons that aren't assigned (anymore) don't count.
+            total_booked_per_person = {
+                id: hours for id, hours in total_booked[project.id].items() if id in ids
+            }
+            result[project.id] = project._calculate_work(
+                assignments,
+                total_booked_per_person,
+                budget_amounts[project.id],
+                transfer_amounts[project.id],
+                third_party_costs.get(project.id, 0),
+            )
+        return result
+
+    def _calculate_work(
+        self,
+        work_assignments,
+        total_booked_per_person,
+        budget_amounts,
+        transfer_amounts,
+        third_party_costs,
+    ):
+        budget_per_person = {
+            item["assigned_to"]: item["hours"] for item in work_assignments
+        }
+        hourly_tariff_per_person = {
+            item["assigned_to"]: item["hourly_tariff"] for item in work_assignments
+        }
+        ids = budget_per_person.keys()
 
         costs = 0
         income = 0
         transferred_to_us = 0  # Only used for net_contract_amount
         # Note: a positive budget item is a cost.
-        for budget_item in self.budget_items.all():
-            if budget_item.amount > 0:
-                costs += budget_item.amount
+        for amount in budget_amounts:
+            if amount > 0:
+                costs += amount
             else:
-                income += budget_item.amount * -1
-        for budget_item in self.budget_transfers.all():
+                income += amount * -1
+        for amount in transfer_amounts:
             # budget_transfers are the reverse of budget_items, pointing at
             # us, so a positive budget transfer counts as an income rather
             # than a cost.
-            if budget_item.amount > 0:
-                income += budget_item.amount
-                transferred_to_us += budget_item.amount
+            if amount > 0:
+                income += amount
+                transferred_to_us += amount
             else:
-                costs += budget_item.amount * -1
-                transferred_to_us += budget_item.amount * -1
+                costs += amount * -1
+                transferred_to_us += amount * -1
 
         # Note: payables ('facturen kosten derden') are treated separately
         # now.
@@ -782,12 +1180,6 @@ class Project(models.Model):
         else:
             realized_average_tariff = 0
 
-        third_party_costs = (
-            self.third_party_estimates.all().aggregate(models.Sum("amount"))[
-                "amount__sum"
-            ]
-            or 0
-        )
         net_contract_amount = (
             self.contract_amount - third_party_costs + transferred_to_us
         )
@@ -835,7 +1227,7 @@ class WbsoProject(models.Model):
         return f"{self.number}: {self.title}"
 
 
-class FinancialBase(models.Model):
+class FinancialBase(CacheDependencies, models.Model):
     added = models.DateTimeField(auto_now_add=True, verbose_name="toegevoegd op")
     added_by = models.ForeignKey(
         User,
@@ -845,11 +1237,18 @@ class FinancialBase(models.Model):
         on_delete=models.CASCADE,
     )
     # ^^^ The two above are copied from EventBase.
+    last_modified = models.DateTimeField(auto_now=True, verbose_name="laatst gewijzigd")
+    # ^^^ For data_version(), not every change invalidates the project.
 
     class Meta:
         abstract = True
         ordering = ["project", "added"]
 
+    # Fields that Project.work_calculation() reads, if any.
+    cache_dependencies = []
+    # The projects whose work_calculation() we're in.
+    project_fields = ["project_id"]
+
     def save(self, *args, **kwargs):
         # Partially copied form EventBase.
         if not self.added_by:
@@ -857,10 +1256,26 @@ class FinancialBase(models.Model):
                 # If tls_request doesn't exist we're running tests. Adding
                 # this 'if' is handier than mocking it the whole time :-)
                 self.added_by = tls_request.user
-        self.project.save()
-        # ^^^ Project is available on subclasses. This increments the cache
-        # key.
-        return super().save(*args, **kwargs)
+        if self.cache_dependencies_changed():
+            Project.invalidate(self.project_ids_to_invalidate())
+        result = super().save(*args, **kwargs)
+        self.remember_cache_dependencies()
+        return result
+
+    def delete(self, *args, **kwargs):
+        if self.cache_dependencies:
+            Project.invalidate(self.project_ids_to_invalidate())
+        return super().delete(*args, **kwargs)
+
+    def project_ids_to_invalidate(self):
+        """Return ids of our projects, including the ones we're moved away from"""
+        in_database = getattr(self, "_dependencies_in_database", None) or {}
+        return {
+            project_id
+            for name in self.project_fields
+            for project_id in [getattr(self, name), in_database.get(name)]
+            if project_id is not None
+        }
 
 
 class Invoice(FinancialBase):
@@ -991,6 +1406,9 @@ class BudgetItem(FinancialBase):
         verbose_name = "projectkostenpost"
         verbose_name_plural = "projectkostenposten"
 
+    cache_dependencies = ["project_id", "to_project_id", "amount"]
+    project_fields = ["project_id", "to_project_id"]
+
     def __str__(self):
         return self.description
 
@@ -1003,16 +1421,6 @@ class BudgetItem(FinancialBase):
             kwargs={"pk": self.pk, "project_pk": self.project.pk},
         )
 
-    def save(self, *args, **kwargs):
-        if self.to_project:
-            self.to_project.save()  # Increment cache key.
-        return super().save(*args, **kwargs)
-
-    def delete(self, *args, **kwargs):
-        if self.to_project:
-            self.to_project.save()  # Increment cache key.
-        return super().delete(*args, **kwargs)
-
 
 class ThirdPartyEstimate(FinancialBase):
     project = models.ForeignKey(
@@ -1034,6 +1442,8 @@ class ThirdPartyEstimate(FinancialBase):
         verbose_name = "kosten derden"
         verbose_name_plural = "kosten derden"
 
+    cache_dependencies = ["project_id", "amount"]
+
     def __str__(self):
         return self.description
 
@@ -1057,6 +1467,7 @@ class YearWeek(models.Model):
         verbose_name = "jaar/week combinatie"
         verbose_name_plural = "jaar/week combinaties"
         ordering = ["year", "week"]
+        indexes = [models.Index(fields=["year", "week"], name="year_week_idx")]
 
     def __str__(self):
         return f"{self.formatted_first_day} (week {self.week:02d})"
@@ -1144,8 +1555,7 @@ class PersonChange(EventBase):
     )
 
     def save(self, *args, **kwargs):
-        self.person.cache_indicator_person_change += 1  # Specially for us.
-        self.person.save()  # Increments cache indicator.
+        Person.invalidate([self.person], person_change=True)
         return super().save(*args, **kwargs)
 
     def __str__(self):
@@ -1203,13 +1613,217 @@ class Booking(models.Model):
                 fields=["booked_by", "booked_on", "date"], name="unique_booking_per_day"
             ),
         ]
+        indexes = [
+            # The booking page: one person, a couple of weeks.
+            models.Index(
+                fields=["booked_by", "year_week"], name="booking_person_week_idx"
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what's in the database for the booking rollup.
+        loaded = dict(zip(field_names, values))
+        instance._in_database = [
+            loaded.get(field_name) for field_name in BOOKING_TOTALS_FIELDS
+        ]
+        return instance
+
+    def totals_deltas(self, deleted=False):
+        """Return changes for record_booking_deltas() since loading us."""
+        deltas = []
+        in_database = getattr(self, "_in_database", None)
+        if in_database is not None:
+            *key, hours = in_database
+            deltas.append((*key, -hours))
+        if not deleted:
+            *key, hours = [getattr(self, name) for name in BOOKING_TOTALS_FIELDS]
+            deltas.append((*key, hours))
+        return deltas
 
     def save(self, *args, **kwargs):
-        self.booked_by.save()  # Increments cache indicator.
-        self.booked_on.save()  # Increments cache indicator.
+        Person.invalidate([self.booked_by])
+        Project.invalidate([self.booked_on])
         if not self.date:
             self.date = self.year_week.first_day
-        return super().save(*args, **kwargs)
+        with transaction.atomic():
+            result = super().save(*args, **kwargs)
+            record_booking_deltas(self.totals_deltas())
+        self._in_database = [getattr(self, name) for name in BOOKING_TOTALS_FIELDS]
+        return result
+
+
+# Booking fields that matter for the rollup below, hours should be last.
+BOOKING_TOTALS_FIELDS = ["booked_by_id", "booked_on_id", "year_week_id", "hours"]
+
+
+class BookingRollup(models.Model):
+    """Booked hours per person per project per week
+
+    Kept up to date by ``record_booking_deltas()``, so within the same
+    transaction as the booking changes. Reports and calculations that only need
+    hours per person/project/week should use this instead of the (per-day and
+    ever-growing) booking table. ``bin/django rebuild_booking_totals``
+    verifies it against the bookings.
+
+    ``year`` and ``week`` are copied from ``year_week`` to prevent joins.
+    """
+
+    booked_by = models.ForeignKey(
+        Person, null=True, related_name="+", on_delete=models.CASCADE
+    )
+    booked_on = models.ForeignKey(
+        Project, null=True, related_name="+", on_delete=models.CASCADE
+    )
+    year_week = models.ForeignKey(YearWeek, related_name="+", on_delete=models.CASCADE)
+    year = models.IntegerField()
+    week = models.IntegerField()
+    hours = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "boekingstotaal per project per week"
+        verbose_name_plural = "boekingstotalen per project per week"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["booked_by", "booked_on", "year_week"],
+                name="unique_booking_rollup",
+            ),
+        ]
+        indexes = [
+            # Per person per year (the pycs), per year (the overviews) and per
+            # project (the project calculations). test_query_plans.py checks
+            # that the hot queries use them.
+            models.Index(
+                fields=["booked_by", "year", "booked_on"], name="rollup_person_year_idx"
+            ),
+            models.Index(fields=["year", "booked_by"], name="rollup_year_idx"),
+            models.Index(
+                fields=["booked_on", "booked_by", "hours"], name="rollup_project_idx"
+            ),
+        ]
+
+
+def _apply_deltas(model, key_fields, deltas, extra_fields=None):
+    """Add the ``{key: hours}`` deltas to the totals with a fixed number of queries.
+
+    Read-modify-write is fine as our sqlite transactions are IMMEDIATE: we
+    have the write lock from the start.
+    """
+    deltas = {key: hours for key, hours in deltas.items() if hours}
+    if not deltas:
+        return
+    filters = models.Q()
+    for index, field in enumerate(key_fields):
+        values = {key[index] for key in deltas}
+        field_filter = models.Q(**{f"{field}__in": values - {None}})
+        if None in values:
+            field_filter |= models.Q(**{f"{field}__isnull": True})
+        filters &= field_filter
+    existing = {
+        tuple(getattr(total, field) for field in key_fields): total
+        for total in model.objects.filter(filters)
+    }
+    to_update = []
+    to_create = []
+    for key, hours in deltas.items():
+        if key in existing:
+            total = existing[key]
+            total.hours += hours
+            to_update.append(total)
+        elif hours > 0:
+            # A negative delta without a total happens when the person or
+            # project is being deleted, the totals are gone already.
+            extra = extra_fields(key) if extra_fields else {}
+            to_create.append(model(hours=hours, **dict(zip(key_fields, key)), **extra))
+    model.objects.bulk_update(to_update, ["hours"])
+    model.objects.bulk_create(to_create)
+
+
+def record_booking_deltas(deltas):
+    """Apply booking hour changes to the booking rollup.
+
+    ``deltas`` are ``(booked_by_id, booked_on_id, year_week_id, hours)``
+    tuples, see ``Booking.totals_deltas()``. Call it within the transaction
+    that changes the bookings. The number of queries doesn't depend on the
+    number of deltas.
+    """
+    per_project_per_week = collections.Counter()
+    for booked_by_id, booked_on_id, year_week_id, hours in deltas:
+        if year_week_id is None or not hours:
+            # Bookings without year week aren't part of the rollup.
+            continue
+        per_project_per_week[(booked_by_id, booked_on_id, year_week_id)] += hours
+
+    calendar = year_week_calendar()
+    year_weeks = {key[2]: calendar.get(key[2]) for key in per_project_per_week}
+    missing = [id for id, year_week in year_weeks.items() if year_week is None]
+    if missing:
+        # Added after this process loaded its calendar (that's only checked
+        # every couple of minutes), so ask the database.
+        year_weeks.update(YearWeek.objects.in_bulk(missing))
+
+    def year_and_week(key):
+        year_week = year_weeks[key[2]]
+        return {"year": year_week.year, "week": year_week.week}
+
+    with transaction.atomic():
+        _apply_deltas(
+            BookingRollup,
+            ["booked_by_id", "booked_on_id", "year_week_id"],
+            per_project_per_week,
+            extra_fields=year_and_week,
+        )
+
+
+def save_bookings(person, year_week, hours_per_project_and_date):
+    """Store the hours of a booking grid, ``{(project, date): hours}``.
+
+    Unlike saving the bookings one by one, this uses a fixed number of
+    queries: one upsert for the bookings, the booking rollup and one
+    invalidation for the person and one for the projects. (Booking.save()
+    does all that for every single booking).
+    """
+    if not hours_per_project_and_date:
+        return
+    projects = {project.id: project for project, _ in hours_per_project_and_date}
+    dates = {date for _, date in hours_per_project_and_date}
+    with transaction.atomic():
+        existing = {
+            (booking.booked_on_id, booking.date): booking
+            for booking in Booking.objects.filter(
+                booked_by=person, booked_on__in=projects, date__in=dates
+            )
+        }
+        bookings = []
+        deltas = []
+        for (project, date), hours in hours_per_project_and_date.items():
+            booking = existing.get((project.id, date))
+            if booking is None:
+                booking = Booking(booked_by=person, booked_on=project, date=date)
+            booking.year_week = year_week
+            booking.hours = hours
+            deltas += booking.totals_deltas()
+            bookings.append(booking)
+        Booking.objects.bulk_create(
+            bookings,
+            update_conflicts=True,
+            unique_fields=["booked_by", "booked_on", "date"],
+            update_fields=["hours", "year_week"],
+        )
+        record_booking_deltas(deltas)
+        Person.invalidate([person])
+        Project.invalidate(projects.values())
+
+
+def booked_hours(**filters):
+    """Return queryset with ``hours`` to sum for the given booking filters.
+
+    Filters use the field names of the booking rollup (``booked_by``,
+    ``booked_on``, ``year``, ``week``). The rollup is much smaller than the
+    booking table, it has one row per person, project and week.
+    """
+    return BookingRollup.objects.filter(**filters)
 
 
 class WorkAssignment(models.Model):
@@ -1250,7 +1864,142 @@ class WorkAssignment(models.Model):
         ]
 
     def save(self, save_assigned_on=True, *args, **kwargs):
-        self.assigned_to.save()  # Increments cache indicator.
+        Person.invalidate([self.assigned_to])
         if save_assigned_on:
-            self.assigned_on.save()  # Increments cache indicator.
+            Project.invalidate([self.assigned_on])
         return super().save(*args, **kwargs)
+
+
+def data_version():
+    """Return string that changes whenever data the exports use changes.
+
+    Every booking, work assignment and so bumps the cache indicator of its
+    person or project, so their sums (plus counts and the last modification
+    time for additions, removals and direct edits) act as a watermark.
+    Invoices, payables and so only invalidate a project when a cached
+    calculation depends on the change, so we look at their counts and last
+    modification times, too. Groups, mpcs and wbso projects have no cache
+    indicator, but they're small, so we just look at their values.
+
+    """
+    watermarks = {
+        "id__count": models.Count("id"),
+        "id__max": models.Max("id"),
+        "last_modified__max": models.Max("last_modified"),
+    }
+    parts = [
+        Person.objects.aggregate(
+            models.Sum("cache_indicator"),
+            models.Sum("cache_indicator_person_change"),
+            **watermarks,
+        ),
+        Project.objects.aggregate(models.Sum("cache_indicator"), **watermarks),
+        *[
+            model.objects.aggregate(**watermarks)
+            for model in [Invoice, Payable, BudgetItem, ThirdPartyEstimate]
+        ],
+        list(Group.objects.values_list("id", "name", "target")),
+        list(MPC.objects.values_list("id", "name", "target")),
+        list(WbsoProject.objects.values_list("id", "number", "title")),
+    ]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+class ExportJob(models.Model):
+    """Excel export that is generated by the ``run_export_jobs`` worker.
+
+    The path (including the query string) of the original export url tells
+    the worker what to generate, as the user that requested it. What the view
+    shows can also depend on the superuser's "see everything" session flag,
+    so we store that, too. Identical requests of the same user that come in
+    while a job is still queued or running get that same job.
+
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "in de wachtrij"),
+        (RUNNING, "bezig"),
+        (DONE, "klaar"),
+        (FAILED, "mislukt"),
+    ]
+
+    path = models.CharField(verbose_name="url", max_length=1000, db_index=True)
+    filename = models.CharField(verbose_name="bestandsnaam", max_length=255)
+    requested_by = models.ForeignKey(
+        User,
+        blank=True,
+        null=True,
+        verbose_name="aangevraagd door",
+        related_name="+",
+        on_delete=models.SET_NULL,
+    )
+    admin_override = models.BooleanField(
+        verbose_name="admin ziet alles",
+        default=False,
+        help_text="De aanvrager had 'alles zien' aan staan",
+    )
+    status = models.CharField(
+        verbose_name="status", max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    added = models.DateTimeField(auto_now_add=True, verbose_name="toegevoegd op")
+    started = models.DateTimeField(blank=True, null=True, verbose_name="gestart op")
+    duration = models.FloatField(blank=True, null=True, verbose_name="duur (s)")
+    error = models.TextField(blank=True, verbose_name="foutmelding")
+
+    class Meta:
+        verbose_name = "export"
+        verbose_name_plural = "exports"
+        ordering = ["-added"]
+
+    def __str__(self):
+        return f"{self.filename} ({self.get_status_display()})"
+
+    def get_absolute_url(self):
+        return reverse("trs.export_job", kwargs={"pk": self.pk})
+
+    @property
+    def file_path(self):
+        return os.path.join(settings.TRS_EXPORT_DIR, f"{self.id}.xlsx")
+
+    @property
+    def is_pending(self):
+        return self.status in [self.QUEUED, self.RUNNING]
+
+    @classmethod
+    def enqueue(cls, path, filename, user, admin_override=False):
+        """Return pending job for the path, add a new one if needed."""
+        # The file depends on the user's permissions, so we don't share jobs
+        # between users.
+        requested = {
+            "path": path,
+            "requested_by": user,
+            "admin_override": admin_override,
+        }
+        # Note: with sqlite's IMMEDIATE transaction mode, a concurrent request
+        # can't insert the same job in between.
+        with transaction.atomic():
+            job = cls.objects.filter(
+                **requested, status__in=[cls.QUEUED, cls.RUNNING]
+            ).first()
+            if job is None:
+                job = cls.objects.create(filename=filename, **requested)
+        return job
+
+    @property
+    def session(self):
+        """Return the session state the export view needs."""
+        return {"admin_override_active": self.admin_override}
+
+    def claim(self):
+        """Mark the job as running, return False if another worker was first."""
+        self.started = datetime.datetime.now()
+        claimed = ExportJob.objects.filter(id=self.id, status=self.QUEUED).update(
+            status=self.RUNNING, started=self.started
+        )
+        if claimed:
+            self.status = self.RUNNING
+        return bool(claimed)
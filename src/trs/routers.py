@@ -0,0 +1,57 @@
+"""Let reports read through a read-only connection.
+
+All connections to the sqlite database compete for the single write lock
+(``transaction_mode: IMMEDIATE``). Long-running reports (the excel exports,
+the persons overview, the financial overviews) only read, so they use the
+``reports`` database alias instead: the same file, opened with ``mode=ro``
+and ``PRAGMA query_only``. In WAL mode readers never wait for the writer, so
+booking saves stay fast while an export runs.
+
+Report views set ``reports_database = True``, the
+``ReportsDatabaseMiddleware`` then routes their reads with
+``reports_database()``. The ``run_export_jobs`` worker does the same. Writes
+always go to the default database.
+
+"""
+
+import contextlib
+import contextvars
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPORTS_DB_ALIAS = "reports"
+
+_use_reports_database = contextvars.ContextVar("use_reports_database", default=False)
+
+
+@contextlib.contextmanager
+def reports_database():
+    """Route reads within the block to the read-only database (if configured)."""
+    token = _use_reports_database.set(True)
+    try:
+        yield
+    finally:
+        _use_reports_database.reset(token)
+
+
+class ReportsRouter:
+    def db_for_read(self, model, **hints):
+        if not _use_reports_database.get():
+            return None
+        if REPORTS_DB_ALIAS not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads within a transaction need to see its (uncommitted) writes.
+            return None
+        return REPORTS_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases point at the same database file.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -61,6 +61,22 @@ DATABASES = {
         },
     }
 }
+# Same database, opened read-only for the reports, see trs/routers.py. No
+# IMMEDIATE transactions here: readers don't need the write lock.
+DATABASES["reports"] = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "NAME": f"file:{DATABASES['default']['NAME']}?mode=ro",
+    "OPTIONS": {
+        "timeout": 5,
+        "init_command": """
+            PRAGMA query_only=ON;
+            PRAGMA mmap_size=134217728;
+            PRAGMA cache_size=2000;
+        """,
+    },
+    "TEST": {"MIRROR": "default"},
+}
+DATABASE_ROUTERS = ["trs.routers.ReportsRouter"]
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 INSTALLED_APPS = [
     "trs",
@@ -91,6 +107,9 @@ MIDDLEWARE = [
     # Defaults above, extra two below.
     # 'trs.middleware.TracebackLoggingMiddleware',
     "tls.TLSRequestMiddleware",
+    "trs.middleware.CacheStatsMiddleware",
+    "trs.middleware.ServerTimingMiddleware",
+    "trs.middleware.ReportsDatabaseMiddleware",
 ]
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")  # Note: not var/static/!
@@ -114,6 +133,15 @@ if MEMCACHE_ADDRESS:
             "KEY_PREFIX": "trs",
         }
     }
+    if env.bool("TRS_L1_CACHE", default=False):
+        # Keep the most used (versioned) cache entries in-process for a
+        # minute, too. See trs.cache_backend.
+        CACHES["default"]["BACKEND"] = "trs.cache_backend.TwoLevelCache"
+        CACHES["default"]["OPTIONS"] = {
+            "L2_BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "L1_MAX_ENTRIES": env.int("TRS_L1_CACHE_MAX_ENTRIES", default=1000),
+            "L1_TIMEOUT": 60,
+        }
 
 LOGGING = {
     "version": 1,
@@ -178,6 +206,17 @@ TRS_START_YEAR = 2000
 TRS_END_YEAR = 2028
 # ^^^ TODO: appconf defaults.
 
+# Heavy excel exports are generated here by the ``run_export_jobs`` worker.
+# Generated financial/wbso exports are kept in its "cache" subdirectory while
+# the data is unchanged.
+TRS_EXPORT_DIR = os.path.join(BASE_DIR, "var", "exports")
+TRS_EXPORT_CACHE_MAX_MB = env.int("TRS_EXPORT_CACHE_MAX_MB", default=500)
+
+# Requests slower than this log their slowest queries, see
+# trs.middleware.ServerTimingMiddleware.
+TRS_SLOW_REQUEST_MS = env.int("TRS_SLOW_REQUEST_MS", default=2000)
+TRS_SLOW_REQUEST_NUM_QUERIES = env.int("TRS_SLOW_REQUEST_NUM_QUERIES", default=5)
+
 USE_I18N = True
 USE_TZ = False
 # ^^^ False is the pre-5.0 default. We want those tz-less datetimes in the db.
@@ -1,8 +1,14 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from trs.models import Person
+from trs.models import (
+    Booking,
+    Person,
+    YearWeek,
+    record_booking_deltas,
+    reset_year_week_calendar,
+)
 
 
 # Have the creation of a User trigger the creation of a Person.
@@ -25,3 +31,15 @@ def create_person(sender, instance, created, **kwargs):
         name = instance.first_name + " " + instance.last_name
         person.name = name
         person.save()
+
+
+# Keep the booking rollup up to date. Also called for cascading deletes.
+@receiver(post_delete, sender=Booking)
+def subtract_deleted_booking(sender, instance, **kwargs):
+    record_booking_deltas(instance.totals_deltas(deleted=True))
+
+
+@receiver(post_save, sender=YearWeek)
+@receiver(post_delete, sender=YearWeek)
+def year_weeks_changed(sender, **kwargs):
+    reset_year_week_calendar()
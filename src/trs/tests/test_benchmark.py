@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+
+from django.test import TestCase
+
+from trs.management.commands import benchmark, generate_dataset
+
+
+class BenchmarkTestCase(TestCase):
+    def setUp(self):
+        generate_dataset.Command().handle(seed=42, persons=5, projects=10, years=1)
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tempdir.name, "benchmark.json")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def run_benchmark(self, **options):
+        benchmark.Command().handle(
+            output=self.output,
+            compare=None,
+            only=["bulk_pyc", "work_calculation", "financial_excel"],
+            **options,
+        )
+        with open(self.output) as output:
+            return json.load(output)
+
+    def test_results(self):
+        results = self.run_benchmark()["results"]
+        self.assertEqual(
+            sorted(results), ["bulk_pyc", "financial_excel", "work_calculation"]
+        )
+        work_calculation = results["work_calculation"]
+        # The second time, everything comes from the cache.
+        self.assertGreater(work_calculation["cold"]["queries"], 0)
+        self.assertEqual(work_calculation["warm"]["queries"], 0)
+
+    def test_compare(self):
+        self.run_benchmark()
+        previous = os.path.join(self.tempdir.name, "previous.json")
+        os.rename(self.output, previous)
+        with self.assertLogs("trs.management.commands.benchmark") as logs:
+            self.run_benchmark()
+            with open(self.output) as output, open(previous) as previous_output:
+                benchmark.compare(
+                    json.load(output)["results"],
+                    json.load(previous_output)["results"],
+                )
+        self.assertIn("queries", logs.output[-1])
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from trs import caching
+from trs.cache_backend import TwoLevelCache
+
+
+def make_cache(**options):
+    return TwoLevelCache(
+        "trs-test",
+        {
+            "OPTIONS": {
+                "L2_BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                **options,
+            }
+        },
+    )
+
+
+class TwoLevelCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = make_cache()
+        self.cache.clear()
+
+    def test_versioned_keys_are_kept_locally(self):
+        self.cache.set("project-1-3-work_calculation-21", {"budget": 10})
+        self.cache.l2.clear()
+        self.assertEqual(
+            self.cache.get("project-1-3-work_calculation-21"), {"budget": 10}
+        )
+
+    def test_other_keys_only_in_memcached(self):
+        self.cache.set("trs-fill-cache-running", True)
+        self.cache.l2.clear()
+        self.assertIsNone(self.cache.get("trs-fill-cache-running"))
+
+    def test_filled_from_level2(self):
+        self.cache.l2.set("person-1-1-to_book-800-12", 40)
+        self.assertEqual(self.cache.get("person-1-1-to_book-800-12"), 40)
+        self.cache.l2.clear()
+        self.assertEqual(self.cache.get("person-1-1-to_book-800-12"), 40)
+
+    def test_values_are_copies(self):
+        self.cache.set("project-1-1-work_calculation-21", {"budget": 10})
+        self.cache.get("project-1-1-work_calculation-21")["budget"] = 20
+        self.assertEqual(
+            self.cache.get("project-1-1-work_calculation-21"), {"budget": 10}
+        )
+
+    def test_least_recently_used_evicted(self):
+        cache = make_cache(L1_MAX_ENTRIES=2)
+        cache.set("person-1", 1)
+        cache.set("person-2", 2)
+        cache.get("person-1")
+        cache.set("person-3", 3)
+        cache.l2.clear()
+        self.assertEqual(cache.get("person-1"), 1)
+        self.assertIsNone(cache.get("person-2"))
+        self.assertEqual(cache.get("person-3"), 3)
+
+    def test_timeout(self):
+        self.cache.set("person-1", 1)
+        self.cache.l2.clear()
+        with mock.patch("trs.cache_backend.time.monotonic", return_value=1e12):
+            self.assertIsNone(self.cache.get("person-1"))
+
+    def test_delete(self):
+        self.cache.set("person-1", 1)
+        self.cache.delete("person-1")
+        self.assertIsNone(self.cache.get("person-1"))
+
+    def test_get_many(self):
+        self.cache.set_many({"person-1": 1, "person-2": 2, "other": 3})
+        self.cache.l2.delete("person-1")
+        self.assertEqual(
+            self.cache.get_many(["person-1", "person-2", "other", "missing"]),
+            {"person-1": 1, "person-2": 2, "other": 3},
+        )
+
+    def test_incr(self):
+        self.cache.add("counter", 0)
+        self.assertEqual(self.cache.incr("counter"), 1)
+        self.assertEqual(self.cache.get("counter"), 1)
+
+    def test_hits_per_level(self):
+        self.cache.set("person-1", 1)
+        self.cache.l2.set("person-2", 2)
+        with caching.request_scope():
+            self.cache.get_many(["person-1", "person-2"])
+            self.cache.get("person-2")
+            stats = caching.stats()
+        self.assertEqual(stats["l1_hits"], 2)
+        self.assertEqual(stats["l2_hits"], 1)
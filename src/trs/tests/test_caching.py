@@ -0,0 +1,234 @@
+import pickle
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from trs import caching, models
+from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+from trs.tests import factories
+
+
+class PrefetchTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        cache.clear()
+        self.projects = [factories.ProjectFactory.create() for i in range(5)]
+
+    def test_prefetch_calculates_missing(self):
+        caching.prefetch(self.projects, "work_calculation")
+        project = self.projects[0]
+        self.assertEqual(
+            caching.get(project.cache_key("work_calculation")),
+            project.work_calculation(),
+        )
+
+    def test_prefetched_values_are_reused(self):
+        with caching.request_scope():
+            caching.prefetch(self.projects, "work_calculation")
+            with self.assertNumQueries(0):
+                for project in self.projects:
+                    project.turnover()
+                    project.overbooked()
+            stats = caching.stats()
+        # One get_many() and one set_many() for five projects, the ten method
+        # calls didn't need memcached at all.
+        self.assertEqual(stats["round_trips"], 2)
+        self.assertEqual(stats["round_trips_saved"], 8 + 10)
+
+    def test_warm_prefetch(self):
+        caching.prefetch(self.projects, "work_calculation")
+        with caching.request_scope():
+            with self.assertNumQueries(0):
+                caching.prefetch(self.projects, "work_calculation")
+            self.assertEqual(caching.stats()["round_trips"], 1)
+
+    def test_no_scope(self):
+        caching.prefetch(self.projects, "work_calculation")
+        self.assertFalse(caching.stats())
+
+    def test_recalculation_timed(self):
+        with caching.request_scope():
+            caching.prefetch(self.projects, "work_calculation")
+            self.assertGreater(caching.stats()["recalculation_time"], 0)
+            self.assertEqual(caching.stats()["misses"], 5)
+
+
+class RequestScopeTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        cache.clear()
+        self.project = factories.ProjectFactory.create()
+
+    def test_get_is_remembered(self):
+        cache.set("some-key", 42)
+        with caching.request_scope():
+            self.assertEqual(caching.get("some-key"), 42)
+            cache.delete("some-key")
+            self.assertEqual(caching.get("some-key"), 42)
+            stats = caching.stats()
+        self.assertEqual(stats["round_trips"], 1)
+        self.assertEqual(stats["memo_hits"], 1)
+        # Only within the scope.
+        self.assertIsNone(caching.get("some-key"))
+
+    def test_misses_are_not_remembered(self):
+        with caching.request_scope():
+            self.assertIsNone(caching.get("some-key"))
+            cache.set("some-key", 42)
+            self.assertEqual(caching.get("some-key"), 42)
+
+    def test_get_many_only_fetches_the_rest(self):
+        cache.set_many({"a": 1, "b": 2})
+        with caching.request_scope():
+            caching.get("a")
+            self.assertEqual(caching.get_many(["a", "b"]), {"a": 1, "b": 2})
+            self.assertEqual(caching.get_many(["a", "b"]), {"a": 1, "b": 2})
+            stats = caching.stats()
+        self.assertEqual(stats["round_trips"], 2)
+        self.assertEqual(stats["memo_hits"], 3)
+
+    def test_decorated_methods(self):
+        self.project.work_calculation()  # Warm cache.
+        with caching.request_scope():
+            with self.assertNumQueries(0):
+                self.project.turnover()
+                self.project.overbooked()
+                self.project.hour_budget()
+            self.assertEqual(caching.stats()["round_trips"], 1)
+
+
+class GetOrCalculateTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calculated = 0
+
+    def calculate(self):
+        self.calculated += 1
+        return 42
+
+    def test_calculate(self):
+        self.assertEqual(caching.get_or_calculate("key", self.calculate), 42)
+        self.assertEqual(caching.get_or_calculate("key", self.calculate), 42)
+        self.assertEqual(self.calculated, 1)
+        self.assertIsNone(cache.get("lock-key"))
+
+    def test_previous_value_while_locked(self):
+        cache.add("lock-key", True)
+        cache.set("previous-key", 41)
+        with caching.request_scope():
+            result = caching.get_or_calculate(
+                "key", self.calculate, previous_key="previous-key"
+            )
+            self.assertEqual(caching.stats()["suppressed_calculations"], 1)
+        self.assertEqual(result, 41)
+        self.assertEqual(self.calculated, 0)
+
+    def test_wait_while_locked(self):
+        cache.add("lock-key", True)
+
+        def other_process_finishes(seconds):
+            cache.set("key", 43)
+
+        with mock.patch("trs.caching.time.sleep", side_effect=other_process_finishes):
+            result = caching.get_or_calculate("key", self.calculate)
+        self.assertEqual(result, 43)
+        self.assertEqual(self.calculated, 0)
+
+    def test_waited_in_vain(self):
+        cache.add("lock-key", True)
+        with mock.patch("trs.caching.WAIT_TIMEOUT", 0):
+            result = caching.get_or_calculate("key", self.calculate)
+        self.assertEqual(result, 42)
+        # Not our lock.
+        self.assertTrue(cache.get("lock-key"))
+
+    def test_lock_released_after_error(self):
+        def broken():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            caching.get_or_calculate("key", broken)
+        self.assertIsNone(cache.get("lock-key"))
+
+    def test_previous_model_value(self):
+        ensure_year_weeks_are_present()
+        project = factories.ProjectFactory.create()
+        calculation = project.work_calculation()
+        models.Project.invalidate([project])
+        key = project.cache_key("work_calculation")
+        cache.add(f"lock-{key}", True)
+        with self.assertNumQueries(0):
+            self.assertEqual(project.work_calculation(), calculation)
+
+
+class SerializationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.big_value = {"per_project": [(id, 8, 0, 0) for id in range(10000)]}
+
+    def test_small_value(self):
+        caching.set("key", {"budget": 10})
+        stored = cache.get("key")
+        self.assertIsInstance(stored, caching.Pickled)
+        self.assertFalse(stored.compressed)
+        self.assertEqual(caching.get("key"), {"budget": 10})
+
+    def test_pickled_once(self):
+        with mock.patch("pickle.dumps", wraps=pickle.dumps) as dumps:
+            caching.set_many({"key": {"budget": 10}, "other": self.big_value})
+        # The cache backend only pickles our wrappers.
+        pickled_values = [
+            call.args[0]
+            for call in dumps.call_args_list
+            if not isinstance(call.args[0], caching.Pickled)
+        ]
+        self.assertEqual(pickled_values, [{"budget": 10}, self.big_value])
+
+    def test_not_set_by_us(self):
+        cache.set("key", 42)
+        self.assertEqual(caching.get("key"), 42)
+
+    def test_big_value_compressed(self):
+        caching.set("key", self.big_value)
+        self.assertTrue(cache.get("key").compressed)
+        self.assertEqual(caching.get("key"), self.big_value)
+        self.assertEqual(caching.get_many(["key"]), {"key": self.big_value})
+
+    def test_too_big(self):
+        with caching.request_scope():
+            with mock.patch("trs.caching.MAX_ITEM_SIZE", 10):
+                with self.assertLogs("trs.caching", level="WARNING"):
+                    caching.set_many({"key": self.big_value, "other": 42})
+            self.assertEqual(caching.stats()["failed_sets"], 1)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(caching.get("other"), 42)
+
+    def test_sizes_per_family(self):
+        with caching.request_scope():
+            caching.set("project-1-3-work_calculation-21", {"budget": 10})
+            caching.set("project-2-1-work_calculation-21", {"budget": 20})
+            stats = caching.stats()
+        self.assertEqual(stats["sets:project-work_calculation"], 2)
+        self.assertGreater(stats["set_bytes:project-work_calculation"], 0)
+
+    def test_key_family(self):
+        self.assertEqual(
+            caching.key_family("person-12-pc3-hours_per_week-800-6"),
+            "person-hours_per_week",
+        )
+        self.assertEqual(caching.key_family("pycdata-12-3-2024-39"), "pycdata")
+
+
+class TimedTestCase(TestCase):
+    def test_nested(self):
+        with caching.request_scope():
+            with caching.timed("pyc"):
+                with caching.timed("pyc"):
+                    pass
+            self.assertEqual(list(caching.stats()), ["pyc_time"])
+
+    def test_no_scope(self):
+        with caching.timed("pyc"):
+            pass
+        self.assertFalse(caching.stats())
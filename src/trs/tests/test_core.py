@@ -1,8 +1,11 @@
+import datetime
+
 from django.core.cache import cache
 from django.test import TestCase
 
 from trs import core
 from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+from trs.models import Invoice, Payable, Person, YearWeek, this_year_week
 from trs.tests import factories
 
 
@@ -49,3 +52,176 @@ class PersonYearCombinationTestCase(TestCase):
     def test_full_cache(self):
         self.pyc.set_cache()
         self.assertTrue(self.pyc.get_cache())
+
+    def test_cache_data(self):
+        self.pyc.per_project = self.pyc.calc_per_project(
+            [1, 2], {1: 10, 2: 5}, {1: 100, 2: 80}, {1: False, 2: True}, {1: 4}, {}
+        )
+        cache_data = self.pyc.cache_data()
+        # One row of numbers per project.
+        self.assertEqual(
+            cache_data["per_project"][0], (1, 4, 0, 0, 4, 6, 400, 0, 600, 0, 4)
+        )
+        pyc = core.PersonYearCombination(self.person, calculate=False)
+        pyc.load_cache_data(cache_data)
+        self.assertEqual(pyc.per_project, self.pyc.per_project)
+
+    def test_previous_version_while_locked(self):
+        self.pyc.set_cache()
+        Person.invalidate([self.person])
+        key = core.PersonYearCombination(self.person, calculate=False).cache_key
+        cache.add(f"lock-{key}", True)
+        # Someone else is re-calculating, we get the previous version.
+        with self.assertNumQueries(0):
+            pyc = core.PersonYearCombination(self.person)
+        self.assertEqual(pyc.cache_data(), self.pyc.cache_data())
+
+
+class BulkPycTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        this_year = datetime.date.today().year
+        self.year_weeks = {
+            year: list(YearWeek.objects.filter(year=year))
+            for year in [this_year - 1, this_year]
+        }
+        start = self.year_weeks[this_year - 1][0]
+        end = self.year_weeks[this_year][-1]
+        self.person1 = factories.PersonFactory.create()
+        self.person2 = factories.PersonFactory.create()
+        self.person3 = factories.PersonFactory.create()  # Nothing booked.
+        for person, hours_per_week in [(self.person1, 40), (self.person2, 32)]:
+            factories.PersonChangeFactory(
+                person=person,
+                hours_per_week=hours_per_week,
+                target=1000,
+                year_week=start,
+            )
+        self.external = factories.ProjectFactory.create(start=start, end=end)
+        self.internal = factories.ProjectFactory.create(
+            start=start, end=end, internal=True
+        )
+        self.hourless = factories.ProjectFactory.create(
+            start=start, end=end, hourless=True
+        )
+        for person in [self.person1, self.person2]:
+            for project, hours in [(self.external, 100), (self.internal, 20)]:
+                factories.WorkAssignmentFactory(
+                    assigned_to=person,
+                    assigned_on=project,
+                    hours=hours,
+                    hourly_tariff=80,
+                )
+        for year_weeks in self.year_weeks.values():
+            # person1 goes over budget, person2 doesn't.
+            for year_week in year_weeks[:10]:
+                factories.BookingFactory(
+                    booked_by=self.person1,
+                    booked_on=self.external,
+                    hours=8,
+                    year_week=year_week,
+                )
+                factories.BookingFactory(
+                    booked_by=self.person1,
+                    booked_on=self.hourless,
+                    hours=4,
+                    year_week=year_week,
+                )
+            for year_week in year_weeks[:2]:
+                factories.BookingFactory(
+                    booked_by=self.person2,
+                    booked_on=self.internal,
+                    hours=16,
+                    year_week=year_week,
+                )
+        self.persons = [self.person1, self.person2, self.person3]
+
+    def assert_same_as_get_pyc(self, year):
+        cache.clear()
+        expected = [core.get_pyc(person, year=year) for person in self.persons]
+        cache.clear()
+        pycs = core.bulk_pyc(self.persons, year=year)
+        self.assertEqual(list(pycs.keys()), [person.id for person in self.persons])
+        for pyc in expected:
+            for key in core.PersonYearCombination.PYC_KEYS:
+                self.assertEqual(
+                    getattr(pycs[pyc.person.id], key), getattr(pyc, key), key
+                )
+
+    def test_this_year(self):
+        self.assert_same_as_get_pyc(None)
+
+    def test_previous_year(self):
+        self.assert_same_as_get_pyc(datetime.date.today().year - 1)
+
+    def test_cached(self):
+        cache.clear()
+        core.bulk_pyc(self.persons)
+        with self.assertNumQueries(0):
+            core.bulk_pyc(self.persons)
+
+
+class FinancialCubeTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        self.group = factories.GroupFactory.create()
+        self.project = factories.ProjectFactory.create(
+            group=self.group,
+            contract_amount=1000,
+            reservation=100,
+            confirmation_date=datetime.date(2020, 3, 1),
+        )
+        self.other_project = factories.ProjectFactory.create(reservation=50)
+        self.internal_project = factories.ProjectFactory.create(
+            group=self.group, internal=True, reservation=25
+        )
+        for project, amount in [
+            (self.project, 10),
+            (self.other_project, 20),
+            (self.internal_project, 40),
+        ]:
+            Invoice.objects.create(
+                project=project,
+                date=datetime.date(2020, 2, 10),
+                number="1",
+                amount_exclusive=amount,
+                vat=0,
+            )
+            Payable.objects.create(
+                project=project,
+                date=datetime.date(2020, 5, 10),
+                number="1",
+                amount=amount,
+            )
+        factories.BudgetItemFactory(project=self.project, amount=30)
+        this_year_week()  # Loads the year week calendar.
+        with self.assertNumQueries(6):
+            self.cube = core.FinancialCube([2019, 2020])
+
+    def test_invoiced(self):
+        table = self.cube.per_year_month("invoiced")
+        self.assertEqual(table["per_year_month"][2020][2], 70)
+        self.assertEqual(table["cumulative_per_year_month"][2020][12], 70)
+        self.assertEqual(table["totals"], {2019: 0, 2020: 70})
+        table = self.cube.per_year_month("invoiced", group=self.group)
+        self.assertEqual(table["totals"][2020], 50)
+
+    def test_payables_external_only(self):
+        table = self.cube.per_year_month("payables", external_only=True)
+        self.assertEqual(table["totals"][2020], 30)
+
+    def test_confirmed(self):
+        table = self.cube.per_year_month("confirmed", group=self.group)
+        self.assertEqual(table["per_year_month"][2020][3], 1000)
+        self.assertEqual(table["cumulative_per_year_month"][2020][2], 0)
+        self.assertEqual(table["cumulative_per_year_month"][2020][4], 1000)
+
+    def test_project_numbers(self):
+        # The internal project doesn't count.
+        self.assertEqual(self.cube.project_sum("reservation"), 150)
+        self.assertEqual(self.cube.project_sum("reservation", group=self.group), 100)
+        self.assertEqual(self.cube.costs_total(), 30)
+        counts = self.cube.project_counts()
+        self.assertEqual(counts["active"], 2)
+        self.assertEqual(counts["with_confirmation"], 1)
+        self.assertEqual(counts["offered"], 1)
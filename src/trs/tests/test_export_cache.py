@@ -0,0 +1,97 @@
+import datetime
+import io
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+
+from trs import export_cache, models, views
+from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+from trs.tests import factories
+
+
+class ExportCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.export_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.export_dir.name, "cache")
+        self.settings = override_settings(TRS_EXPORT_DIR=self.export_dir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.export_dir.cleanup()
+
+    def test_key(self):
+        key = export_cache.key("/excel/", QueryDict("a=1&b=2"), "v1")
+        self.assertEqual(key, export_cache.key("/excel/", QueryDict("b=2&a=1"), "v1"))
+        self.assertNotEqual(key, export_cache.key("/excel/", QueryDict("a=1"), "v1"))
+        self.assertNotEqual(
+            key, export_cache.key("/excel/", QueryDict("a=1&b=2"), "v2")
+        )
+
+    def test_store_and_get(self):
+        self.assertIsNone(export_cache.get("abc"))
+        export_cache.store("abc", io.BytesIO(b"PK excel"))
+        with export_cache.get("abc") as stored:
+            self.assertEqual(stored.read(), b"PK excel")
+        self.assertEqual(export_cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 50})
+
+    def test_evict(self):
+        for index, key in enumerate(["old", "middle", "new"]):
+            export_cache.store(key, io.BytesIO(b"12345"))
+            path = os.path.join(self.cache_dir, key + ".xlsx")
+            os.utime(path, (index, index))
+        export_cache.evict(max_size=10)
+        self.assertEqual(
+            sorted(os.listdir(self.cache_dir)), ["middle.xlsx", "new.xlsx"]
+        )
+
+
+class CachedExportTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        factories.GroupFactory.create()
+        self.project = factories.ProjectFactory.create()
+        self.export_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.export_dir.name, "cache")
+        self.settings = override_settings(TRS_EXPORT_DIR=self.export_dir.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.export_dir.cleanup()
+
+    def render(self):
+        request = RequestFactory().get("/overviews/financial_excel/")
+        view = views.FinancialExcelView(request=request, kwargs={})
+        response = view.render_to_response({})
+        content = b"".join(response.streaming_content)
+        response.close()
+        return content
+
+    def test_cached(self):
+        content = self.render()
+        # Only the queries for the data version are needed.
+        with self.assertNumQueries(9):
+            self.assertEqual(self.render(), content)
+
+    def test_data_change(self):
+        self.render()
+        models.Project.invalidate([self.project])
+        self.render()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_invoice_change(self):
+        # Invoices don't invalidate the project, but they are in the exports.
+        invoice = models.Invoice.objects.create(
+            project=self.project, date=datetime.date.today(), number="F1"
+        )
+        self.render()
+        invoice.amount_exclusive = 1000
+        invoice.save()
+        self.render()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
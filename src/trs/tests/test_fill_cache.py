@@ -20,3 +20,33 @@ class TestFillCache(unittest.TestCase):
         self.command.handle()
         key = self.project.cache_key("work_calculation")
         self.assertTrue(cache.get(key))
+
+    def test_only_missing(self):
+        ensure_year_weeks_are_present()
+        cache.clear()
+        project = factories.ProjectFactory.create()
+        task = (fill_cache.warm_projects, [project.id], ())
+        num_objects, stats = fill_cache.run_task(task)
+        self.assertEqual(num_objects, 1)
+        self.assertEqual(stats["misses"], 2)
+        num_objects, stats = fill_cache.run_task(task)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats.get("misses", 0), 0)
+
+    def test_archived_skipped(self):
+        ensure_year_weeks_are_present()
+        cache.clear()
+        project = factories.ProjectFactory.create(archived=True)
+        self.command.handle()
+        self.assertIsNone(cache.get(project.cache_key("work_calculation")))
+        self.command.handle(include_archived=True)
+        self.assertTrue(cache.get(project.cache_key("work_calculation")))
+
+    def test_already_running(self):
+        ensure_year_weeks_are_present()
+        cache.clear()
+        project = factories.ProjectFactory.create()
+        cache.add(fill_cache.LOCK_KEY, True)
+        self.command.handle()
+        self.assertIsNone(cache.get(project.cache_key("work_calculation")))
+        cache.delete(fill_cache.LOCK_KEY)
@@ -0,0 +1,46 @@
+import pytest
+from django.core.management.base import CommandError
+from django.db.models import Sum
+from django.test import TestCase
+
+from trs import models
+from trs.management.commands import generate_dataset, rebuild_booking_totals
+
+
+class GenerateDatasetTestCase(TestCase):
+    def generate(self, seed=42):
+        generate_dataset.Command().handle(seed=seed, persons=5, projects=10, years=1)
+
+    def test_generate(self):
+        self.generate()
+        self.assertEqual(models.Person.objects.count(), 5)
+        self.assertEqual(models.Project.objects.count(), 10)
+        self.assertTrue(models.PersonChange.objects.exists())
+        self.assertTrue(models.WorkAssignment.objects.exists())
+        self.assertTrue(models.Invoice.objects.exists())
+        self.assertTrue(models.Booking.objects.exists())
+        self.assertTrue(
+            models.Person.objects.get(user__username="benchmark").is_management
+        )
+
+    def test_booking_totals(self):
+        self.generate()
+        for model in rebuild_booking_totals.TOTALS:
+            self.assertEqual(rebuild_booking_totals.differences(model), 0)
+
+    def test_reproducible(self):
+        self.generate()
+        hours = models.Booking.objects.aggregate(Sum("hours"))
+        models.Person.objects.all().delete()
+        models.Project.objects.all().delete()
+        models.Group.objects.all().delete()
+        models.MPC.objects.all().delete()
+        models.WbsoProject.objects.all().delete()
+        models.User.objects.all().delete()
+        self.generate()
+        self.assertEqual(models.Booking.objects.aggregate(Sum("hours")), hours)
+
+    def test_not_empty(self):
+        self.generate()
+        with pytest.raises(CommandError):
+            self.generate()
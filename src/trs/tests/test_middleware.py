@@ -0,0 +1,57 @@
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+
+from trs import caching, middleware, models
+
+
+class ServerTimingMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.middleware = middleware.ServerTimingMiddleware(self.get_response)
+
+    def get_response(self, request):
+        models.Person.objects.count()
+        caching.get("trs-test-key")
+        return HttpResponse()
+
+    def request(self):
+        with caching.request_scope():
+            return self.middleware(RequestFactory().get("/persons/"))
+
+    def test_server_timing(self):
+        response = self.request()
+        server_timing = response["Server-Timing"]
+        self.assertIn("total;dur=", server_timing)
+        self.assertIn('desc="1 queries"', server_timing)
+        self.assertIn('desc="1 gets, 0 sets, 0 hits"', server_timing)
+
+    def test_log_line(self):
+        with self.assertLogs("trs.middleware", level="INFO") as logs:
+            self.request()
+        self.assertIn("db_queries=1", logs.output[0])
+
+    @override_settings(TRS_SLOW_REQUEST_MS=0)
+    def test_slow_request(self):
+        with self.assertLogs("trs.middleware", level="WARNING") as logs:
+            self.request()
+        self.assertIn("Slow request /persons/", logs.output[0])
+        self.assertIn('FROM "trs_person"', logs.output[0])
+
+
+class ServerTimingTestCase(TestCase):
+    def test_format(self):
+        request_stats = {
+            "total_ms": 120,
+            "db_ms": 30,
+            "db_queries": 12,
+            "cache_gets": 5,
+            "cache_sets": 1,
+            "cache_hits": 4,
+            "pyc_ms": 0,
+            "recalculation_ms": 10,
+        }
+        self.assertTrue(
+            middleware.server_timing(request_stats).startswith(
+                'total;dur=120, db;dur=30;desc="12 queries", cache;desc="5 gets'
+            )
+        )
@@ -2,9 +2,11 @@
 import datetime
 from unittest import mock
 
+from django.core.cache import cache
+from django.db.models import Sum
 from django.test import TestCase
 
-from trs import models
+from trs import core, models
 from trs.management.commands.update_weeks import ensure_year_weeks_are_present
 from trs.tests import factories
 
@@ -23,6 +25,7 @@ class PersonTestCase(TestCase):
         self.assertTrue(person.get_absolute_url())
 
     def test_as_widget(self):
+        ensure_year_weeks_are_present()
         person = factories.PersonFactory.create()
         self.assertTrue(person.as_widget())
 
@@ -47,6 +50,17 @@ class PersonTestCase(TestCase):
         factories.PersonChangeFactory.create(hours_per_week=-2, person=person)
         self.assertEqual(person.hours_per_week(), 38)
 
+    def test_bulk_hours_per_week(self):
+        ensure_year_weeks_are_present()
+        person = factories.PersonFactory.create()
+        factories.PersonChangeFactory.create(
+            hours_per_week=40, person=person, year_week=models.this_year_week()
+        )
+        newcomer = factories.PersonFactory.create()
+        with self.assertNumQueries(1):
+            result = models.Person.bulk_hours_per_week([person, newcomer])
+        self.assertEqual(result, {person.id: 40, newcomer.id: 0})
+
     def test_target1(self):
         factories.YearWeekFactory.create()  # We need one for the query.
         person = factories.PersonFactory.create()
@@ -75,6 +89,51 @@ class PersonTestCase(TestCase):
         factories.WorkAssignmentFactory(assigned_to=person, assigned_on=project)
         self.assertEqual(person.assigned_projects()[0], project)
 
+    def test_invalidate(self):
+        person = factories.PersonFactory.create()
+        with self.assertNumQueries(1):
+            models.Person.invalidate([person], person_change=True)
+        self.assertEqual(person.cache_indicator, 2)
+        self.assertEqual(person.cache_indicator_person_change, 1)
+        person.refresh_from_db()
+        self.assertEqual(person.cache_indicator, 2)
+        self.assertEqual(person.cache_indicator_person_change, 1)
+
+    def test_invalidate_by_id(self):
+        person = factories.PersonFactory.create()
+        models.Person.invalidate([person.id])
+        person.refresh_from_db()
+        self.assertEqual(person.cache_indicator, 2)
+
+    def test_bulk_to_book(self):
+        ensure_year_weeks_are_present()
+        this_year_week = models.this_year_week()
+        first_year_week = models.YearWeek.objects.filter(
+            year=this_year_week.year
+        ).first()
+        last_year = models.YearWeek.objects.filter(year=this_year_week.year - 1).first()
+        person = factories.PersonFactory.create()
+        factories.PersonChangeFactory.create(
+            person=person, year_week=last_year, hours_per_week=32
+        )
+        factories.PersonChangeFactory.create(
+            person=person, year_week=first_year_week, hours_per_week=8
+        )
+        factories.BookingFactory.create(
+            booked_by=person, year_week=first_year_week, hours=20
+        )
+        factories.BookingFactory.create(
+            booked_by=person, year_week=this_year_week, hours=4
+        )
+        newcomer = factories.PersonFactory.create()
+        persons = list(models.Person.objects.all())
+        with self.assertNumQueries(4):
+            result = models.Person.bulk_to_book(persons)
+        for one_person in [person, newcomer]:
+            self.assertEqual(
+                result[one_person.id], one_person.to_book.uncached(one_person)
+            )
+
 
 class ProjectTestCase(TestCase):
     def test_smoke(self):
@@ -145,6 +204,54 @@ class ProjectTestCase(TestCase):
         factories.WorkAssignmentFactory(assigned_to=person, assigned_on=project)
         self.assertEqual(project.assigned_persons()[0], person)
 
+    def test_invalidate(self):
+        person = factories.PersonFactory.create()
+        project = factories.ProjectFactory.create()
+        factories.WorkAssignmentFactory(assigned_to=person, assigned_on=project)
+        person.refresh_from_db()
+        project.refresh_from_db()
+        with self.assertNumQueries(1):
+            models.Project.invalidate([project])
+        self.assertEqual(project.cache_indicator, 3)
+        with self.assertNumQueries(2):
+            models.Project.invalidate([project], cascade=True)
+        person_cache_indicator = person.cache_indicator
+        person.refresh_from_db()
+        self.assertEqual(person.cache_indicator, person_cache_indicator + 1)
+
+    def test_bulk_work_calculation(self):
+        person = factories.PersonFactory.create()
+        unassigned = factories.PersonFactory.create()
+        project = factories.ProjectFactory.create(contract_amount=10000)
+        other_project = factories.ProjectFactory.create()
+        empty_project = factories.ProjectFactory.create()
+        factories.WorkAssignmentFactory(
+            assigned_to=person, assigned_on=project, hours=10, hourly_tariff=100
+        )
+        factories.WorkAssignmentFactory(
+            assigned_to=person, assigned_on=other_project, hours=5, hourly_tariff=80
+        )
+        factories.BookingFactory(booked_by=person, booked_on=project, hours=12)
+        factories.BookingFactory(booked_by=unassigned, booked_on=project, hours=3)
+        factories.BookingFactory(booked_by=person, booked_on=other_project, hours=2)
+        factories.BudgetItemFactory(project=project, amount=500)
+        factories.BudgetItemFactory(project=project, amount=-200)
+        factories.BudgetItemFactory(
+            project=other_project, to_project=project, amount=300
+        )
+        models.ThirdPartyEstimate.objects.create(
+            project=project, description="", amount=1000
+        )
+        projects = list(models.Project.objects.all())
+        with self.assertNumQueries(5):
+            result = models.Project.bulk_work_calculation(projects)
+        for one_project in [project, other_project, empty_project]:
+            self.assertEqual(
+                result[one_project.id],
+                one_project.work_calculation.uncached(one_project),
+            )
+        self.assertEqual(result[project.id]["overbooked"], 2)
+
 
 class EventBaseTestCase(TestCase):
     def test_added_by(self):
@@ -186,6 +293,105 @@ class YearWeekTestCase(TestCase):
         self.assertLess(year_week2, year_week1)
 
 
+class SaveBookingsTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        self.person = factories.PersonFactory.create()
+        self.projects = [factories.ProjectFactory.create() for i in range(10)]
+        self.year_week = models.YearWeek.objects.get(year=2013, week=2)
+        self.dates = self.year_week.days()
+        models.year_week_calendar()  # Warm it up.
+
+    def grid(self, projects, hours):
+        return {(project, date): hours for project in projects for date in self.dates}
+
+    def week_total(self):
+        return models.booked_hours(booked_by=self.person, year=2013, week=2).aggregate(
+            Sum("hours")
+        )["hours__sum"]
+
+    def test_bookings_and_totals(self):
+        models.save_bookings(self.person, self.year_week, self.grid(self.projects, 2))
+        self.assertEqual(models.Booking.objects.count(), 50)
+        rollup = models.BookingRollup.objects.get(
+            booked_by=self.person, booked_on=self.projects[0]
+        )
+        self.assertEqual(rollup.hours, 10)
+        self.assertEqual(self.week_total(), 100)
+
+    def test_update(self):
+        models.save_bookings(self.person, self.year_week, self.grid(self.projects, 2))
+        models.save_bookings(
+            self.person, self.year_week, self.grid(self.projects[:1], 4)
+        )
+        self.assertEqual(models.Booking.objects.count(), 50)
+        self.assertEqual(
+            models.BookingRollup.objects.get(booked_on=self.projects[0]).hours, 20
+        )
+        self.assertEqual(self.week_total(), 110)
+
+    def test_cache_indicators(self):
+        models.save_bookings(self.person, self.year_week, self.grid(self.projects, 2))
+        self.assertEqual(self.person.cache_indicator, 2)  # Created + 1
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.cache_indicator, 2)
+        self.projects[0].refresh_from_db()
+        self.assertEqual(self.projects[0].cache_indicator, 2)  # Created + 1
+
+    def test_constant_number_of_queries(self):
+        # One cell or fifty: the same amount of queries.
+        with self.assertNumQueries(10):
+            models.save_bookings(
+                self.person,
+                self.year_week,
+                {(self.projects[0], self.dates[0]): 8},
+            )
+        with self.assertNumQueries(10):
+            models.save_bookings(
+                self.person, self.year_week, self.grid(self.projects[1:], 2)
+            )
+
+
+class YearWeekCalendarTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+
+    def test_this_year_week(self):
+        models.year_week_calendar()
+        with self.assertNumQueries(0):
+            year_week = models.this_year_week()
+        self.assertEqual(
+            year_week,
+            models.YearWeek.objects.filter(first_day__lte=datetime.date.today()).last(),
+        )
+
+    def test_for_year(self):
+        calendar = models.year_week_calendar()
+        self.assertEqual(
+            calendar.for_year(2013), list(models.YearWeek.objects.filter(year=2013))
+        )
+        self.assertEqual(calendar.for_year(1900), [])
+
+    def test_for_date(self):
+        calendar = models.year_week_calendar()
+        # 1 jan 2013 was a tuesday in week 1, 7 jan the first monday.
+        self.assertEqual(calendar.for_date(datetime.date(2013, 1, 6)).week, 1)
+        self.assertEqual(calendar.for_date(datetime.date(2013, 1, 7)).week, 2)
+        self.assertIsNone(calendar.for_date(datetime.date(1900, 1, 1)))
+
+    def test_get(self):
+        calendar = models.year_week_calendar()
+        year_week = calendar.get_by_year_and_week(2013, 1)
+        self.assertEqual(calendar.get(year_week.id), year_week)
+
+    def test_reset_on_change(self):
+        calendar = models.year_week_calendar()
+        year_week = calendar.get_by_year_and_week(2013, 1)
+        year_week.num_days_missing = 2
+        year_week.save()
+        self.assertIsNot(models.year_week_calendar(), calendar)
+
+
 class PersonChangeTestCase(TestCase):
     def test_smoke(self):
         person_change = factories.PersonChangeFactory.create()
@@ -202,6 +408,76 @@ class BookingTestCase(TestCase):
         self.assertTrue(booking)
 
 
+class BookingTotalsTestCase(TestCase):
+    def setUp(self):
+        self.booking = factories.BookingFactory.create(hours=4)
+        self.person = self.booking.booked_by
+        self.project = self.booking.booked_on
+
+    def total(self, **filters):
+        return (
+            models.booked_hours(booked_by=self.person, **filters).aggregate(
+                Sum("hours")
+            )["hours__sum"]
+            or 0
+        )
+
+    def year_total(self):
+        return self.total(booked_on=self.project, year=2013)
+
+    def week_total(self):
+        return self.total(year=2013, week=self.booking.year_week.week)
+
+    def test_new_booking(self):
+        self.assertEqual(self.year_total(), 4)
+        self.assertEqual(self.week_total(), 4)
+
+    def test_changed_booking(self):
+        booking = models.Booking.objects.get(id=self.booking.id)
+        booking.hours = 6
+        booking.save()
+        booking.save()  # Saving twice shouldn't count double.
+        self.assertEqual(self.year_total(), 6)
+        self.assertEqual(self.week_total(), 6)
+
+    def test_second_booking(self):
+        factories.BookingFactory.create(
+            booked_by=self.person,
+            booked_on=self.project,
+            year_week=self.booking.year_week,
+            hours=2,
+            date=datetime.date(2013, 1, 8),
+        )
+        self.assertEqual(self.year_total(), 6)
+        self.assertEqual(self.week_total(), 6)
+
+    def test_deleted_booking(self):
+        models.Booking.objects.filter(id=self.booking.id).delete()
+        self.assertEqual(self.year_total(), 0)
+        self.assertEqual(self.week_total(), 0)
+
+    def test_deleted_person(self):
+        self.person.delete()
+        self.assertFalse(models.BookingRollup.objects.exists())
+
+    def test_year_week_missing_from_calendar(self):
+        # Another process added the year week, ours doesn't know it yet.
+        stale_calendar = models.YearWeekCalendar([])
+        with mock.patch.object(
+            models, "year_week_calendar", return_value=stale_calendar
+        ):
+            booking = models.Booking.objects.get(id=self.booking.id)
+            booking.hours = 6
+            booking.save()
+            factories.BookingFactory.create(
+                booked_by=self.person, booked_on=self.project, hours=2
+            )
+        self.assertEqual(self.week_total(), 6)
+        rollup = models.BookingRollup.objects.get(hours=2)
+        self.assertEqual(rollup.year, rollup.year_week.year)
+        self.assertEqual(rollup.week, rollup.year_week.week)
+
+
 class WorkAssignmentTestCase(TestCase):
     def test_smoke(self):
         work_assignment = factories.WorkAssignmentFactory.create()
@@ -226,6 +502,139 @@ class BudgetItemTestCase(TestCase):
         self.assertEqual(budget_item.amount_as_income(), 20)
 
 
+class CacheDependenciesTestCase(TestCase):
+    """Only changes that cached calculations read invalidate them.
+
+    After every change, the cached results must still be the same as freshly
+    calculated ones.
+
+    """
+
+    def setUp(self):
+        cache.clear()
+        ensure_year_weeks_are_present()
+        this_year = models.this_year_week().year
+        person = factories.PersonFactory.create()
+        project = factories.ProjectFactory.create(
+            start=models.YearWeek.objects.filter(year=this_year).first(),
+            end=models.YearWeek.objects.filter(year=this_year).last(),
+        )
+        factories.WorkAssignmentFactory(
+            assigned_to=person, assigned_on=project, hours=10, hourly_tariff=80
+        )
+        factories.BookingFactory(
+            booked_by=person, booked_on=project, year_week=models.this_year_week()
+        )
+        self.last_year = models.YearWeek.objects.filter(year=this_year - 1).first()
+        self.person = models.Person.objects.get(pk=person.pk)
+        self.project = models.Project.objects.get(pk=project.pk)
+
+    def assert_pyc_correct(self):
+        person = models.Person.objects.get(pk=self.person.pk)
+        cached = core.get_pyc(person).cache_data()
+        fresh = core.PersonYearCombination(person, calculate=False).calculate()
+        self.assertEqual(cached, fresh)
+
+    def assert_work_calculation_correct(self, project=None):
+        project = models.Project.objects.get(pk=(project or self.project).pk)
+        self.assertEqual(
+            project.work_calculation(),
+            models.Project.work_calculation.uncached(project),
+        )
+
+    def test_project_changes(self):
+        changes = [
+            # Field, new value, whether the persons' caches are invalidated.
+            ("remark", "Graag voor de zomer", False),
+            ("principal", "Waterschap", False),
+            ("rating_customer", 8, False),
+            ("description", "Dijkversterking", False),
+            ("archived", True, False),
+            ("internal", True, True),
+            ("hourless", True, True),
+            ("end", self.last_year, True),
+        ]
+        for field, value, invalidates in changes:
+            with self.subTest(field=field):
+                self.assert_pyc_correct()  # Fill the cache.
+                project = models.Project.objects.get(pk=self.project.pk)
+                cache_indicator = self.person.cache_indicator
+                setattr(project, field, value)
+                project.save()
+                self.person.refresh_from_db()
+                self.assertEqual(
+                    self.person.cache_indicator, cache_indicator + invalidates
+                )
+                self.assert_pyc_correct()
+
+    def test_saving_twice(self):
+        self.project.internal = True
+        self.project.save()
+        cache_indicator = models.Person.objects.get(pk=self.person.pk).cache_indicator
+        self.project.save()
+        self.person.refresh_from_db()
+        self.assertEqual(self.person.cache_indicator, cache_indicator)
+
+    def test_unchanged_after_save(self):
+        project = models.Project(code="P9999")
+        self.assertTrue(project.cache_dependencies_changed())
+        project.save()
+        self.assertFalse(project.cache_dependencies_changed())
+
+    def test_financial_changes(self):
+        invoice = models.Invoice(
+            project=self.project, date=datetime.date.today(), number="F1"
+        )
+        payable = models.Payable(
+            project=self.project, date=datetime.date.today(), number="K1"
+        )
+        budget_item = models.BudgetItem(project=self.project, amount=100)
+        estimate = models.ThirdPartyEstimate(
+            project=self.project, description="Boring", amount=100
+        )
+        other_project = factories.ProjectFactory.create()
+        changes = [
+            # Object, field, new value, whether the project is invalidated.
+            (invoice, None, None, False),
+            (invoice, "amount_exclusive", 1000, False),
+            (payable, None, None, False),
+            (payable, "amount", 500, False),
+            (budget_item, None, None, True),
+            (budget_item, "description", "Veldwerk", False),
+            (budget_item, "amount", 200, True),
+            (estimate, None, None, True),
+            (estimate, "description", "Sonderingen", False),
+            (estimate, "amount", 300, True),
+            # Moved away from our project, to it and away again.
+            (budget_item, "project", other_project, True),
+            (budget_item, "to_project", self.project, True),
+            (budget_item, "to_project", None, True),
+        ]
+        for obj, field, value, invalidates in changes:
+            with self.subTest(model=type(obj).__name__, field=field):
+                self.assert_work_calculation_correct()  # Fill the cache.
+                self.assert_work_calculation_correct(other_project)
+                cache_indicator = models.Project.objects.get(
+                    pk=self.project.pk
+                ).cache_indicator
+                if field:
+                    obj = type(obj).objects.get(pk=obj.pk)
+                    setattr(obj, field, value)
+                obj.save()
+                self.assertEqual(
+                    models.Project.objects.get(pk=self.project.pk).cache_indicator,
+                    cache_indicator + invalidates,
+                )
+                self.assert_work_calculation_correct()
+                self.assert_work_calculation_correct(other_project)
+
+    def test_financial_deletes(self):
+        budget_item = factories.BudgetItemFactory(project=self.project, amount=100)
+        self.assert_work_calculation_correct()
+        models.BudgetItem.objects.get(pk=budget_item.pk).delete()
+        self.assert_work_calculation_correct()
+
+
 class GroupTestCase(TestCase):
     def test_smoke(self):
         group = factories.GroupFactory.create()
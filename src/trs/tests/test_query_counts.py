@@ -0,0 +1,120 @@
+import collections
+import re
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from trs import models, views
+from trs.management.commands.generate_dataset import BENCHMARK_USERNAME, Generator
+from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+
+# Numbers and strings differ per row, the rest of an N+1 query doesn't.
+LITERALS = re.compile(r"'[^']*'|\b\d+\b")
+# The number of ids in an "IN (...)" grows with the dataset, too.
+IN_LISTS = re.compile(r"IN \(\?(, \?)*\)")
+
+
+def normalize(sql):
+    return IN_LISTS.sub("IN (...)", LITERALS.sub("?", sql))
+
+
+class QueryCountTestCase(TestCase):
+    """The number of queries of the list and export views must not grow with
+    the number of rows.
+
+    Every view is rendered on a small dataset and again after making it
+    bigger. A difference in the number of queries means a query per row
+    (an N+1), the repeated queries are in the failure message.
+
+    """
+
+    PATHS = [
+        "/persons/excel/",
+        "/projects/excel/",
+        "/projects/{project_id}/excel/",
+        "/projects/{project_id}/persons/excel/",
+        "/overviews/wbso_projects/excel/",
+        "/overviews/wbso_projects/excel2/",
+        "/overviews/financial_excel/",
+        "/overviews/combined_financial_excel/",
+        "/overviews/payables_excel/",
+    ]
+    # For the html pages we look at what the template loops over.
+    LIST_VIEWS = {
+        "/persons/": "lines",
+        "/projects/": "lines",
+        "/projects/{project_id}/": "lines",
+        "/overviews/invoices/": "invoices",
+        "/overviews/payables/": "payables",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        ensure_year_weeks_are_present()
+        Generator(seed=1, num_persons=3, num_projects=4, num_years=1).generate()
+        cls.user = User.objects.get(username=BENCHMARK_USERNAME)
+        cls.project = models.Project.objects.order_by("id").first()
+
+    def render(self, path, attribute=None):
+        # Every view starts with an empty cache, like after a change.
+        cache.clear()
+        view = views.export_view(path.format(project_id=self.project.id), self.user)
+        with CaptureQueriesContext(connection) as context:
+            if attribute:
+                list(getattr(view, attribute))
+            else:
+                with tempfile.TemporaryFile() as excel_file:
+                    view.write_excel_file(excel_file)
+        return [query["sql"] for query in context.captured_queries]
+
+    def grow(self):
+        """Add persons and projects, the new persons all work on our project"""
+        Generator(seed=2, num_persons=3, num_projects=4, num_years=1).generate()
+        assigned = self.project.assigned_persons()
+        models.WorkAssignment.objects.bulk_create(
+            [
+                models.WorkAssignment(assigned_on=self.project, assigned_to=person)
+                for person in models.Person.objects.exclude(
+                    id__in=[person.id for person in assigned]
+                )
+            ]
+        )
+
+    def assert_no_extra_queries(self, path, small, big):
+        if len(big) <= len(small):
+            return
+        small_counts = collections.Counter(normalize(sql) for sql in small)
+        big_counts = collections.Counter(normalize(sql) for sql in big)
+        repeated = [
+            f"{small_counts[sql]} -> {count}x {sql}"
+            for sql, count in big_counts.most_common()
+            if count > small_counts[sql]
+        ]
+        self.fail(
+            f"{path}: {len(small)} queries for the small dataset, {len(big)} "
+            "for the big one. Queries that are repeated per row:\n"
+            + "\n".join(repeated)
+        )
+
+    def test_exports(self):
+        small = {path: self.render(path) for path in self.PATHS}
+        self.grow()
+        for path in self.PATHS:
+            with self.subTest(path=path):
+                self.assert_no_extra_queries(path, small[path], self.render(path))
+
+    def test_list_views(self):
+        small = {
+            path: self.render(path, attribute)
+            for path, attribute in self.LIST_VIEWS.items()
+        }
+        self.grow()
+        for path, attribute in self.LIST_VIEWS.items():
+            with self.subTest(path=path):
+                self.assert_no_extra_queries(
+                    path, small[path], self.render(path, attribute)
+                )
@@ -0,0 +1,101 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from trs import core, models, views
+from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+from trs.tests import factories
+
+# "SEARCH trs_booking USING INDEX ..." is fine, "SCAN trs_booking" means
+# reading the whole (ever-growing) table or one of its indexes.
+BOOKING_SCAN = re.compile(r"\bSCAN (trs_booking\w*)")
+
+
+class QueryPlanTestCase(TestCase):
+    """The hot booking queries must use the indexes from migration 0034"""
+
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        cache.clear()
+        self.person = factories.PersonFactory.create()
+        self.project = factories.ProjectFactory.create()
+        factories.WorkAssignmentFactory.create(
+            assigned_to=self.person, assigned_on=self.project, hours=10
+        )
+        self.year_week = models.this_year_week()
+        factories.BookingFactory.create(
+            booked_by=self.person,
+            booked_on=self.project,
+            year_week=self.year_week,
+            date=self.year_week.first_day,
+            hours=4,
+        )
+        self.year = self.year_week.year
+
+    def assert_no_booking_scans(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        booking_queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT") and "trs_booking" in query["sql"]
+        ]
+        self.assertTrue(booking_queries)
+        with connection.cursor() as cursor:
+            for sql in booking_queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+                scans = [line for line in plan if BOOKING_SCAN.search(line)]
+                self.assertFalse(scans, f"{sql}\n{plan}")
+
+    def test_booking_page(self):
+        request = RequestFactory().get("/")
+        view = views.BookingView(
+            request=request,
+            kwargs={
+                "pk": self.person.id,
+                "year": self.year_week.year,
+                "week": self.year_week.week,
+            },
+        )
+        self.assert_no_booking_scans(lambda: view.lines)
+
+    def test_save_bookings(self):
+        self.assert_no_booking_scans(
+            lambda: models.save_bookings(
+                self.person,
+                self.year_week,
+                {(self.project, self.year_week.first_day): 6},
+            )
+        )
+
+    def test_free_overview(self):
+        self.project.description = "Verlof"
+        self.project.save()
+        request = RequestFactory().get("/", data={"year": self.year})
+        view = views.FreeOverview(request=request, kwargs={"pk": self.person.id})
+        self.assert_no_booking_scans(lambda: list(view.free_projects))
+        self.assertEqual(list(view.free_projects), [self.project])
+
+    def test_pycs(self):
+        persons = models.Person.objects.all()
+        self.assert_no_booking_scans(lambda: core.bulk_pyc(persons, self.year))
+
+    def test_person_calculations(self):
+        self.assert_no_booking_scans(
+            lambda: (self.person.to_book(), self.person.to_work_up_till_now())
+        )
+
+    def test_project_calculations(self):
+        projects = list(models.Project.objects.all())
+        self.assert_no_booking_scans(
+            lambda: models.Project.bulk_work_calculation(projects)
+        )
+        self.assert_no_booking_scans(lambda: self.project.work_calculation())
+
+    def test_financial_cube(self):
+        self.assert_no_booking_scans(lambda: core.FinancialCube([self.year]))
@@ -0,0 +1,39 @@
+import unittest
+
+import pytest
+from django.core.management.base import CommandError
+
+from trs import models
+from trs.management.commands import rebuild_booking_totals
+from trs.tests import factories
+
+
+@pytest.mark.django_db
+class TestRebuildBookingTotals(unittest.TestCase):
+    def setUp(self):
+        self.command = rebuild_booking_totals.Command()
+        self.booking = factories.BookingFactory.create(hours=4)
+
+    def test_in_sync(self):
+        for model in rebuild_booking_totals.TOTALS:
+            self.assertEqual(rebuild_booking_totals.differences(model), 0)
+        self.command.handle(check=True)
+
+    def test_rollup(self):
+        rollup = models.BookingRollup.objects.get()
+        self.assertEqual(rollup.booked_by, self.booking.booked_by)
+        self.assertEqual(rollup.year_week, self.booking.year_week)
+        self.assertEqual(rollup.week, self.booking.year_week.week)
+        self.assertEqual(rollup.hours, 4)
+
+    def test_check_out_of_sync(self):
+        # A queryset update circumvents Booking.save().
+        models.Booking.objects.update(hours=6)
+        with self.assertRaises(CommandError):
+            self.command.handle(check=True)
+
+    def test_rebuild(self):
+        models.Booking.objects.update(hours=6)
+        self.command.handle(check=False)
+        self.assertEqual(models.BookingRollup.objects.get().hours, 6)
+        self.command.handle(check=True)
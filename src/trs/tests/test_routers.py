@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import ConnectionHandler, OperationalError
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from trs import middleware, models, routers, views
+
+
+class ReportsRouterTestCase(TestCase):
+    def setUp(self):
+        self.router = routers.ReportsRouter()
+
+    def test_default(self):
+        self.assertIsNone(self.router.db_for_read(models.Person))
+
+    def test_reports(self):
+        with mock.patch.object(connections[DEFAULT_DB_ALIAS], "in_atomic_block", False):
+            with routers.reports_database():
+                self.assertEqual(self.router.db_for_read(models.Person), "reports")
+            self.assertIsNone(self.router.db_for_read(models.Person))
+
+    def test_within_transaction(self):
+        # A TestCase runs within a transaction: we must see its writes.
+        with routers.reports_database():
+            self.assertIsNone(self.router.db_for_read(models.Person))
+
+    def test_writes(self):
+        with routers.reports_database():
+            self.assertEqual(self.router.db_for_write(models.Person), "default")
+
+    def test_allow_migrate(self):
+        self.assertTrue(self.router.allow_migrate("default", "trs"))
+        self.assertFalse(self.router.allow_migrate("reports", "trs"))
+
+
+class ReadOnlyConnectionTestCase(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        db_file = os.path.join(self.tempdir.name, "trs.db")
+        with sqlite3.connect(db_file) as db:
+            db.execute("CREATE TABLE example (id INTEGER)")
+        # Our own connection handler, with the "reports" settings as default.
+        self.handler = ConnectionHandler(
+            {
+                "default": {
+                    **settings.DATABASES["reports"],
+                    "NAME": f"file:{db_file}?mode=ro",
+                }
+            }
+        )
+
+    def tearDown(self):
+        self.handler.close_all()
+        self.tempdir.cleanup()
+
+    def test_read(self):
+        with self.handler["default"].cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM example")
+            self.assertEqual(cursor.fetchone(), (0,))
+
+    def test_write(self):
+        with self.handler["default"].cursor() as cursor:
+            with self.assertRaises(OperationalError):
+                cursor.execute("INSERT INTO example VALUES (1)")
+
+
+class ReportsDatabaseMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.middleware = middleware.ReportsDatabaseMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.middleware.process_view(request, self.view_func, [], {})
+        self.used_reports_database = routers._use_reports_database.get()
+        return HttpResponse()
+
+    def test_report_view(self):
+        self.view_func = views.PersonsView.as_view()
+        self.middleware(RequestFactory().get("/"))
+        self.assertTrue(self.used_reports_database)
+        # Only while handling the request.
+        self.assertFalse(routers._use_reports_database.get())
+
+    def test_post(self):
+        self.view_func = views.PersonsView.as_view()
+        self.middleware(RequestFactory().post("/"))
+        self.assertFalse(self.used_reports_database)
+
+    def test_other_view(self):
+        self.view_func = views.BookingView.as_view()
+        self.middleware(RequestFactory().get("/"))
+        self.assertFalse(self.used_reports_database)
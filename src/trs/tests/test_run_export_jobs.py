@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pytest
+from django.test import override_settings
+
+from trs import models, views
+from trs.management.commands import run_export_jobs
+from trs.management.commands.update_weeks import ensure_year_weeks_are_present
+from trs.tests import factories
+
+
+@pytest.mark.django_db
+class TestRunExportJobs(unittest.TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        self.command = run_export_jobs.Command()
+        self.export_dir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(TRS_EXPORT_DIR=self.export_dir.name)
+        self.settings.enable()
+        self.user = factories.UserFactory.create()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.export_dir.cleanup()
+
+    def test_handle(self):
+        job = models.ExportJob.enqueue(
+            "/overviews/wbso_projects/excel/", "wbso.xlsx", self.user
+        )
+        self.command.handle(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.ExportJob.DONE)
+        self.assertIsNotNone(job.duration)
+        with open(job.file_path, "rb") as excel_file:
+            self.assertEqual(excel_file.read(2), b"PK")
+
+    def test_session(self):
+        job = models.ExportJob.enqueue(
+            "/overviews/wbso_projects/excel/", "wbso.xlsx", self.user, True
+        )
+        with mock.patch.object(
+            run_export_jobs.views, "export_view", wraps=views.export_view
+        ) as export_view:
+            self.command.handle(once=True)
+        export_view.assert_called_once_with(
+            job.path, self.user, {"admin_override_active": True}
+        )
+
+    def test_failure(self):
+        job = models.ExportJob.enqueue("/does/not/exist/", "nope.xlsx", self.user)
+        self.command.handle(once=True)
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.ExportJob.FAILED)
+        self.assertTrue(job.error)
+        self.assertFalse(os.listdir(self.export_dir.name))
+
+    def test_claimed_once(self):
+        job = models.ExportJob.enqueue(
+            "/overviews/wbso_projects/excel/", "wbso.xlsx", self.user
+        )
+        self.assertTrue(job.claim())
+        self.assertFalse(models.ExportJob.objects.get().claim())
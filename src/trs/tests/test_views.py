@@ -1,11 +1,12 @@
 import datetime
+import tracemalloc
 from unittest import mock
 
 from django.contrib.auth.models import AnonymousUser
 from django.test import TestCase
 from django.test.client import RequestFactory
 
-from trs import views
+from trs import models, views
 from trs.management.commands.update_weeks import ensure_year_weeks_are_present
 from trs.tests import factories
 
@@ -86,6 +87,19 @@ class ProjectViewTestCase(TestCase):
         view = views.ProjectView(kwargs={"pk": self.project.pk})
         self.assertEqual(view.project, self.project)
 
+    def test_lines_without_start(self):
+        ensure_year_weeks_are_present()
+        project = factories.ProjectFactory.create(start=None)
+        person = factories.PersonFactory.create()
+        factories.PersonChangeFactory.create(
+            person=person,
+            standard_hourly_tariff=90,
+            year_week=models.this_year_week(),
+        )
+        factories.WorkAssignmentFactory(assigned_to=person, assigned_on=project)
+        view = views.ProjectView(kwargs={"pk": project.pk})
+        self.assertEqual(view.lines[0]["desired_hourly_tariff"], 90)
+
 
 class BookingViewTestCase(TestCase):
     def test_active_year_week_explicit(self):
@@ -189,6 +203,151 @@ class FinancialExcelViewTestCase(TestCase):
         self.assertTrue(list(view.excel_lines))
 
 
+class CombinedFinancialExcelViewTestCase(TestCase):
+    def test_smoke(self):
+        ensure_year_weeks_are_present()
+        factories.GroupFactory.create()
+        factories.ProjectFactory.create(contract_amount=1000)
+        request = RequestFactory().get("/")
+        view = views.CombinedFinancialExcelView(request=request, kwargs={})
+        self.assertTrue(list(view.excel_lines))
+
+
+class LargeExcelView(views.ExcelResponseMixin):
+    title = "Large export"
+    header_line = [f"Column {column}" for column in range(20)]
+
+    @property
+    def excel_lines(self):
+        for row in range(2000):
+            yield [f"cell {row} {column}" for column in range(10)] + list(range(10))
+
+
+class ExcelResponseMixinTestCase(TestCase):
+    def test_streamed(self):
+        response = LargeExcelView().render_to_response({})
+        self.assertTrue(response.streaming)
+        self.assertIn("large_export.xlsx", response["Content-Disposition"])
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"PK"))
+
+    def test_constant_memory(self):
+        # 40000 cells would take some 7MB when the workbook is kept in
+        # memory.
+        tracemalloc.start()
+        try:
+            response = LargeExcelView().render_to_response({})
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        response.close()
+        self.assertLess(peak, 2 * 1024 * 1024)
+
+
+class WbsoExcelViewTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        self.wbso_project = models.WbsoProject.objects.create(
+            number=1,
+            title="Slim",
+            start_date=datetime.date(2016, 1, 1),
+            end_date=datetime.date(2030, 1, 1),
+        )
+        self.project = factories.ProjectFactory.create(
+            wbso_project=self.wbso_project, wbso_percentage=50
+        )
+        self.person = factories.PersonFactory.create(name="Faramir")
+        for first_day, hours in [
+            (datetime.date(2016, 2, 1), 10),
+            (datetime.date(2016, 3, 7), 6),
+            (datetime.date(2016, 9, 5), 4),
+        ]:
+            factories.BookingFactory.create(
+                booked_by=self.person,
+                booked_on=self.project,
+                hours=hours,
+                year_week=models.YearWeek.objects.get(first_day=first_day),
+            )
+
+    def test_excel_lines(self):
+        view = views.WbsoExcelView(request=RequestFactory().get("/"), kwargs={})
+        line = list(view.excel_lines)[0]
+        # Two half years of 2016, 50% of the hours.
+        self.assertEqual(line[:3], ["Faramir", 8, 2])
+        self.assertEqual(len(line), 1 + len(view.half_years))
+
+
+class ExportJobTestCase(TestCase):
+    def setUp(self):
+        ensure_year_weeks_are_present()
+        self.user = factories.UserFactory.create()
+        self.user.person.is_management = True
+        self.user.person.save()
+        self.request = RequestFactory().get("/overviews/combined_financial_excel/")
+        self.request.user = self.user
+        self.request.session = {}
+
+    def test_enqueued(self):
+        view = views.CombinedFinancialExcelView(request=self.request, kwargs={})
+        response = view.render_to_response({})
+        job = models.ExportJob.objects.get()
+        self.assertEqual(response.url, job.get_absolute_url())
+        self.assertEqual(job.path, "/overviews/combined_financial_excel/")
+        self.assertEqual(job.requested_by, self.user)
+        self.assertEqual(job.status, models.ExportJob.QUEUED)
+
+    def test_deduplicated(self):
+        view = views.CombinedFinancialExcelView(request=self.request, kwargs={})
+        view.render_to_response({})
+        view.render_to_response({})
+        self.assertEqual(models.ExportJob.objects.count(), 1)
+        # Once it is done, a new request means a new job.
+        models.ExportJob.objects.update(status=models.ExportJob.DONE)
+        view.render_to_response({})
+        self.assertEqual(models.ExportJob.objects.count(), 2)
+
+    def test_per_user(self):
+        view = views.CombinedFinancialExcelView(request=self.request, kwargs={})
+        view.render_to_response({})
+        self.request.user = factories.UserFactory.create()
+        view = views.CombinedFinancialExcelView(request=self.request, kwargs={})
+        view.render_to_response({})
+        self.assertEqual(models.ExportJob.objects.count(), 2)
+
+    def test_admin_override(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.user.person.is_management = False
+        self.user.person.save()
+        self.request = RequestFactory().get("/projects/excel/")
+        self.request.user = self.user
+        # Switched on earlier with "?all".
+        self.request.session = {"admin_override_active": True}
+        view = views.ProjectsExcelView(request=self.request, kwargs={})
+        view.render_to_response({})
+        job = models.ExportJob.objects.get()
+        self.assertTrue(job.admin_override)
+        # The worker's view sees everything, like the requesting one.
+        worker_view = views.export_view(job.path, job.requested_by, job.session)
+        self.assertTrue(worker_view.can_view_elaborate_version)
+        without_override = views.export_view(job.path, job.requested_by)
+        self.assertFalse(without_override.can_view_elaborate_version)
+
+    def test_permissions(self):
+        job = models.ExportJob.enqueue(
+            "/overviews/combined_financial_excel/", "export.xlsx", self.user
+        )
+        view = views.ExportJobView(request=self.request, kwargs={"pk": job.pk})
+        self.assertTrue(view.has_form_permissions())
+        self.request.user = factories.UserFactory.create()
+        view = views.ExportJobView(request=self.request, kwargs={"pk": job.pk})
+        self.assertFalse(view.has_form_permissions())
+
+    def test_export_view(self):
+        view = views.export_view("/projects/excel/?status=all", self.user)
+        self.assertIsInstance(view, views.ProjectsExcelView)
+        self.assertEqual(view.request.GET["status"], "all")
+
+
 class SearchViewTestCase(TestCase):
     def setUp(self):
         self.project1 = factories.ProjectFactory.create(code="Bring wood")
@@ -161,6 +161,12 @@ urlpatterns = [
         views.CombinedFinancialExcelView.as_view(),
         name="trs.combined_financial.excel",
     ),
+    path("exports/<int:pk>/", views.ExportJobView.as_view(), name="trs.export_job"),
+    path(
+        "exports/<int:pk>/download/",
+        views.ExportJobDownloadView.as_view(),
+        name="trs.export_job.download",
+    ),
     # Overviews
     path("overviews/", views.OverviewsView.as_view(), name="trs.overviews"),
     path(
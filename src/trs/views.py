@@ -1,7 +1,9 @@
 import calendar
 import datetime
+import itertools
 import logging
 import statistics
+import tempfile
 import urllib.parse
 from collections import OrderedDict, defaultdict
 from copy import deepcopy
@@ -14,25 +16,34 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import PermissionDenied
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db import models
 from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseRedirect,
+    QueryDict,
+)
 from django.shortcuts import redirect
-from django.urls import reverse
+from django.urls import resolve, reverse
 from django.utils.decorators import method_decorator
 from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.views.generic.base import TemplateView
 from django.views.generic.edit import CreateView, FormView, UpdateView
 
-from trs import core
+from trs import caching, core, export_cache
 from trs.forms import ProjectTeamForm, SearchForm, ThemeSelectionForm
 from trs.models import (
     MPC,
     Booking,
+    BookingRollup,
     BudgetItem,
+    ExportJob,
     Group,
     Invoice,
     Payable,
@@ -43,7 +54,10 @@ from trs.models import (
     WbsoProject,
     WorkAssignment,
     YearWeek,
+    data_version,
+    save_bookings,
     this_year_week,
+    year_week_calendar,
 )
 from trs.templatetags.trs_formatting import hours as format_as_hours
 
@@ -360,6 +374,7 @@ class BaseView(LoginAndPermissionsRequiredMixin, TemplateView, BaseMixin):
 
 class PersonsView(BaseView):
     title = "Medewerkers"
+    reports_database = True
     normally_visible_filters = ["status", "group", "year"]
 
     @cached_property
@@ -369,10 +384,7 @@ class PersonsView(BaseView):
     @cached_property
     def available_years(self):
         years_booked_in = list(
-            Booking.objects.filter()
-            .values("year_week__year")
-            .distinct()
-            .values_list("year_week__year", flat=True)
+            BookingRollup.objects.values_list("year", flat=True).distinct()
         )
         current_year = this_year_week().year
         if current_year not in years_booked_in:
@@ -450,10 +462,9 @@ class PersonsView(BaseView):
 
     @cached_property
     def lines(self):
-        return [
-            {"person": person, "pyc": core.get_pyc(person, year=self.selected_year)}
-            for person in self.persons
-        ]
+        caching.prefetch(self.persons, "as_widget")
+        pycs = core.bulk_pyc(self.persons, year=self.selected_year)
+        return [{"person": person, "pyc": pycs[person.id]} for person in self.persons]
 
     @cached_property
     def total_turnover(self):
@@ -565,15 +576,17 @@ class PersonView(BaseView):
         }
         # Hours worked query.
         booked_per_project = (
-            Booking.objects.filter(booked_by=self.person, booked_on__in=self.projects)
+            BookingRollup.objects.filter(
+                booked_by=self.person, booked_on__in=self.projects
+            )
             .values("booked_on")
             .annotate(models.Sum("hours"))
         )
         booked_this_year_per_project = (
-            Booking.objects.filter(
+            BookingRollup.objects.filter(
                 booked_by=self.person,
                 booked_on__in=self.projects,
-                year_week__year=this_year_week().year,
+                year=this_year_week().year,
             )
             .values("booked_on")
             .annotate(models.Sum("hours"))
@@ -656,10 +669,9 @@ class PersonKPIView(PersonView):
     @cached_property
     def available_years(self):
         years_person_booked_in = list(
-            Booking.objects.filter(booked_by=self.sidebar_person)
-            .values("year_week__year")
+            BookingRollup.objects.filter(booked_by=self.sidebar_person)
+            .values_list("year", flat=True)
             .distinct()
-            .values_list("year_week__year", flat=True)
         )
         current_year = this_year_week().year
         if current_year not in years_person_booked_in:
@@ -685,10 +697,9 @@ class BookingOverview(PersonView):
     @cached_property
     def available_years(self):
         years_i_booked_in = list(
-            Booking.objects.filter(booked_by=self.person)
-            .values("year_week__year")
+            BookingRollup.objects.filter(booked_by=self.person)
+            .values_list("year", flat=True)
             .distinct()
-            .values_list("year_week__year", flat=True)
         )
         current_year = this_year_week().year
         if current_year not in years_i_booked_in:
@@ -699,12 +710,12 @@ class BookingOverview(PersonView):
     @cached_property
     def lines(self):
         booked_this_year_per_week = (
-            Booking.objects.filter(booked_by=self.person, year_week__year=self.year)
-            .values("year_week__week")
+            BookingRollup.objects.filter(booked_by=self.person, year=self.year)
+            .values("week")
             .annotate(models.Sum("hours"))
         )
         booked_per_week = {
-            item["year_week__week"]: (item["hours__sum"] or 0)
+            item["week"]: (item["hours__sum"] or 0)
             for item in booked_this_year_per_week
         }
         start_hours_amount = (
@@ -724,7 +735,8 @@ class BookingOverview(PersonView):
         }
         result = []
         to_book = start_hours_amount
-        for year_week in YearWeek.objects.filter(year=self.year):
+        current_year_week = this_year_week()
+        for year_week in year_week_calendar().for_year(self.year):
             to_book += changes_per_week.get(year_week.week, 0)
             to_book_this_week = to_book - year_week.num_days_missing * 8
             # num_days_missing is only relevant for the first and last week of
@@ -736,8 +748,8 @@ class BookingOverview(PersonView):
                 klass = "danger"
                 hint = f"Te boeken: {(to_book_this_week)}"
             if (
-                year_week.year == this_year_week().year
-                and year_week.week >= this_year_week().week
+                year_week.year == current_year_week.year
+                and year_week.week >= current_year_week.week
             ):
                 # Don't complain about this or future weeks.
                 klass = ""
@@ -764,10 +776,9 @@ class FreeOverview(PersonView):
     @cached_property
     def available_years(self):
         years_i_booked_in = list(
-            Booking.objects.filter(booked_by=self.person)
-            .values("year_week__year")
+            BookingRollup.objects.filter(booked_by=self.person)
+            .values_list("year", flat=True)
             .distinct()
-            .values_list("year_week__year", flat=True)
         )
         current_year = this_year_week().year
         if current_year not in years_i_booked_in:
@@ -787,34 +798,35 @@ class FreeOverview(PersonView):
 
     @cached_property
     def free_projects(self):
-        my_bookings = self.person.bookings.filter(year_week__year=self.year)
-        return Project.objects.filter(
-            bookings__in=my_bookings, id__in=self.free_project_ids
-        ).distinct()
+        booked_on_this_year = BookingRollup.objects.filter(
+            booked_by=self.person, year=self.year
+        ).values("booked_on")
+        return Project.objects.filter(id__in=self.free_project_ids).filter(
+            id__in=booked_on_this_year
+        )
 
     @cached_property
     def lines(self):
         booked_this_year_per_week_per_project = (
-            Booking.objects.filter(
+            BookingRollup.objects.filter(
                 booked_by=self.person,
-                year_week__year=self.year,
+                year=self.year,
                 booked_on__in=self.free_projects,
             )
-            .values("year_week__week", "booked_on")
+            .values("week", "booked_on")
             .annotate(models.Sum("hours"))
         )
         weeks = {}
         empty_week = {}
         for project in self.free_projects:
             empty_week[project.id] = 0
-        for year_week in YearWeek.objects.filter(year=self.year):
+        year_weeks = year_week_calendar().for_year(self.year)
+        for year_week in year_weeks:
             weeks[year_week.week] = deepcopy(empty_week)
         for booking in booked_this_year_per_week_per_project:
-            weeks[booking["year_week__week"]][booking["booked_on"]] = booking[
-                "hours__sum"
-            ]
+            weeks[booking["week"]][booking["booked_on"]] = booking["hours__sum"]
         result = []
-        for year_week in YearWeek.objects.filter(year=self.year):
+        for year_week in year_weeks:
             hours = [
                 weeks[year_week.week][project.id] for project in self.free_projects
             ]
@@ -824,9 +836,9 @@ class FreeOverview(PersonView):
 
     def totals(self):
         booked_this_year_per_project = (
-            Booking.objects.filter(
+            BookingRollup.objects.filter(
                 booked_by=self.person,
-                year_week__year=self.year,
+                year=self.year,
                 booked_on__in=self.free_projects,
             )
             .values("booked_on")
@@ -1054,7 +1066,9 @@ class ProjectsView(BaseView):
 
     def all_projects(self):
         q_objects = [filter["q"] for filter in self.prepared_filters]
-        result = Project.objects.filter(*q_objects)
+        result = Project.objects.filter(*q_objects).select_related(
+            "group", "mpc", "start", "end", "project_leader", "project_manager"
+        )
         if not self.can_view_elaborate_version:
             result = result.filter(hidden=False)
         return result
@@ -1094,6 +1108,7 @@ class ProjectsView(BaseView):
             for item in invoices_per_project
         }
 
+        caching.prefetch(self.projects, "work_calculation", "as_widget")
         for project in self.projects:
             line = {}
             line["project"] = project
@@ -1304,13 +1319,32 @@ class ProjectView(BaseView):
         }
         # Hours worked query.
         booked_per_person = (
-            Booking.objects.filter(booked_by__in=self.persons, booked_on=self.project)
+            BookingRollup.objects.filter(
+                booked_by__in=self.persons, booked_on=self.project
+            )
             .values("booked_by")
             .annotate(models.Sum("hours"))
         )
         booked = {
             item["booked_by"]: (item["hours__sum"] or 0) for item in booked_per_person
         }
+        # Standard hourly tariffs at the start of the project and now, like
+        # person.standard_hourly_tariff() but for everyone in one query.
+        now = this_year_week()
+        # Without a start, standard_hourly_tariff() uses this week, too.
+        start = self.project.start or now
+        standard_hourly_tariffs = {
+            item["person"]: (item["at_start"] or 0, item["now"] or 0)
+            for item in PersonChange.objects.filter(person__in=self.persons)
+            .values("person")
+            .annotate(
+                at_start=models.Sum(
+                    "standard_hourly_tariff", filter=Q(year_week__lte=start)
+                ),
+                now=models.Sum("standard_hourly_tariff", filter=Q(year_week__lte=now)),
+            )
+            .order_by()
+        }
 
         for person in self.persons:
             line = {"person": person}
@@ -1327,8 +1361,7 @@ class ProjectView(BaseView):
             line["left_to_turn_over"] = line["left_to_book"] * tariff
             line["planned_turnover"] = line["budget"] * tariff
             line["desired_hourly_tariff"] = min(
-                person.standard_hourly_tariff(year_week=self.project.start),
-                person.standard_hourly_tariff(),
+                standard_hourly_tariffs.get(person.id, (0, 0))
             )
             result.append(line)
         return result
@@ -1582,6 +1615,7 @@ class BookingView(LoginAndPermissionsRequiredMixin, FormView, BaseMixin):
                 field_name = self._field_name(project, date)
                 mapping[field_name] = [project, date]
 
+        changed = {}
         for field_name, new_hours in form.cleaned_data.items():
             project, date = mapping[field_name]
             old_hours = self.initial[field_name]
@@ -1589,14 +1623,8 @@ class BookingView(LoginAndPermissionsRequiredMixin, FormView, BaseMixin):
             total_difference += difference
             absolute_difference += abs(difference)
             if difference:
-                booking, _ = Booking.objects.get_or_create(
-                    booked_by=self.person,
-                    booked_on=project,
-                    year_week=self.active_year_week,
-                    date=date,
-                )
-                booking.hours = new_hours
-                booking.save()
+                changed[(project, date)] = new_hours
+        save_bookings(self.person, self.active_year_week, changed)
 
         if absolute_difference:
             if total_difference < 0:
@@ -2106,7 +2134,6 @@ class InvoiceDeleteView(DeleteView):
 
     def form_valid(self, form):
         self.invoice.delete()
-        self.project.save()  # Increment cache key.
         messages.success(
             self.request,
             f"{self.invoice.number} verwijderd uit {self.project.code}",
@@ -2135,7 +2162,6 @@ class PayableDeleteView(DeleteView):
 
     def form_valid(self, form):
         self.payable.delete()
-        self.project.save()  # Increment cache key.
         messages.success(
             self.request,
             f"{self.payable.number} verwijderd uit {self.project.code}",
@@ -2326,7 +2352,7 @@ class ProjectBudgetEditView(BaseView):
         """Mark fields as disabled and add some extra info."""
         budgets, hourly_tariffs = self.budgets_and_tariffs
         booked_per_person = (
-            Booking.objects.filter(booked_on=self.project)
+            BookingRollup.objects.filter(booked_on=self.project)
             .values("booked_by")
             .annotate(models.Sum("hours"))
         )
@@ -2414,7 +2440,7 @@ class PersonChangeView(LoginAndPermissionsRequiredMixin, CreateView, BaseMixin):
         if "year_week" not in self.request.GET:
             # Return the current week, unless we're at the start of the year.
             if this_year_week().week < 5:
-                return YearWeek.objects.filter(year=this_year_week().year).first()
+                return year_week_calendar().for_year(this_year_week().year)[0]
             else:
                 return this_year_week()
         year, week = self.request.GET["year_week"].split("-")
@@ -2426,12 +2452,12 @@ class PersonChangeView(LoginAndPermissionsRequiredMixin, CreateView, BaseMixin):
         return [
             # (yyyy-ww, title)
             (
-                YearWeek.objects.filter(year=current_year).first().as_param(),
+                year_week_calendar().for_year(current_year)[0].as_param(),
                 f"Begin {current_year} (begin dit jaar)",
             ),
             (this_year_week().as_param(), "Nu"),
             (
-                YearWeek.objects.filter(year=next_year).first().as_param(),
+                year_week_calendar().for_year(next_year)[0].as_param(),
                 f"Begin {next_year} (begin volgend jaar)",
             ),
         ]
@@ -2598,6 +2624,7 @@ class InvoicesView(BaseView):
 
 class InvoicesPerMonthOverview(BaseView):
     template_name = "trs/invoices-per-month.html"
+    reports_database = True
 
     def has_form_permissions(self):
         return self.can_see_everything
@@ -2757,7 +2784,9 @@ class PayablesView(BaseView):
     def payables(self):
         q_objects = [filter["q"] for filter in self.prepared_filters]
         result = Payable.objects.filter(*q_objects)
-        return result.select_related("project").order_by("-date", "-number")
+        return result.select_related(
+            "project", "project__group", "project__mpc"
+        ).order_by("-date", "-number")
 
     @cached_property
     def total(self):
@@ -2781,10 +2810,35 @@ def _django_model_instance_to_string(worksheet, row, col, instance, format=None)
     return worksheet.write_string(row, col, str(instance), format)
 
 
+def _add_worksheet(workbook, name=None):
+    worksheet = workbook.add_worksheet(name)
+    worksheet.add_write_handler(Group, _django_model_instance_to_string)
+    worksheet.add_write_handler(MPC, _django_model_instance_to_string)
+    worksheet.add_write_handler(Person, _django_model_instance_to_string)
+    worksheet.add_write_handler(Project, _django_model_instance_to_string)
+    worksheet.add_write_handler(YearWeek, _django_model_instance_to_string)
+    return worksheet
+
+
+def _write_lines(worksheet, prepend_lines, header_line, lines):
+    # Strictly row by row, which is what constant_memory mode needs.
+    all_lines = itertools.chain(prepend_lines, [header_line], lines)
+    for row_number, line in enumerate(all_lines):
+        # Note: line should be a list of values.
+        worksheet.write_row(row_number, 0, line)
+
+
 class ExcelResponseMixin:
     prepend_lines = []
     header_line = []
     excel_lines = []
+    # Heavy exports are generated by the ``run_export_jobs`` worker instead
+    # of inside the request.
+    background_export = False
+    # Keep the generated file around while the data stays the same.
+    cache_export = False
+    # Only reading, so no need to wait for the write lock, see trs.routers.
+    reports_database = True
 
     def title_to_filename(self):
         name = self.title.lower()
@@ -2802,38 +2856,117 @@ class ExcelResponseMixin:
     def excel_filename(self):
         return self.title_to_filename()
 
-    def render_to_response(self, context, **response_kwargs):
-        """Return a excel response instead of a rendered template."""
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"  # noqa
-        )
-        filename = self.excel_filename + ".xlsx"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-
-        workbook = xlsxwriter.Workbook(response)
-        worksheet = workbook.add_worksheet()
-        worksheet.add_write_handler(Group, _django_model_instance_to_string)
-        worksheet.add_write_handler(MPC, _django_model_instance_to_string)
-        worksheet.add_write_handler(Person, _django_model_instance_to_string)
-        worksheet.add_write_handler(Project, _django_model_instance_to_string)
-        worksheet.add_write_handler(YearWeek, _django_model_instance_to_string)
-
-        row_number = 0
-        for line in self.prepend_lines:
-            worksheet.write_row(row_number, 0, line)
-            row_number += 1  # yeah, right...
-        worksheet.write_row(row_number, 0, self.header_line)
-        row_number += 1
-        for line in self.excel_lines:
-            # Note: line should be a list of values.
-            worksheet.write_row(row_number, 0, line)
-            row_number += 1
+    def write_workbook(self, workbook):
+        worksheet = _add_worksheet(workbook)
+        _write_lines(worksheet, self.prepend_lines, self.header_line, self.excel_lines)
 
+    def write_excel_file(self, excel_file):
+        # The workbook is written row by row (xlsxwriter's constant_memory
+        # mode) instead of being kept in memory as a whole.
+        workbook = xlsxwriter.Workbook(excel_file, {"constant_memory": True})
+        self.write_workbook(workbook)
         workbook.close()
-        return response
+
+    @cached_property
+    def export_cache_key(self):
+        # Note: determined before generating, so data that changes while we
+        # generate the file doesn't end up in the cache under a newer key.
+        return export_cache.key(self.request.path, self.request.GET, data_version())
+
+    def store_in_export_cache(self, excel_file):
+        if self.cache_export:
+            excel_file.seek(0)
+            export_cache.store(self.export_cache_key, excel_file)
+
+    def excel_file_response(self, excel_file):
+        return FileResponse(
+            excel_file,
+            as_attachment=True,
+            filename=self.excel_filename + ".xlsx",
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # noqa
+        )
+
+    def render_to_response(self, context, **response_kwargs):
+        """Return a excel response instead of a rendered template.
+
+        The excel file is streamed back from a temporary file, which is
+        removed afterwards. Cached exports are streamed from the export cache
+        if possible. Background exports redirect to the job's status page
+        otherwise.
+
+        """
+        if self.cache_export:
+            cached_file = export_cache.get(self.export_cache_key)
+            if cached_file:
+                return self.excel_file_response(cached_file)
+        if self.background_export:
+            job = ExportJob.enqueue(
+                self.request.get_full_path(),
+                self.excel_filename + ".xlsx",
+                self.request.user,
+                admin_override=bool(self.admin_override_active),
+            )
+            return HttpResponseRedirect(job.get_absolute_url())
+        excel_file = tempfile.TemporaryFile()
+        self.write_excel_file(excel_file)
+        self.store_in_export_cache(excel_file)
+        excel_file.seek(0)
+        return self.excel_file_response(excel_file)
+
+
+def export_view(path, user, session=None):
+    """Return the view for the (export) path, as if requested by the user.
+
+    Used by the ``run_export_jobs`` worker to generate the excel file and by
+    the job's pages to check whether we're allowed to see it.
+
+    """
+    url = urllib.parse.urlsplit(path)
+    match = resolve(url.path)
+    request = HttpRequest()
+    request.method = "GET"
+    request.path = request.path_info = url.path
+    request.GET = QueryDict(url.query)
+    request.META["QUERY_STRING"] = url.query
+    request.user = user or AnonymousUser()
+    request.session = {} if session is None else session
+    view = match.func.view_class(**match.func.view_initkwargs)
+    view.setup(request, *match.args, **match.kwargs)
+    return view
+
+
+class ExportJobView(BaseView):
+    template_name = "trs/export_job.html"
+
+    @cached_property
+    def job(self):
+        return ExportJob.objects.get(pk=self.kwargs["pk"])
+
+    @property
+    def title(self):
+        return "Export " + self.job.filename
+
+    def has_form_permissions(self):
+        # Whoever may request the export may also see and download it.
+        view = export_view(self.job.path, self.request.user, self.request.session)
+        return view.has_form_permissions()
+
+
+class ExportJobDownloadView(ExportJobView):
+    def get(self, request, *args, **kwargs):
+        if self.job.status != ExportJob.DONE:
+            return HttpResponseRedirect(self.job.get_absolute_url())
+        return FileResponse(
+            open(self.job.file_path, "rb"),
+            as_attachment=True,
+            filename=self.job.filename,
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # noqa
+        )
 
 
 class ProjectsExcelView(ExcelResponseMixin, ProjectsView):
+    background_export = True
+
     def has_form_permissions(self):
         return self.can_view_elaborate_version
 
@@ -3040,7 +3173,7 @@ class ProjectExcelView(ExcelResponseMixin, ProjectView):
     @cached_property
     def bookings_per_week_per_person(self):
         bookings = (
-            Booking.objects.filter(booked_on=self.project)
+            BookingRollup.objects.filter(booked_on=self.project)
             .values("booked_by", "year_week")
             .annotate(models.Sum("hours"))
         )
@@ -3095,6 +3228,7 @@ class ProjectExcelView(ExcelResponseMixin, ProjectView):
         return result
 
     def excel_lines(self, kind):
+        caching.prefetch(self.persons, "to_book")
         for line in self.lines:
             person = line["person"]
             pl = (person == self.project.project_leader) and "PL" or ""
@@ -3166,39 +3300,20 @@ class ProjectExcelView(ExcelResponseMixin, ProjectView):
 
         yield (["Nog te verdelen", "", "", "", "", "", self.project.left_to_dish_out()])
 
-    def render_to_response(self, context, **response_kwargs):
-        """Return a excel response instead of a rendered template."""
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"  # noqa
-        )
-        filename = self.excel_filename + ".xlsx"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-
-        workbook = xlsxwriter.Workbook(response)
-
+    def write_workbook(self, workbook):
         for kind in [self.DAY, self.WEEK, self.MONTH]:
-            worksheet = workbook.add_worksheet(kind)
-            worksheet.add_write_handler(Group, _django_model_instance_to_string)
-            worksheet.add_write_handler(MPC, _django_model_instance_to_string)
-            worksheet.add_write_handler(Person, _django_model_instance_to_string)
-            worksheet.add_write_handler(Project, _django_model_instance_to_string)
-
-            row_number = 0
-            for line in self.prepend_lines():
-                worksheet.write_row(row_number, 0, line)
-                row_number += 1  # yeah, right...
-            worksheet.write_row(row_number, 0, self.header_line(kind))
-            row_number += 1
-            for line in self.excel_lines(kind):
-                # Note: line should be a list of values.
-                worksheet.write_row(row_number, 0, line)
-                row_number += 1
-
-        workbook.close()
-        return response
+            worksheet = _add_worksheet(workbook, kind)
+            _write_lines(
+                worksheet,
+                self.prepend_lines(),
+                self.header_line(kind),
+                self.excel_lines(kind),
+            )
 
 
 class ProjectPersonsExcelView(ExcelResponseMixin, ProjectView):
+    background_export = True
+
     def has_form_permissions(self):
         return self.can_see_everything
 
@@ -3216,7 +3331,7 @@ class ProjectPersonsExcelView(ExcelResponseMixin, ProjectView):
     @cached_property
     def bookings_per_week_per_person_per_project(self):
         bookings = (
-            Booking.objects.filter(year_week__in=self.weeks)
+            BookingRollup.objects.filter(year_week__in=self.weeks)
             .values("booked_by", "booked_on", "year_week")
             .annotate(models.Sum("hours"))
         )
@@ -3265,7 +3380,11 @@ class ProjectPersonsExcelView(ExcelResponseMixin, ProjectView):
                 year_week,
             ) in self.bookings_per_week_per_person_per_project.keys()
         ]
-        relevant_projects = Project.objects.filter(id__in=set(relevant_project_ids))
+        relevant_projects = list(
+            Project.objects.filter(id__in=set(relevant_project_ids)).select_related(
+                "project_leader", "start", "end"
+            )
+        )
         for person in relevant_persons:
             yield [""]
             yield [""]
@@ -3430,6 +3549,8 @@ class WbsoProjectView(BaseView):
 
 class WbsoExcelView(ExcelResponseMixin, WbsoProjectsOverview):
     START_YEAR = 2016
+    background_export = True
+    cache_export = True
 
     @cached_property
     def half_years(self):
@@ -3437,16 +3558,20 @@ class WbsoExcelView(ExcelResponseMixin, WbsoProjectsOverview):
 
         Also return year_week objects."""
         result = []
+        calendar = year_week_calendar()
         years = range(self.START_YEAR, this_year_week().year + 1)
         for year in years:
-            jan1 = datetime.date(year, 1, 1)
             jul1 = datetime.date(year, 7, 1)
-            first_half = YearWeek.objects.filter(
-                first_day__gte=jan1, first_day__lt=jul1
-            ).values_list("id", flat=True)
-            second_half = YearWeek.objects.filter(
-                first_day__gte=jul1, year=year
-            ).values_list("id", flat=True)
+            first_half = {
+                year_week.id
+                for year_week in calendar.for_year(year)
+                if year_week.first_day < jul1
+            }
+            second_half = {
+                year_week.id
+                for year_week in calendar.for_year(year)
+                if year_week.first_day >= jul1
+            }
             result.append([f"eerste helft {year}", first_half])
             result.append([f"tweede helft {year}", second_half])
         return result
@@ -3468,7 +3593,7 @@ class WbsoExcelView(ExcelResponseMixin, WbsoProjectsOverview):
     @cached_property
     def bookings_per_week_per_person_per_wbso_project(self):
         return (
-            Booking.objects.filter(
+            BookingRollup.objects.filter(
                 booked_on__wbso_project__id__gt=0, year_week__in=self.weeks
             )
             .values(
@@ -3520,34 +3645,49 @@ class WbsoExcelView(ExcelResponseMixin, WbsoProjectsOverview):
             result += self.found_wbso_projects
         return result
 
+    @cached_property
+    def half_year_per_year_week(self):
+        """Return {year_week id: index in self.half_years}."""
+        return {
+            year_week: index
+            for index, (text, year_weeks) in enumerate(self.half_years)
+            for year_week in year_weeks
+        }
+
+    @cached_property
+    def wbso_hours(self):
+        """Return {(person, half year index, wbso project): hours}.
+
+        Filled in with one pass over the bookings, so that the excel lines
+        are just lookups.
+
+        """
+        result = defaultdict(int)
+        for item in self.bookings_per_week_per_person_per_wbso_project:
+            half_year = self.half_year_per_year_week.get(item["year_week"])
+            if half_year is None:
+                continue
+            key = (item["booked_by__name"], half_year, item["booked_on__wbso_project"])
+            result[key] += round(
+                item["hours__sum"] * (item["booked_on__wbso_percentage"] or 0) / 100
+            )
+        return result
+
     @property
     def excel_lines(self):
         for person in self.found_persons:
             line = [person]
-            this_persons_bookings_per_week_per_wbso_project = [
-                item
-                for item in self.bookings_per_week_per_person_per_wbso_project
-                if item["booked_by__name"] == person
-            ]
-
-            for text, year_weeks in self.half_years:
+            for half_year in range(len(self.half_years)):
                 for wbso_project in self.found_wbso_projects:
-                    hours = [
-                        round(
-                            item["hours__sum"]
-                            * (item["booked_on__wbso_percentage"] or 0)
-                            / 100
-                        )
-                        for item in this_persons_bookings_per_week_per_wbso_project
-                        if item["year_week"] in year_weeks
-                        and item["booked_on__wbso_project"] == wbso_project
-                    ]
-                    line.append(sum(hours))
+                    line.append(
+                        self.wbso_hours.get((person, half_year, wbso_project), 0)
+                    )
             yield line
 
 
 class WbsoExcelView2(ExcelResponseMixin, WbsoProjectsOverview):
     YEAR = 2023
+    cache_export = True
 
     @cached_property
     def dates(self):
@@ -3568,8 +3708,8 @@ class WbsoExcelView2(ExcelResponseMixin, WbsoProjectsOverview):
     @cached_property
     def bookings_per_week_per_wbso_project_per_person(self):
         return (
-            Booking.objects.filter(
-                booked_on__wbso_project__id__gt=0, year_week__year=self.YEAR
+            BookingRollup.objects.filter(
+                booked_on__wbso_project__id__gt=0, year=self.YEAR
             )
             .values(
                 "booked_by__name",
@@ -3642,45 +3782,28 @@ class WbsoExcelView2(ExcelResponseMixin, WbsoProjectsOverview):
 
             yield line
 
-    def render_to_response(self, context, **response_kwargs):
-        """Return a excel response instead of a rendered template."""
-        response = HttpResponse(
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"  # noqa
-        )
-        filename = self.excel_filename + ".xlsx"
-        response["Content-Disposition"] = f'attachment; filename="{filename}"'
-
-        workbook = xlsxwriter.Workbook(response)
-
+    def write_workbook(self, workbook):
         for person in self.relevant_persons:
-            worksheet = workbook.add_worksheet(person)
-            worksheet.add_write_handler(Group, _django_model_instance_to_string)
-            worksheet.add_write_handler(MPC, _django_model_instance_to_string)
-            worksheet.add_write_handler(Person, _django_model_instance_to_string)
-            worksheet.add_write_handler(Project, _django_model_instance_to_string)
-
-            row_number = 0
-            for line in self.prepend_lines(person):
-                worksheet.write_row(row_number, 0, line)
-                row_number += 1  # yeah, right...
-            worksheet.write_row(row_number, 0, self.header_line)
-            row_number += 1
-            for line in self.excel_lines(person):
-                # Note: line should be a list of values.
-                worksheet.write_row(row_number, 0, line)
-                row_number += 1
-
-        workbook.close()
-        return response
+            worksheet = _add_worksheet(workbook, person)
+            _write_lines(
+                worksheet,
+                self.prepend_lines(person),
+                self.header_line,
+                self.excel_lines(person),
+            )
 
 
 class FinancialOverview(BaseView):
     template_name = "trs/financial_overview.html"
     title = "Overzicht financiën (als excel)"
+    reports_database = True
 
     def has_form_permissions(self):
         return self.can_see_everything
 
+    def export_cache_stats(self):
+        return export_cache.stats()
+
     def download_links(self):
         yield {"name": "Gehele bedrijf", "url": reverse("trs.financial.excel")}
         yield {
@@ -3700,6 +3823,8 @@ class FinancialOverview(BaseView):
 
 
 class FinancialExcelView(ExcelResponseMixin, ProjectsView):
+    cache_export = True
+
     @property
     def title(self):
         return "Overzicht financien " + self.for_who
@@ -3751,14 +3876,14 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
         """Return info extracted one year's bookings"""
         # First grab the persons that booked in the year.
         relevant_person_ids = (
-            Booking.objects.filter(year_week__year=year)
+            BookingRollup.objects.filter(year=year)
             .values_list("booked_by", flat=True)
             .distinct()
         )
         relevant_persons = Person.objects.filter(id__in=relevant_person_ids)
         if self.group:
             relevant_persons = relevant_persons.filter(group=self.group)
-        pycs = [core.get_pyc(person=person, year=year) for person in relevant_persons]
+        pycs = core.bulk_pyc(relevant_persons, year=year).values()
         return {
             "turnover": sum([pyc.turnover for pyc in pycs]),
             "left_to_book_external": sum([pyc.left_to_book_external for pyc in pycs]),
@@ -3778,14 +3903,13 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
         """Return info extracted from previous year's bookings"""
         return self._info_from_bookings(self.year - 1)
 
+    @cached_property
+    def cube(self):
+        return core.FinancialCube([self.year - 2, self.year - 1, self.year])
+
     @property
     def reservations_total(self):
-        return round(
-            self.projects.filter(archived=False).aggregate(models.Sum("reservation"))[
-                "reservation__sum"
-            ]
-            or 0
-        )
+        return self.cube.project_sum("reservation", group=self.group, mpc=self.mpc)
 
     def invoice_table(self):
         """For this year and two years hence, return invoiced amount per month
@@ -3797,44 +3921,24 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
 
         """
         years = [self.year - 2, self.year - 1, self.year]
-        months = [i + 1 for i in range(12)]
-        invoices = Invoice.objects.all()
-        if self.group:
-            invoices = invoices.filter(project__group=self.group)
-        if self.mpc:
-            invoices = invoices.filter(project__mpc=self.mpc)
-        # For both defaultdicts, the first key is year, the second the month.
-        invoiced_per_year_month = defaultdict(dict)
-        cumulative_per_year_month = defaultdict(dict)
-        for year in years:
-            cumulative = 0
-            for month in months:
-                invoiced = (
-                    invoices.filter(date__year=year, date__month=month).aggregate(
-                        models.Sum("amount_exclusive")
-                    )["amount_exclusive__sum"]
-                    or 0
-                )
-                cumulative += invoiced
-                invoiced_per_year_month[year][month] = invoiced
-                cumulative_per_year_month[year][month] = cumulative
+        table = self.cube.per_year_month("invoiced", group=self.group, mpc=self.mpc)
 
         yield ["", "", self.year - 2, "", self.year - 1, "", self.year]
         for month, month_name in enumerate(MONTHS, start=1):
             row = ["", month_name]
             for year in years:
-                row.append(invoiced_per_year_month[year][month])
-                row.append(cumulative_per_year_month[year][month])
+                row.append(table["per_year_month"][year][month])
+                row.append(table["cumulative_per_year_month"][year][month])
             yield row
 
         totals = ["", "Totaal"]
         for year in years:
-            totals.append(cumulative_per_year_month[year][12])
+            totals.append(table["totals"][year])
             totals.append("")
         yield totals
 
         # A bit hacky to set it here...
-        self.total_invoiced_this_year = cumulative_per_year_month[self.year][12]
+        self.total_invoiced_this_year = table["totals"][self.year]
 
     def confirmed_amount_table(self):
         """Return contract amounts for confirmed projects per year/month.
@@ -3844,46 +3948,29 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
 
         """
         years = [self.year - 2, self.year - 1, self.year]
-        months = [i + 1 for i in range(12)]
-        # For both defaultdicts, the first key is year, the second the month.
-        confirmed_amount_per_year_month = defaultdict(dict)
-        cumulative_per_year_month = defaultdict(dict)
-        for year in years:
-            cumulative = 0
-            for month in months:
-                confirmed_amount = (
-                    self.projects.filter(
-                        confirmation_date__year=year, confirmation_date__month=month
-                    ).aggregate(models.Sum("contract_amount"))["contract_amount__sum"]
-                    or 0
-                )
-                cumulative += confirmed_amount
-                confirmed_amount_per_year_month[year][month] = confirmed_amount
-                cumulative_per_year_month[year][month] = cumulative
+        table = self.cube.per_year_month("confirmed", group=self.group, mpc=self.mpc)
 
         yield ["", "", self.year - 2, "", self.year - 1, "", self.year]
         for month, month_name in enumerate(MONTHS, start=1):
             row = ["", month_name]
             for year in years:
-                row.append(confirmed_amount_per_year_month[year][month])
-                row.append(cumulative_per_year_month[year][month])
+                row.append(table["per_year_month"][year][month])
+                row.append(table["cumulative_per_year_month"][year][month])
             yield row
 
         totals = ["", "Totaal"]
         for year in years:
-            totals.append(cumulative_per_year_month[year][12])
+            totals.append(table["totals"][year])
             totals.append("")
         yield totals
 
     @property
     def total_payables(self):
         """Return sum of payables ('kosten derden') with a date of this year"""
-        return (
-            Payable.objects.filter(
-                project__in=self.projects, date__year=self.year
-            ).aggregate(models.Sum("amount"))["amount__sum"]
-            or 0
+        table = self.cube.per_year_month(
+            "payables", group=self.group, mpc=self.mpc, external_only=True
         )
+        return table["totals"][self.year]
 
     @cached_property
     def target(self):
@@ -3900,37 +3987,12 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
     @cached_property
     def project_counts(self):
         """Return counts like 'new in 2016' for projects"""
-        result = {}
-        active_projects = self.projects.filter(archived=False)
-        result["active"] = active_projects.count()
-
-        confirmed_projects = active_projects.exclude(confirmation_date__isnull=True)
-        result["with_confirmation"] = confirmed_projects.count()
-
-        ended_projects = active_projects.filter(end__lt=this_year_week())
-        result["ended"] = ended_projects.count()
-
-        offered_projects = active_projects.filter(
-            confirmation_date__isnull=True
-        ).exclude(bid_send_date__isnull=False)
-        result["offered"] = offered_projects.count()
-
-        to_estimate_projects = active_projects.filter(
-            confirmation_date__isnull=True
-        ).exclude(bid_send_date__isnull=True)
-        result["to_estimate"] = to_estimate_projects.count()
-
-        unconfirmed_projects = active_projects.filter(confirmation_date__isnull=True)
-        booked_without_confirmation = Booking.objects.filter(
-            booked_on__in=unconfirmed_projects
-        ).aggregate(models.Sum("hours"))["hours__sum"]
-        result["booked_without_confirmation"] = booked_without_confirmation
-        # Offerte-uren zonder opdracht
-        return result
+        return self.cube.project_counts(group=self.group, mpc=self.mpc)
 
     def fte(self):
         """Return number of FTEs"""
         persons = self.persons.filter(archived=False).prefetch_related("person_changes")
+        caching.prefetch(persons, "hours_per_week")
         total_hours_per_week = sum([person.hours_per_week() for person in persons])
         return round(total_hours_per_week / 40.0, 1)
 
@@ -3942,10 +4004,10 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
         if not sickness_projects:
             return "Geen project met naam 'Ziekte' gevonden"
 
-        sick_hours = Booking.objects.filter(
+        sick_hours = BookingRollup.objects.filter(
             booked_by__in=self.persons,
             booked_on__in=sickness_projects,
-            year_week__year=self.year,
+            year=self.year,
         ).aggregate(models.Sum("hours"))["hours__sum"]
 
         if not sick_hours:
@@ -3953,7 +4015,8 @@ class FinancialExcelView(ExcelResponseMixin, ProjectsView):
         return round(sick_hours / 8)
 
     def days_to_book(self):
-        persons = self.persons.filter(archived=False).prefetch_related("bookings")
+        persons = self.persons.filter(archived=False)
+        caching.prefetch(persons, "to_book")
         hours_to_book = sum([person.to_book()["hours"] for person in persons])
         return round(hours_to_book / 8)
 
@@ -4066,6 +4129,8 @@ class PayablesExcelView(ExcelResponseMixin, PayablesView):
 
 class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
     title = "Gecombineerd overzicht financien"
+    background_export = True
+    cache_export = True
 
     def has_form_permissions(self):
         return self.can_see_everything
@@ -4087,20 +4152,11 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
     def group_names_incl_total(self):
         return [TOTAL_COMPANY] + [group.name for group in self.groups]
 
-    def _info_from_bookings(self, year=None, group=None):
-        """Return info extracted one year's bookings"""
-        if year is None:
-            year = self.year
-        # First grab the persons that booked in the year.
-        relevant_person_ids = (
-            Booking.objects.filter(year_week__year=year)
-            .values_list("booked_by", flat=True)
-            .distinct()
-        )
-        relevant_persons = Person.objects.filter(id__in=relevant_person_ids)
-        if group:
-            relevant_persons = relevant_persons.filter(group=group)
-        pycs = [core.get_pyc(person=person, year=year) for person in relevant_persons]
+    @cached_property
+    def cube(self):
+        return core.FinancialCube([self.year - 2, self.year - 1, self.year])
+
+    def _info_from_pycs(self, pycs):
         return {
             "turnover": sum([pyc.turnover for pyc in pycs]),
             "left_to_book_external": sum([pyc.left_to_book_external for pyc in pycs]),
@@ -4110,52 +4166,36 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
             "loss": sum([pyc.loss for pyc in pycs]),
         }
 
-    def reservations_total(self, group=None):
-        relevant_projects = self.external_projects.filter(archived=False)
-        if group:
-            relevant_projects = relevant_projects.filter(group=group)
-        return round(
-            relevant_projects.aggregate(models.Sum("reservation"))["reservation__sum"]
-            or 0
+    def _info_from_bookings(self, year=None):
+        """Return info extracted one year's bookings, per group name"""
+        if year is None:
+            year = self.year
+        # First grab the persons that booked in the year.
+        relevant_person_ids = (
+            BookingRollup.objects.filter(year=year)
+            .values_list("booked_by", flat=True)
+            .distinct()
         )
+        relevant_persons = Person.objects.filter(id__in=relevant_person_ids)
+        pycs = list(core.bulk_pyc(relevant_persons, year=year).values())
+        result = {TOTAL_COMPANY: self._info_from_pycs(pycs)}
+        for group in self.groups:
+            result[group.name] = self._info_from_pycs(
+                [pyc for pyc in pycs if pyc.person.group_id == group.id]
+            )
+        return result
+
+    def reservations_total(self, group=None):
+        return self.cube.project_sum("reservation", group=group)
 
     def costs_total(self, group=None):
-        # Note: combination of budget_item and budget_transfer.
-        relevant_projects = self.external_projects.filter(archived=False)
-        if group:
-            relevant_projects = relevant_projects.filter(group=group)
-        costs = round(
-            relevant_projects.aggregate(models.Sum("budget_items__amount"))[
-                "budget_items__amount__sum"
-            ]
-            or 0
-        )
-        income = round(
-            relevant_projects.aggregate(models.Sum("budget_transfers__amount"))[
-                "budget_transfers__amount__sum"
-            ]
-            or 0
-        )
-        return costs - income
+        return self.cube.costs_total(group=group)
 
     def software_development_total(self, group=None):
-        relevant_projects = self.external_projects.filter(archived=False)
-        if group:
-            relevant_projects = relevant_projects.filter(group=group)
-        return round(
-            relevant_projects.aggregate(models.Sum("software_development"))[
-                "software_development__sum"
-            ]
-            or 0
-        )
+        return self.cube.project_sum("software_development", group=group)
 
     def profit_total(self, group=None):
-        relevant_projects = self.external_projects.filter(archived=False)
-        if group:
-            relevant_projects = relevant_projects.filter(group=group)
-        return round(
-            relevant_projects.aggregate(models.Sum("profit"))["profit__sum"] or 0
-        )
+        return self.cube.project_sum("profit", group=group)
 
     def _invoice_table(self, group=None):
         """For this year and two years hence, return invoiced amount per month
@@ -4163,39 +4203,8 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
         Per month, we need 6 values, 2 per year: the invoiced amount in that
         month plus the cumulative amount in that year till that month.
 
-        Warning: as a side-effect, we set ``self.total_invoiced_this_year``.
-
         """
-        years = [self.year - 2, self.year - 1, self.year]
-        months = [i + 1 for i in range(12)]
-        invoices = Invoice.objects.all()
-        if group:
-            invoices = invoices.filter(project__group=group)
-        # For both defaultdicts, the first key is year, the second the month.
-        invoiced_per_year_month = defaultdict(dict)
-        cumulative_per_year_month = defaultdict(dict)
-        for year in years:
-            cumulative = 0
-            for month in months:
-                invoiced = (
-                    invoices.filter(date__year=year, date__month=month).aggregate(
-                        models.Sum("amount_exclusive")
-                    )["amount_exclusive__sum"]
-                    or 0
-                )
-                cumulative += invoiced
-                invoiced_per_year_month[year][month] = invoiced
-                cumulative_per_year_month[year][month] = cumulative
-
-        totals = {}
-        for year in years:
-            totals[year] = cumulative_per_year_month[year][12]
-
-        return {
-            "invoiced_per_year_month": invoiced_per_year_month,
-            "cumulative_per_year_month": cumulative_per_year_month,
-            "totals": totals,
-        }
+        return self.cube.per_year_month("invoiced", group=group)
 
     def _confirmed_amount_table(self, group=None):
         """Return contract amounts for confirmed projects per year/month.
@@ -4204,42 +4213,11 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
         month plus the cumulative amount in that year till that month.
 
         """
-        years = [self.year - 2, self.year - 1, self.year]
-        months = [i + 1 for i in range(12)]
-        # For both defaultdicts, the first key is year, the second the month.
-        confirmed_amount_per_year_month = defaultdict(dict)
-        cumulative_per_year_month = defaultdict(dict)
-        projects = self.external_projects
-        if group:
-            projects = projects.filter(group=group)
-        for year in years:
-            cumulative = 0
-            for month in months:
-                confirmed_amount = (
-                    projects.filter(
-                        confirmation_date__year=year, confirmation_date__month=month
-                    ).aggregate(models.Sum("contract_amount"))["contract_amount__sum"]
-                    or 0
-                )
-                cumulative += confirmed_amount
-                confirmed_amount_per_year_month[year][month] = confirmed_amount
-                cumulative_per_year_month[year][month] = cumulative
-
-        totals = {}
-        for year in years:
-            totals[year] = cumulative_per_year_month[year][12]
-        return {
-            "confirmed_amount_per_year_month": confirmed_amount_per_year_month,
-            "cumulative_per_year_month": cumulative_per_year_month,
-            "totals": totals,
-        }
+        return self.cube.per_year_month("confirmed", group=group)
 
     def total_payables_this_year(self, group=None):
         """Return sum of payables ('kosten derden') with a date of this year"""
-        payables = Payable.objects.filter(date__year=self.year)
-        if group:
-            payables = payables.filter(project__group=group)
-        return payables.aggregate(models.Sum("amount"))["amount__sum"] or 0
+        return self.cube.per_year_month("payables", group=group)["totals"][self.year]
 
     def target(self, group=None):
         if group:
@@ -4251,73 +4229,53 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
 
     def _project_counts(self, group=None):
         """Return counts like 'new in 2016' for projects"""
-        result = {}
-        projects = self.external_projects
-        if group:
-            projects = projects.filter(group=group)
-        active_projects = projects.filter(archived=False)
-        result["active"] = active_projects.count()
-
-        confirmed_projects = active_projects.exclude(confirmation_date__isnull=True)
-        result["with_confirmation"] = confirmed_projects.count()
-
-        ended_projects = active_projects.filter(end__lt=this_year_week())
-        result["ended"] = ended_projects.count()
-
-        offered_projects = active_projects.filter(
-            confirmation_date__isnull=True
-        ).exclude(bid_send_date__isnull=False)
-        result["offered"] = offered_projects.count()
-
-        to_estimate_projects = active_projects.filter(
-            confirmation_date__isnull=True
-        ).exclude(bid_send_date__isnull=True)
-        result["to_estimate"] = to_estimate_projects.count()
-
-        unconfirmed_projects = active_projects.filter(confirmation_date__isnull=True)
-        booked_without_confirmation = (
-            Booking.objects.filter(booked_on__in=unconfirmed_projects).aggregate(
-                models.Sum("hours")
-            )["hours__sum"]
-            or 0
-        )
-        result["booked_without_confirmation"] = booked_without_confirmation
-        # Offerte-uren zonder opdracht
-        return result
+        return self.cube.project_counts(group=group)
 
-    def _person_counts(self, group=None):
-        """Return counts like 'fte' and 'sick days'"""
-        result = {}
-        persons = (
-            Person.objects.filter(archived=False)
-            .prefetch_related("person_changes")
-            .prefetch_related("bookings")
+    def _person_counts(self):
+        """Return counts like 'fte' and 'sick days', per group name"""
+        persons = list(
+            Person.objects.filter(archived=False).prefetch_related("person_changes")
         )
-        if group:
-            persons = persons.filter(group=group)
-        total_hours_per_week = sum([person.hours_per_week() for person in persons])
-        result["fte"] = round(total_hours_per_week / 40.0, 1)
+        caching.prefetch(persons, "hours_per_week", "to_book")
 
+        sick_hours_per_person = {}
         sickness_projects = Project.objects.filter(description="Ziekte").filter(
             archived=False
         )
         if sickness_projects:
             sick_hours = (
-                Booking.objects.filter(
-                    booked_by__in=persons,
+                BookingRollup.objects.filter(
+                    booked_by__archived=False,
                     booked_on__in=sickness_projects,
-                    year_week__year=self.year,
-                ).aggregate(models.Sum("hours"))["hours__sum"]
-                or 0
+                    year=self.year,
+                )
+                .values("booked_by")
+                .annotate(models.Sum("hours"))
             )
-            result["sick_days"] = round(sick_hours / 8)
+            sick_hours_per_person = {
+                item["booked_by"]: item["hours__sum"] for item in sick_hours
+            }
         else:
             logger.warn("Geen project met naam 'Ziekte' gevonden")
-            result["sick_days"] = 0
 
-        result["days_to_book"] = round(
-            sum([person.to_book()["hours"] for person in persons]) / 8
-        )
+        def counts(persons):
+            total_hours_per_week = sum([person.hours_per_week() for person in persons])
+            sick_hours = sum(
+                [sick_hours_per_person.get(person.id, 0) for person in persons]
+            )
+            return {
+                "fte": round(total_hours_per_week / 40.0, 1),
+                "sick_days": round(sick_hours / 8),
+                "days_to_book": round(
+                    sum([person.to_book()["hours"] for person in persons]) / 8
+                ),
+            }
+
+        result = {TOTAL_COMPANY: counts(persons)}
+        for group in self.groups:
+            result[group.name] = counts(
+                [person for person in persons if person.group_id == group.id]
+            )
         return result
 
     @property
@@ -4345,11 +4303,10 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
             line += ["Uren", "Euro", ""]
         yield line
 
-        info_from_previous_bookings = self._info_from_bookings(year=self.year - 1)
-        info_from_bookings = {}
-        info_from_bookings[TOTAL_COMPANY] = self._info_from_bookings()
-        for group in self.groups:
-            info_from_bookings[group.name] = self._info_from_bookings(group=group)
+        info_from_previous_bookings = self._info_from_bookings(year=self.year - 1)[
+            TOTAL_COMPANY
+        ]
+        info_from_bookings = self._info_from_bookings()
 
         for title, key1, key2 in [
             ["Gerealiseerde omzet (uur*tarief)", "booked_external", "turnover"],
@@ -4442,10 +4399,7 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
         targets[TOTAL_COMPANY] = self.target()
         for group in self.groups:
             targets[group.name] = self.target(group=group)
-        person_counts = {}  # ALso used by "4. OVERIG".
-        person_counts[TOTAL_COMPANY] = self._person_counts()
-        for group in self.groups:
-            person_counts[group.name] = self._person_counts(group=group)
+        person_counts = self._person_counts()  # ALso used by "4. OVERIG".
 
         fte = {name: person_counts[name]["fte"] for name in self.group_names_incl_total}
         targets_per_fte = {
@@ -4506,15 +4460,11 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
             line = [
                 "",
                 month_name,
-                invoice_table[TOTAL_COMPANY]["invoiced_per_year_month"][self.year - 2][
-                    month
-                ],
+                invoice_table[TOTAL_COMPANY]["per_year_month"][self.year - 2][month],
                 invoice_table[TOTAL_COMPANY]["cumulative_per_year_month"][
                     self.year - 2
                 ][month],
-                invoice_table[TOTAL_COMPANY]["invoiced_per_year_month"][self.year - 1][
-                    month
-                ],
+                invoice_table[TOTAL_COMPANY]["per_year_month"][self.year - 1][month],
                 invoice_table[TOTAL_COMPANY]["cumulative_per_year_month"][
                     self.year - 1
                 ][month],
@@ -4522,7 +4472,7 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
             for name in self.group_names_incl_total:
                 line += [
                     "",
-                    invoice_table[name]["invoiced_per_year_month"][self.year][month],
+                    invoice_table[name]["per_year_month"][self.year][month],
                     invoice_table[name]["cumulative_per_year_month"][self.year][month],
                 ]
             yield line
@@ -4590,15 +4540,15 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
             line = [
                 "",
                 month_name,
-                confirmed_amount_table[TOTAL_COMPANY][
-                    "confirmed_amount_per_year_month"
-                ][self.year - 2][month],
+                confirmed_amount_table[TOTAL_COMPANY]["per_year_month"][self.year - 2][
+                    month
+                ],
                 confirmed_amount_table[TOTAL_COMPANY]["cumulative_per_year_month"][
                     self.year - 2
                 ][month],
-                confirmed_amount_table[TOTAL_COMPANY][
-                    "confirmed_amount_per_year_month"
-                ][self.year - 1][month],
+                confirmed_amount_table[TOTAL_COMPANY]["per_year_month"][self.year - 1][
+                    month
+                ],
                 confirmed_amount_table[TOTAL_COMPANY]["cumulative_per_year_month"][
                     self.year - 1
                 ][month],
@@ -4606,9 +4556,7 @@ class CombinedFinancialExcelView(ExcelResponseMixin, ProjectsView):
             for name in self.group_names_incl_total:
                 line += [
                     "",
-                    confirmed_amount_table[name]["confirmed_amount_per_year_month"][
-                        self.year
-                    ][month],
+                    confirmed_amount_table[name]["per_year_month"][self.year][month],
                     confirmed_amount_table[name]["cumulative_per_year_month"][
                         self.year
                     ][month],